@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Benchmark bulk request ingestion on a large synthetic JSONL stream.
+
+Rows:
+  json.load + jsonschema.validate  what validate_request.py does per file:
+                                   parse to dicts, then validate (the schema
+                                   validator is rebuilt on every call)
+  json.loads + compiled validator  the same with the validator built once
+  TypeAdapter.validate_json        pydantic-core parses and validates the raw
+                                   bytes of each line (process_request.py --bulk)
+  ... + model_dump                 plus the dict handed to the scheduler
+  TypeAdapter[list] (one array)    the whole stream as one JSON array
+
+Every row must accept and reject the same requests.
+"""
+
+import io
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+import jsonschema
+from jsonschema.validators import validator_for
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from bench_lyrics import make_lrc, make_structure
+from models import REQUEST_ADAPTER, REQUEST_LIST_ADAPTER
+from pydantic import ValidationError
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schemas" / "request.json"
+
+
+def make_requests(count: int, lines: int, invalid_every: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    requests = []
+    for i in range(count):
+        request = {
+            "request_id": f"req_bench_{i}",
+            "genre": "indie rock, driving beat",
+            "duration": rng.randrange(60, 300),
+            "priority": rng.choice(["preview", "high", "normal", "bulk"]),
+        }
+        if i % 2:
+            request["structure"] = make_structure(lines)
+        else:
+            request["lyrics"] = make_lrc(min(lines, 120))[:5000]
+        if invalid_every and i % invalid_every == invalid_every - 1:
+            request["duration"] = 5
+        requests.append(request)
+    return requests
+
+
+def legacy(lines: list, schema_text: str) -> int:
+    valid = 0
+    for line in lines:
+        schema = json.load(io.StringIO(schema_text))
+        try:
+            jsonschema.validate(json.loads(line), schema)
+            valid += 1
+        except jsonschema.ValidationError:
+            pass
+    return valid
+
+
+def compiled(lines: list, schema_text: str) -> int:
+    schema = json.loads(schema_text)
+    validator = validator_for(schema)(schema)
+    return sum(validator.is_valid(json.loads(line)) for line in lines)
+
+
+def adapter(lines: list, dump: bool = False) -> int:
+    valid = 0
+    for line in lines:
+        try:
+            request = REQUEST_ADAPTER.validate_json(line)
+        except ValidationError:
+            continue
+        if dump:
+            request.model_dump(mode="json", exclude_unset=True)
+        valid += 1
+    return valid
+
+
+def adapter_array(array: bytes) -> int:
+    return len(REQUEST_LIST_ADAPTER.validate_json(array))
+
+
+def bench(fn, *args, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=32, help="Lyric lines per request")
+    parser.add_argument("--invalid-every", type=int, default=50, help="Make every Nth request invalid (0: none)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    requests = make_requests(args.requests, args.lines, args.invalid_every)
+    lines = [json.dumps(request).encode() for request in requests]
+    size_mb = sum(map(len, lines)) / 1e6
+    schema_text = SCHEMA_PATH.read_text()
+    print(f"{len(lines)} requests, {size_mb:.1f} MB of JSONL")
+
+    # The legacy path is run once: rebuilding the validator per call makes it slow
+    rows = [
+        ("json.load + jsonschema.validate", legacy, (lines, schema_text), 1),
+        ("json.loads + compiled validator", compiled, (lines, schema_text), args.repeat),
+        ("TypeAdapter.validate_json", adapter, (lines,), args.repeat),
+        ("... + model_dump", adapter, (lines, True), args.repeat),
+    ]
+    baseline = None
+    accepted = set()
+    print(f"{'path':34} {'seconds':>8} {'req/s':>9} {'MB/s':>7} {'speedup':>8}")
+    for name, fn, fn_args, repeat in rows:
+        seconds, valid = bench(fn, *fn_args, repeat=repeat)
+        baseline = baseline or seconds
+        accepted.add(valid)
+        print(f"{name:34} {seconds:8.3f} {len(lines) / seconds:9.0f} {size_mb / seconds:7.1f} {baseline / seconds:7.1f}x")
+
+    valid_lines = [line for line, request in zip(lines, requests) if request["duration"] >= 30]
+    array = b"[" + b",".join(valid_lines) + b"]"
+    seconds, _ = bench(adapter_array, array, repeat=args.repeat)
+    print(f"{'TypeAdapter[list] (one array)':34} {seconds:8.3f} {len(valid_lines) / seconds:9.0f} "
+          f"{len(array) / 1e6 / seconds:7.1f}      (valid requests only)")
+
+    if len(accepted) != 1:
+        print(f"Paths disagree on the number of valid requests: {sorted(accepted)}")
+        sys.exit(1)
+    print(f"All paths accepted {accepted.pop()} of {len(lines)} requests")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Benchmark the lyrics parser on large synthetic LRC and structure inputs.
+
+The "legacy" column re-runs the per-stage parsing that lived in
+modal_app.py, create_video.py and test_lrc.py before src/lyrics_parser.py
+replaced it: three separate regex/split passes over the same text.
+"""
+
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from lyrics_parser import parse_lyrics, parse_structure, to_ass, to_lrc, to_srt, to_yue, validate
+
+SECTIONS = ["Verse", "Chorus", "Verse", "Bridge", "Chorus", "Outro"]
+
+
+def make_lrc(n_lines: int, lines_per_section: int = 8) -> str:
+    out = []
+    ms = 0
+    for i in range(n_lines):
+        if i % lines_per_section == 0:
+            if out:
+                out.append("")
+            out.append(f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}] {SECTIONS[i // lines_per_section % len(SECTIONS)]}")
+            ms += 1000
+        out.append(f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}] line {i} of the benchmark song")
+        ms += 3500
+    return "\n".join(out)
+
+
+def make_structure(n_lines: int, lines_per_section: int = 8) -> list:
+    structure = []
+    for start in range(0, n_lines, lines_per_section):
+        seconds = start * 4
+        structure.append({
+            "type": SECTIONS[start // lines_per_section % len(SECTIONS)].lower(),
+            "start": f"{seconds // 60:02d}:{seconds % 60:02d}.00",
+            "lines": [f"line {i} of the benchmark song" for i in range(start, min(start + lines_per_section, n_lines))],
+        })
+    return structure
+
+
+def legacy_pipeline(lrc: str) -> None:
+    # modal_app.process_lyrics
+    clean = re.sub(r"\[\d{2}:\d{2}\.\d{2}\]", "", lrc)
+    clean = re.sub(r"(Verse|Chorus|Intro|Outro|Bridge)", r"[\1]", clean, flags=re.IGNORECASE).lower().strip()
+    # test_lrc.validate_lrc_format
+    errors = []
+    for i, line in enumerate(lrc.split("\n"), 1):
+        line = line.strip()
+        if line and not re.match(r"\[(\d{2}):(\d{2}\.\d{2})\]", line):
+            errors.append(i)
+    # create_video.lrc_to_srt
+    lines = lrc.strip().split("\n")
+    srt = []
+    for i, line in enumerate(lines):
+        if not line.strip() or not line.startswith("["):
+            continue
+        end = line.index("]")
+        minutes, rest = line[1:end].split(":")
+        seconds, centis = rest.split(".")
+        text = line[end + 1:].strip()
+        if text:
+            srt.append(f"00:{minutes}:{seconds},{centis.ljust(3, '0')} {text}")
+
+
+def current_pipeline(lrc: str) -> None:
+    timeline = parse_lyrics(lrc)
+    to_yue(timeline)
+    validate(timeline)
+    to_srt(timeline)
+
+
+def bench(fn, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case; the best is reported")
+    args = parser.parse_args()
+
+    print(f"{'lines':>7} {'case':<24} {'ms':>9} {'lines/s':>11}")
+    for n in args.lines:
+        lrc = make_lrc(n)
+        structure = make_structure(n)
+        timeline = parse_lyrics(lrc)
+        cases = [
+            ("legacy (3 passes)", legacy_pipeline, lrc),
+            ("parse+yue+validate+srt", current_pipeline, lrc),
+            ("parse_lyrics", parse_lyrics, lrc),
+            ("parse_structure", parse_structure, structure),
+            ("to_yue", to_yue, timeline),
+            ("to_srt", to_srt, timeline),
+            ("to_ass", to_ass, timeline),
+            ("to_lrc", to_lrc, timeline),
+        ]
+        for name, fn, arg in cases:
+            seconds = bench(fn, arg, args.repeat)
+            print(f"{n:>7} {name:<24} {seconds * 1000:>9.2f} {n / seconds:>11,.0f}")
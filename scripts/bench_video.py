@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Benchmark the still-image video encode against the looped-image command.
+
+Renders the same synthetic song (sine tone, one lyric line every few
+seconds) with ``create_video`` (``-loop 1``, every frame encoded) and
+``create_still_video`` (one frame per subtitle state: in one process, split
+into parallel segments, and from a warm background template cache), reports
+wall and ffmpeg CPU time, and compares frames against the looped-image video
+by PSNR at the middle of every few lyric states. Every video must have the
+looped-image video's frame size.
+
+The background defaults to the shipped images/background.jpg.
+"""
+
+import re
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from create_video import (
+    DEFAULT_BACKGROUND, FRAME_RATE, MAX_FRAME_GAP, STILL_ENCODER, STILL_GOP, auto_segments, create_still_video, create_video,
+    write_subtitles,
+)
+from video_templates import TemplateCache
+from lyrics_parser import parse_lyrics
+
+_PSNR = re.compile(r"average:(\S+)")
+REPO = Path(__file__).resolve().parent.parent
+
+
+def make_lrc(seconds: float, every: float, intro: float = 1.0) -> str:
+    out = []
+    t = intro
+    i = 0
+    while t < seconds - every:
+        ms = round(t * 1000)
+        out.append(f"[{ms // 60000:02d}:{ms // 1000 % 60:02d}.{ms % 1000 // 10:02d}] benchmark line {i} of the song")
+        t += every
+        i += 1
+    return "\n".join(out)
+
+
+def ffmpeg(*args: str):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+
+def timed(fn, *args) -> tuple:
+    """Wall seconds and CPU seconds used by child processes while running ``fn``."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    fn(*args)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+
+def video_size(video: Path) -> str:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height",
+         "-of", "csv=p=0:s=x", str(video)],
+        capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def frame_psnr(a: Path, b: Path, at: float, tmp: Path) -> float:
+    frames = []
+    for video in (a, b):
+        png = tmp / f"{video.stem}_{at:.2f}.png"
+        ffmpeg("-ss", f"{at:.3f}", "-i", str(video), "-frames:v", "1", str(png))
+        frames.append(png)
+    result = subprocess.run(
+        ["ffmpeg", "-i", str(frames[0]), "-i", str(frames[1]), "-lavfi", "psnr", "-f", "null", "-"],
+        capture_output=True, text=True
+    )
+    match = _PSNR.search(result.stderr)
+    value = match.group(1) if match else "0"
+    return float("inf") if value == "inf" else float(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=300, help="Song length")
+    parser.add_argument("--every", type=float, default=3.5, help="Seconds between lyric lines")
+    parser.add_argument("--intro", type=float, default=15, help="Seconds before the first lyric line")
+    parser.add_argument("--image", default=str(REPO / DEFAULT_BACKGROUND),
+                        help="Background image (default: the shipped images/background.jpg)")
+    parser.add_argument("--samples", type=int, default=8, help="Frames compared between the two videos")
+    parser.add_argument("--segments", type=int, help="Parts for the segmented run (default: by length and cores)")
+    parser.add_argument("--keep", help="Directory to keep the rendered videos in")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work = Path(args.keep or tmp_dir)
+        work.mkdir(parents=True, exist_ok=True)
+
+        audio = work / "song.wav"
+        ffmpeg("-f", "lavfi", "-i", f"sine=frequency=440:duration={args.seconds}", "-ar", "44100", "-ac", "2", str(audio))
+        image = Path(args.image)
+
+        timeline = parse_lyrics(make_lrc(args.seconds, args.every, args.intro))
+        srt = work / "song.srt"
+        write_subtitles(timeline, srt)
+
+        loop_video = work / "loop.mp4"
+        still_video = work / "still.mp4"
+        segmented_video = work / "segmented.mp4"
+        templated_video = work / "templated.mp4"
+        segments = args.segments or auto_segments(args.seconds)
+        # Warm template cache: what a render finds after the first one with this background
+        templates = TemplateCache(work / "templates")
+        frame = templates.frame(image)
+        templates.static_chunk(frame, STILL_ENCODER, round(MAX_FRAME_GAP * FRAME_RATE) / FRAME_RATE, STILL_GOP)
+        results = [
+            ("loop (-loop 1)", loop_video, timed(create_video, str(audio), str(image), str(srt), str(loop_video))),
+            ("still (per state)", still_video,
+             timed(create_still_video, str(audio), str(image), str(srt), str(still_video), timeline)),
+            (f"still, {segments} segments", segmented_video,
+             timed(create_still_video, str(audio), str(image), str(srt), str(segmented_video), timeline,
+                   MAX_FRAME_GAP, None, segments)),
+            (f"still, {segments} seg, template", templated_video,
+             timed(create_still_video, str(audio), str(frame), str(srt), str(templated_video), timeline,
+                   MAX_FRAME_GAP, None, segments, templates)),
+        ]
+
+        print(f"\n{len(timeline.timed_lines)} lines, {args.seconds:.0f} s of audio")
+        print(f"{'mode':<28} {'wall s':>8} {'cpu s':>8} {'MB':>7}")
+        for name, video, (wall, cpu) in results:
+            print(f"{name:<28} {wall:>8.2f} {cpu:>8.2f} {video.stat().st_size / 1024 / 1024:>7.2f}")
+        loop_cpu = results[0][2][1]
+        still_cpu = results[1][2][1]
+        print(f"CPU speed-up: {loop_cpu / max(still_cpu, 1e-9):.1f}x")
+        print(f"Wall speed-up of segments over one still encode: "
+              f"{results[1][2][0] / max(results[2][2][0], 1e-9):.1f}x")
+
+        loop_size = video_size(loop_video)
+        mismatched = [(name, video_size(video)) for name, video, _ in results[1:] if video_size(video) != loop_size]
+        for name, size in mismatched:
+            print(f"Frame size of {name} is {size}, the looped-image video is {loop_size}")
+        if mismatched:
+            sys.exit(1)
+
+        lines = timeline.timed_lines
+        picks = lines[::max(1, len(lines) // max(1, args.samples))][:args.samples]
+        for name, video in (("still", still_video), ("segmented", segmented_video), ("templated", templated_video)):
+            scores = [
+                frame_psnr(loop_video, video, (line.start_ms + line.end_ms) / 2000, work)
+                for line in picks
+            ]
+            if scores:
+                print(f"PSNR loop vs {name} over {len(scores)} frames: min {min(scores):.2f} dB")
@@ -2,204 +2,551 @@
 """Create video from audio and background image with lyrics."""
 
 import sys
+import os
 import json
+import math
+import time
+import argparse
+import tempfile
 import subprocess
-import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterable, List, Optional
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from lyrics_parser import Timeline, parse_request, shift, to_srt
+from manifest import StageManifest, input_hash, parse_force_stages
+from prefetch import file_digest
+from video_templates import TemplateCache
 
-def lrc_to_srt(lrc_text: str, output_srt: Path):
+
+def write_subtitles(timeline: Timeline, output_srt: Path):
     """
-    Convert LRC format to SRT format.
+    Write the timed lines of a parsed request as an SRT file.
     
     Args:
-        lrc_text: Lyrics in LRC format
+        timeline: Parsed lyrics (see src/lyrics_parser.py)
         output_srt: Output SRT file path
     """
-    lines = lrc_text.strip().split('\n')
-    srt_lines = []
-    index = 1
-    
-    for i, line in enumerate(lines):
-        if not line.strip() or not line.startswith('['):
-            continue
-        
-        # Parse LRC timestamp [MM:SS.mm]
-        try:
-            timestamp_end = line.index(']')
-            timestamp = line[1:timestamp_end]
-            text = line[timestamp_end + 1:].strip()
-            
-            if not text:
-                continue
-            
-            # Convert to SRT format
-            minutes, seconds = timestamp.split(':')
-            seconds, centiseconds = seconds.split('.')
-            
-            # Start time
-            start_time = f"00:{minutes.zfill(2)}:{seconds.zfill(2)},{centiseconds.ljust(3, '0')}"
-            
-            # End time (next line or +5 seconds)
-            if i + 1 < len(lines):
-                next_line = lines[i + 1]
-                if next_line.startswith('['):
-                    next_timestamp_end = next_line.index(']')
-                    next_timestamp = next_line[1:next_timestamp_end]
-                    next_minutes, next_seconds = next_timestamp.split(':')
-                    next_seconds, next_centiseconds = next_seconds.split('.')
-                    end_time = f"00:{next_minutes.zfill(2)}:{next_seconds.zfill(2)},{next_centiseconds.ljust(3, '0')}"
-                else:
-                    # Default +5 seconds
-                    end_seconds = int(seconds) + 5
-                    end_time = f"00:{minutes.zfill(2)}:{str(end_seconds).zfill(2)},{centiseconds.ljust(3, '0')}"
-            else:
-                # Last line, +5 seconds
-                end_seconds = int(seconds) + 5
-                end_time = f"00:{minutes.zfill(2)}:{str(end_seconds).zfill(2)},{centiseconds.ljust(3, '0')}"
-            
-            # SRT format
-            srt_lines.append(f"{index}")
-            srt_lines.append(f"{start_time} --> {end_time}")
-            srt_lines.append(text)
-            srt_lines.append("")
-            
-            index += 1
-            
-        except (ValueError, IndexError) as e:
-            print(f"⚠️  Skipping invalid line: {line}")
-            continue
-    
-    # Write SRT file
     with open(output_srt, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(srt_lines))
+        f.write(to_srt(timeline))
     
     print(f"✅ Created SRT file: {output_srt}")
 
 
-def create_video(audio_path: str, image_path: str, srt_path: str, output_path: str):
+# High-End Cinematic Subtitle Style (Minimalist & Professional):
+# BorderStyle=1, Thin Outline (0.5), Soft Shadow (0.5), Semi-transparent Outline.
+FORCE_STYLE = (
+    "FontName=Arial,"
+    "FontSize=18,"
+    "PrimaryColour=&H00FFFFFF&,"   # Solid White
+    "OutlineColour=&H66222222&,"   # Semi-transparent dark grey outline
+    "BorderStyle=1,"
+    "Outline=0.5,"
+    "Shadow=0.5,"
+    "ShadowColour=&H88000000&,"
+    "Alignment=2,"
+    "MarginV=60"                    # Balanced lower third
+)
+
+DEFAULT_BACKGROUND = Path("images/background.jpg")
+# Pre-scaled backgrounds and static chunks shared by every render of this process
+TEMPLATES = TemplateCache()
+
+# Frame grid of the still-image encode: the image2 default that
+# `-loop 1` encodes at, so lyric changes land on the same frames.
+FRAME_RATE = 25
+# Longest a still frame is held, so seeking and previews stay responsive
+MAX_FRAME_GAP = 1.0
+# Keyframe interval in (sparse) frames
+STILL_GOP = 60
+# Shortest part worth encoding in a process of its own
+MIN_SEGMENT_SECONDS = 60
+# Shortest lyric-free stretch copied from the template's static chunk
+MIN_STATIC_SECONDS = 4.0
+
+# x264 options of the still-image encode (and of the template static chunks).
+# Profile and level are pinned so the parameter sets x264 writes do not
+# depend on the input's frame rate; stream-copied joins need them to match.
+STILL_ENCODER = [
+    '-fps_mode', 'vfr',
+    '-c:v', 'libx264', '-tune', 'stillimage', '-g', str(STILL_GOP),
+    '-profile:v', 'high', '-level:v', '4.1',
+    '-pix_fmt', 'yuv420p',
+]
+# Stream parameters that must agree for a stream-copy concat of H.264 files
+_JOIN_PARAMS = "codec_name,profile,level,width,height,pix_fmt,refs,has_b_frames"
+
+
+def _run_ffmpeg(cmd: List[str]):
+    print(f"🎬 Creating video with FFmpeg...")
+    print(f"Command: {' '.join(cmd)}")
+    
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    
+    if result.returncode != 0:
+        print(f"❌ FFmpeg error: {result.stderr}")
+        raise RuntimeError(f"FFmpeg failed: {result.stderr}")
+
+
+def _thread_args(threads: Optional[int]) -> List[str]:
+    """Cap ffmpeg's filter and x264 threads (ffmpeg picks one per core by default)."""
+    if not threads:
+        return []
+    return ['-filter_threads', str(threads), '-threads', str(threads)]
+
+
+def create_video(audio_path: str, image_path: str, srt_path: str, output_path: str,
+                 threads: Optional[int] = None):
     """
-    Create video using FFmpeg.
+    Create video using FFmpeg, encoding every frame of the looped image.
     
     Args:
         audio_path: Path to audio file (WAV)
         image_path: Path to background image
         srt_path: Path to SRT subtitles
         output_path: Output video path (MP4)
+        threads: ffmpeg thread budget (None: all cores)
     """
-    # High-End Cinematic Subtitle Style (Minimalist & Professional):
-    # BorderStyle=1, Thin Outline (0.5), Soft Shadow (0.5), Semi-transparent Outline.
-    force_style = (
-        "FontName=Arial,"
-        "FontSize=18,"
-        "PrimaryColour=&H00FFFFFF&,"   # Solid White
-        "OutlineColour=&H66222222&,"   # Semi-transparent dark grey outline
-        "BorderStyle=1,"
-        "Outline=0.5,"
-        "Shadow=0.5,"
-        "ShadowColour=&H88000000&,"
-        "Alignment=2,"
-        "MarginV=60"                    # Balanced lower third
-    )
-    
     cmd = [
         'ffmpeg', '-loop', '1', '-i', image_path,
         '-i', audio_path,
-        '-vf', f"subtitles={srt_path}:force_style='{force_style}'",
+        '-vf', f"subtitles={srt_path}:force_style='{FORCE_STYLE}'",
         '-c:v', 'libx264', '-tune', 'stillimage',
         '-c:a', 'aac', '-b:a', '256k', # Higher audio bitrate for MP4
         '-pix_fmt', 'yuv420p',
         '-sn',  # Kill embedded subs to prevent doubling
+        *_thread_args(threads),
         '-shortest', '-y', output_path
     ]
     
-    print(f"🎬 Creating video with FFmpeg...")
-    print(f"Command: {' '.join(cmd)}")
+    _run_ffmpeg(cmd)
+    print(f"✅ Video created: {output_path}")
+
+
+def audio_duration(audio_path: str) -> float:
+    """Length of an audio file in seconds (ffprobe)."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', audio_path],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(f"ffprobe could not read {audio_path}: {result.stderr.strip()}")
+    return float(result.stdout.strip())
+
+
+def _frame_at(ms: int) -> int:
+    """First grid frame at or after ``ms``."""
+    return -(-ms * FRAME_RATE // 1000)
+
+
+def total_frames(duration: float) -> int:
+    return max(1, math.ceil(duration * FRAME_RATE))
+
+
+def still_frames(timeline: Timeline, duration: float, max_gap: float = MAX_FRAME_GAP) -> List[int]:
+    """
+    Frame numbers (at ``FRAME_RATE``) where the still-image encode emits a frame.
     
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    One frame per subtitle state: at 0 and on the first grid frame at or
+    after every line start and end, plus repeats so no frame is held longer
+    than ``max_gap`` seconds.
+    """
+    total = total_frames(duration)
+    changes = {0, total}
+    for line in timeline.timed_lines:
+        for ms in (line.start_ms, line.end_ms):
+            changes.add(min(total, _frame_at(ms)))
     
+    step = max(1, round(max_gap * FRAME_RATE))
+    points = sorted(changes)
+    frames = []
+    for start, end in zip(points, points[1:]):
+        frames.extend(range(start, end, step))
+    return frames
+
+
+def segment_bounds(timeline: Timeline, duration: float, segments: int) -> List[int]:
+    """
+    Frame numbers ``[0, ..., total]`` cutting the video into about
+    ``segments`` equal parts, each cut on the frame where a lyric line starts.
+    """
+    total = total_frames(duration)
+    starts = sorted({_frame_at(line.start_ms) for line in timeline.timed_lines} - {0})
+    bounds = [0]
+    for k in range(1, segments):
+        candidates = [frame for frame in starts if bounds[-1] < frame < total]
+        if not candidates:
+            break
+        target = total * k / segments
+        bounds.append(min(candidates, key=lambda frame: abs(frame - target)))
+    bounds.append(total)
+    return bounds
+
+
+def auto_segments(duration: float, cpus: Optional[int] = None) -> int:
+    """Segments for one render: one per core, none shorter than ``MIN_SEGMENT_SECONDS``."""
+    cpus = cpus or os.cpu_count() or 1
+    return max(1, min(cpus, int(duration // MIN_SEGMENT_SECONDS)))
+
+
+def _quote(path) -> str:
+    return str(Path(path).resolve()).replace("'", "'\\''")
+
+
+def write_frame_list(image_path: str, frames: List[int], end: int, list_path: Path):
+    """ffconcat list that shows ``image_path`` once per frame until frame ``end``."""
+    image = _quote(image_path)
+    entries = ["ffconcat version 1.0"]
+    for start, stop in zip(frames, frames[1:] + [end]):
+        entries += [f"file '{image}'", f"duration {(stop - start) / FRAME_RATE:.6f}"]
+    # The demuxer only applies the last duration when the entry is followed by another
+    entries.append(f"file '{image}'")
+    list_path.write_text("\n".join(entries) + "\n")
+
+
+def static_spans(timeline: Timeline, duration: float, min_seconds: float = MIN_STATIC_SECONDS) -> List[tuple]:
+    """``(start, end)`` frame ranges of at least ``min_seconds`` with no lyric on screen."""
+    total = total_frames(duration)
+    shown = sorted((_frame_at(line.start_ms), _frame_at(line.end_ms)) for line in timeline.timed_lines)
+    spans = []
+    cursor = 0
+    for start, end in shown + [(total, total)]:
+        start = min(start, total)
+        if start - cursor >= min_seconds * FRAME_RATE:
+            spans.append((cursor, start))
+        cursor = max(cursor, min(end, total))
+    return spans
+
+
+def _still_video_args(srt_path: str, offset: int = 0, threads: Optional[int] = None) -> List[str]:
+    """Subtitle filter and x264 options of the still-image encode."""
+    subtitles = f"subtitles={srt_path}:force_style='{FORCE_STYLE}'"
+    if offset:
+        # Render the segment's frames at their place in the song, then rebase to 0
+        shift = offset / FRAME_RATE
+        subtitles = f"setpts=PTS+{shift:.6f}/TB,{subtitles},setpts=PTS-{shift:.6f}/TB"
+    return ['-vf', subtitles, *STILL_ENCODER, '-sn', *_thread_args(threads)]
+
+
+def _encode_segment(image_path: str, srt_path: str, frames: List[int], start: int, end: int,
+                    output_path: Path, threads: Optional[int]) -> Path:
+    """Encode frames ``[start, end)`` as a silent MP4 whose timestamps start at 0."""
+    list_path = output_path.with_suffix(".ffconcat")
+    write_frame_list(image_path, [frame - start for frame in frames if start <= frame < end], end - start, list_path)
+    _run_ffmpeg([
+        'ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_path),
+        *_still_video_args(srt_path, start, threads),
+        '-an', '-t', f"{(end - start) / FRAME_RATE:.6f}", '-y', str(output_path)
+    ])
+    return output_path
+
+
+def _stream_params(video: Path) -> str:
+    """The H.264 parameters of ``video`` that a stream-copy join depends on (ffprobe)."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', f'stream={_JOIN_PARAMS}',
+         '-of', 'csv=p=0', str(video)],
+        capture_output=True, text=True
+    )
     if result.returncode != 0:
-        print(f"❌ FFmpeg error: {result.stderr}")
-        raise RuntimeError(f"FFmpeg failed: {result.stderr}")
-    
-    print(f"✅ Video created: {output_path}")
+        raise RuntimeError(f"ffprobe could not read {video}: {result.stderr.strip()}")
+    return result.stdout.strip()
 
 
-def get_lyrics_from_data(data: dict) -> str:
-    """Extract or generate LRC lyrics from request data."""
-    lyrics_text = data.get('lyrics', '')
-    structure = data.get('structure', [])
-    
-    if structure:
-        import re
-        lrc_lines = []
-        for section in structure:
-            start_str = section.get("start", "00:00.00")
-            time_match = re.search(r'(\d{2}):(\d{2}\.\d{2})', start_str)
-            if time_match:
-                base_min = int(time_match.group(1))
-                base_sec = float(time_match.group(2))
-                base_total = base_min * 60 + base_sec
-                lines = section.get("lines", [])
-                for i, line in enumerate(lines):
-                    line_total = base_total + (i * 4.0)
-                    m = int(line_total // 60)
-                    s = line_total % 60
-                    lrc_lines.append(f"[{m:02d}:{s:05.2f}] {line}")
-        return "\n".join(lrc_lines)
-    return lyrics_text
+def _static_entries(chunk: Path, frames: int) -> List[str]:
+    """ffconcat entries that stream-copy ``frames`` worth of the static chunk."""
+    entries = []
+    chunk_frames = STILL_GOP * round(MAX_FRAME_GAP * FRAME_RATE)
+    while frames > 0:
+        take = min(frames, chunk_frames) / FRAME_RATE
+        entries += [f"file '{_quote(chunk)}'", f"outpoint {take:.6f}", f"duration {take:.6f}"]
+        frames -= chunk_frames
+    return entries
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python create_video.py <request_json> <audio_file>")
-        sys.exit(1)
+def create_still_video(audio_path: str, image_path: str, srt_path: str, output_path: str,
+                       timeline: Timeline, max_gap: float = MAX_FRAME_GAP, threads: Optional[int] = None,
+                       segments: int = 1, templates: Optional[TemplateCache] = None):
+    """
+    Create video using FFmpeg, encoding one frame per subtitle state.
+    
+    The background is fed through the concat demuxer with one entry per
+    frame from ``still_frames``, so the subtitles filter rasterises each
+    lyric state once and x264 sees a few hundred frames instead of 25 per
+    second. Frames fall on the same 25 fps grid as ``create_video`` and go
+    through the same filter and encoder settings, so the picture matches;
+    the timestamps are kept as-is (variable frame rate) and muxed with the
+    audio.
+    
+    With ``segments`` > 1 the song is cut at lyric line starts into parts
+    that are encoded in parallel (at most ``segments`` ffmpeg processes at
+    a time, sharing ``threads``), joined with a stream-copy concat and
+    muxed with the audio once. Every part starts on a keyframe where the
+    picture changes anyway, so there is no seam.
+    
+    With ``templates``, ``image_path`` should be a template frame (see
+    ``TemplateCache.frame``) and stretches without lyrics longer than
+    ``MIN_STATIC_SECONDS`` are copied from the cached static chunk instead
+    of being encoded. If the chunk's stream parameters differ from the
+    encoded parts' (e.g. a chunk built by another ffmpeg version), those
+    stretches are encoded too.
+    
+    Args:
+        audio_path: Path to audio file
+        image_path: Path to background image
+        srt_path: Path to SRT subtitles (written from ``timeline``)
+        output_path: Output video path (MP4)
+        timeline: Parsed lyrics the SRT was written from
+        max_gap: Longest a frame is held, in seconds
+        threads: ffmpeg thread budget (None: all cores)
+        segments: Parts to encode in parallel
+        templates: Cache of pre-encoded static chunks
+    """
+    duration = audio_duration(audio_path)
+    frames = still_frames(timeline, duration, max_gap)
+    bounds = segment_bounds(timeline, duration, segments)
     
-    request_json = sys.argv[1]
-    audio_file = sys.argv[2]
+    static = static_spans(timeline, duration) if templates else []
+    cuts = sorted(set(bounds) | {frame for span in static for frame in span})
+    parts = [(start, end, any(a <= start and end <= b for a, b in static)) for start, end in zip(cuts, cuts[1:])]
     
-    # Load request
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        if len(parts) == 1:
+            list_path = tmp / "frames.ffconcat"
+            write_frame_list(image_path, frames, bounds[-1], list_path)
+            video_input = ['-f', 'concat', '-safe', '0', '-i', str(list_path)]
+            video_args = _still_video_args(srt_path, threads=threads)
+        else:
+            # At most ``segments`` encodes at once; with one segment the parts
+            # around the static spans are encoded one after another
+            workers = max(1, min(segments, os.cpu_count() or 1))
+            part_threads = thread_budget(workers, threads)
+            
+            def encode(jobs):
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    return dict(zip(
+                        [i for i, _, _ in jobs],
+                        pool.map(
+                            lambda part: _encode_segment(image_path, srt_path, frames, part[1], part[2],
+                                                         tmp / f"segment_{part[0]:03d}.mp4", part_threads),
+                            jobs
+                        )
+                    ))
+            
+            outputs = encode([(i, start, end) for i, (start, end, is_static) in enumerate(parts) if not is_static])
+            
+            chunk = None
+            if len(outputs) < len(parts):
+                chunk = templates.static_chunk(Path(image_path), STILL_ENCODER,
+                                               round(MAX_FRAME_GAP * FRAME_RATE) / FRAME_RATE, STILL_GOP)
+                expected = _stream_params(next(iter(outputs.values()))) if outputs else None
+                if expected and _stream_params(chunk) != expected:
+                    print(f"Static chunk parameters ({_stream_params(chunk)}) differ from the encoded "
+                          f"segments' ({expected}); encoding the static spans instead")
+                    outputs.update(encode([(i, start, end) for i, (start, end, is_static) in enumerate(parts)
+                                           if is_static]))
+            join_path = tmp / "segments.ffconcat"
+            entries = ["ffconcat version 1.0"]
+            for i, (start, end, _) in enumerate(parts):
+                if i in outputs:
+                    entries += [f"file '{_quote(outputs[i])}'", f"duration {(end - start) / FRAME_RATE:.6f}"]
+                else:
+                    entries += _static_entries(chunk, end - start)
+            join_path.write_text("\n".join(entries) + "\n")
+            video_input = ['-f', 'concat', '-safe', '0', '-i', str(join_path)]
+            video_args = ['-c:v', 'copy']
+            print(f"Joining {len(outputs)} encoded and {len(parts) - len(outputs)} static segments")
+        
+        _run_ffmpeg([
+            'ffmpeg', *video_input,
+            '-i', audio_path,
+            '-map', '0:v', '-map', '1:a',
+            *video_args,
+            '-c:a', 'aac', '-b:a', '256k',
+            '-t', f"{duration:.3f}", '-y', output_path
+        ])
+    
+    print(f"Video created: {output_path} ({len(frames)} frames, {len(parts)} segment(s))")
+
+
+def ensure_background(image_path: Path):
+    """Create a 1920x1080 black background for ``--loop`` if ``image_path`` is missing."""
+    if image_path.exists():
+        return
+    print(f"Background image not found: {image_path}")
+    print("Creating default black background...")
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run([
+        'ffmpeg', '-f', 'lavfi', '-i', 'color=c=black:s=1920x1080:d=1',
+        '-frames:v', '1', '-y', str(image_path)
+    ], check=True)
+
+
+def render_request(request_json: str, audio_file: Optional[str] = None, force: Iterable[str] = (),
+                   loop: bool = False, threads: Optional[int] = None, segments: Optional[int] = 1,
+                   image_path: Path = DEFAULT_BACKGROUND, output_dir: Path = Path("output")) -> dict:
+    """
+    Render the lyric video of one request.
+    
+    Without ``audio_file`` the song recorded by process_request.py in the
+    request's stage manifest is used. If postprocess_audio.py trimmed the
+    song's leading silence, the lyrics are shifted to match. Returns
+    ``{"request_id", "status", "video", "seconds"}`` with status ``done``
+    or ``unchanged``; problems with the request raise ValueError. ``segments=None`` picks the number
+    of parallel parts from the song length (see ``auto_segments``).
+    """
+    start = time.perf_counter()
     with open(request_json) as f:
         request_data = json.load(f)
     
-    lyrics = get_lyrics_from_data(request_data)
+    timeline = parse_request(request_data)
     request_id = request_data.get('request_id', 'unknown')
     
-    if not lyrics:
-        print("❌ No lyrics or structure found in request")
-        sys.exit(1)
+    if not timeline.timed_lines:
+        raise ValueError(f"No lyrics or structure found in {request_json}")
     
-    # Paths
-    output_dir = Path("output")
-    output_dir.mkdir(exist_ok=True)
+    manifest = StageManifest(request_id, force=force)
+    if audio_file:
+        audio_file = Path(audio_file)
+    else:
+        generated = manifest.artifacts("generate")
+        if not generated or not generated[0].exists():
+            raise ValueError(f"No generated audio recorded for {request_id}; pass the audio file explicitly")
+        audio_file = generated[0]
+    
+    # Lyrics move with the song when post-processing cut its leading silence
+    post = manifest.entry("postprocess")
+    if post and post.get("lead_trim_ms") and post.get("audio_sha256") == file_digest(audio_file, "sha256"):
+        timeline = shift(timeline, -post["lead_trim_ms"])
     
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True)
     srt_path = output_dir / f"{request_id}.srt"
     video_path = output_dir / f"{request_id}.mp4"
     
-    # Default background image
-    image_path = Path("images/background.jpg")
-    if not image_path.exists():
-        print(f"Background image not found: {image_path}")
-        print("Creating default black background...")
-        # Create black image with FFmpeg
-        subprocess.run([
-            'ffmpeg', '-f', 'lavfi', '-i', 'color=c=black:s=1920x1080:d=1',
-            '-frames:v', '1', '-y', str(image_path)
-        ], check=True)
+    # The looped-image command reads the image itself; the still encode reads
+    # the cached pre-scaled yuv420p frame
+    if loop:
+        ensure_background(image_path)
+        background = image_path
+    else:
+        background = TEMPLATES.frame(image_path)
+    
+    # Same audio, background and subtitles as the last rendered video
+    digest = input_hash(audio_file, background, subtitles=to_srt(timeline))
+    if manifest.done("video", digest):
+        print(f"Video unchanged since last run: {video_path} (use --force-stage video to redo)")
+        return {"request_id": request_id, "status": "unchanged", "video": str(video_path), "seconds": 0.0}
+    
+    # Timed lyric lines to SRT
+    write_subtitles(timeline, srt_path)
+    
+    if loop:
+        create_video(str(audio_file), str(background), str(srt_path), str(video_path), threads=threads)
+    else:
+        if segments is None:
+            segments = auto_segments(audio_duration(str(audio_file)), threads)
+        create_still_video(str(audio_file), str(background), str(srt_path), str(video_path), timeline,
+                           threads=threads, segments=segments, templates=TEMPLATES)
+    manifest.record("video", digest, [video_path, srt_path])
+    
+    return {
+        "request_id": request_id,
+        "status": "done",
+        "video": str(video_path),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def thread_budget(jobs: int, cpus: Optional[int] = None) -> int:
+    """ffmpeg threads per job when ``jobs`` renders share the machine."""
+    cpus = cpus or os.cpu_count() or 1
+    return max(1, cpus // max(1, jobs))
+
+
+def render_batch(pairs: List[tuple], jobs: Optional[int] = None, force: Iterable[str] = (),
+                 loop: bool = False) -> List[dict]:
+    """
+    Render many ``(request_json, audio_file_or_None)`` pairs in a worker pool.
+    
+    ``jobs`` renders run at once (default: one per 2 cores, at most one per
+    pair) and each ffmpeg gets an equal share of the cores, so a batch
+    neither oversubscribes the machine nor leaves cores idle. Failures are
+    reported per request and do not stop the others.
+    """
+    cpus = os.cpu_count() or 1
+    jobs = max(1, min(len(pairs), jobs or max(1, cpus // 2)))
+    threads = thread_budget(jobs, cpus)
+    print(f"Rendering {len(pairs)} video(s): {jobs} at a time, {threads} ffmpeg thread(s) each")
+    
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(render_request, request_json, audio_file, force, loop, threads): request_json
+            for request_json, audio_file in pairs
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"request_id": futures[future], "status": "failed", "error": str(e), "seconds": 0.0}
+            results.append(result)
+            print(f"[{len(results)}/{len(pairs)}] {result['request_id']}: {result['status']} "
+                  f"in {result['seconds']:.1f}s {result.get('error', '')}".rstrip())
+    
+    wall = time.perf_counter() - start
+    busy = sum(r["seconds"] for r in results)
+    failed = sum(1 for r in results if r["status"] == "failed")
+    print(f"\nBatch finished in {wall:.1f}s wall ({busy:.1f}s of renders, "
+          f"{busy / wall if wall else 0:.1f}x parallel), {failed} failed")
+    return results
+
+
+def _pair(value: str) -> tuple:
+    """``request.json`` or ``request.json=audio.wav``."""
+    request_json, _, audio_file = value.partition("=")
+    return request_json, audio_file or None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("inputs", nargs="+",
+                        help="<request_json> [audio_file], or with --batch any number of request.json[=audio_file]")
+    parser.add_argument("--batch", action="store_true", help="Render every request given, in parallel")
+    parser.add_argument("--jobs", type=int, help="Renders at once in --batch mode (default: cores / 2)")
+    parser.add_argument("--threads", type=int, help="ffmpeg threads for a single render (default: all cores)")
+    parser.add_argument("--segments", type=int,
+                        help="Parts of a single render encoded in parallel (default: by song length and cores)")
+    parser.add_argument("--loop", action="store_true",
+                        help="Encode every frame of the looped image (the pre-still-mode command)")
+    parser.add_argument("--force-stage", action="append", default=[], help="Redo a stage (video or all)")
+    args = parser.parse_args()
+    force = parse_force_stages(args.force_stage)
+    
+    if args.batch:
+        results = render_batch([_pair(value) for value in args.inputs], args.jobs, force, args.loop)
+        sys.exit(1 if any(r["status"] == "failed" for r in results) else 0)
+    
+    if len(args.inputs) > 2:
+        parser.error("expected <request_json> [audio_file]; use --batch for several requests")
     
     try:
-        # Convert LRC to SRT
-        lrc_to_srt(lyrics, srt_path)
-        
-        # Create video
-        create_video(str(audio_file), str(image_path), str(srt_path), str(video_path))
-        
-        print(f"\nVideo generation complete!")
-        print(f"Video: {video_path}")
-        print(f"Size: {video_path.stat().st_size / 1024 / 1024:.2f} MB")
-        
+        result = render_request(args.inputs[0], args.inputs[1] if len(args.inputs) == 2 else None,
+                                force, args.loop, args.threads, args.segments)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"Video creation failed: {e}")
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    
+    if result["status"] == "done":
+        video_path = Path(result["video"])
+        print(f"\nVideo generation complete!")
+        print(f"Video: {video_path}")
+        print(f"Size: {video_path.stat().st_size / 1024 / 1024:.2f} MB")
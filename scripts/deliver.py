@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Deliver finished songs and videos to every configured sink at once.
+
+Instead of running send_to_webhook.py, send_to_telegram.py and
+upload_to_gdrive.py one after another, each artifact goes to all sinks
+concurrently, with a concurrency limit per sink, and the outcome of every
+(artifact, sink) pair is written to a JSON report.
+
+With --watch the output directory is polled while the pipeline runs and an
+artifact is delivered as soon as it is final: a "postprocess" or "video"
+manifest entry lists it and was recorded after the file was last written.
+Once the --until file appears (at once without it), everything else left in
+the directory is delivered as well, e.g. songs that were not post-processed.
+
+Sinks are enabled by their environment variables:
+  telegram  TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+  webhook   WEBHOOK_URLS (comma separated)
+  drive     GDRIVE_CLIENT_ID, GDRIVE_CLIENT_SECRET, GDRIVE_REFRESH_TOKEN, GOOGLE_DRIVE_FOLDER_ID
+Each sink still skips files its manifest entries record as delivered.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from delivery import RateLimiter, pooled_session
+from manifest import parse_force_stages
+
+DELIVERABLE = (".wav", ".flac", ".mp3", ".opus", ".mp4")
+# Stages whose recorded artifacts are not rewritten afterwards
+FINAL_STAGES = ("postprocess", "video")
+SINK_LIMITS = {"telegram": 2, "webhook": 4, "drive": 4}
+WEBHOOK_METADATA = {"source": "github_actions", "project": "musicmaker"}
+POLL_INTERVAL = 5.0
+
+
+class Sink:
+    """A delivery target: blocking ``deliver(path) -> bool`` plus a concurrency limit."""
+
+    def __init__(self, name: str, deliver, limit: int):
+        self.name = name
+        self.deliver = deliver
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+
+
+def configured_sinks(names, force=frozenset(), limits=SINK_LIMITS, manifest_dir=Path("output/manifests")) -> list:
+    """Sinks among ``names`` whose environment variables are set."""
+    sinks = []
+
+    token = os.environ.get("TELEGRAM_BOT_TOKEN")
+    chat_id = os.environ.get("TELEGRAM_CHAT_ID")
+    if "telegram" in names and token and chat_id:
+        from send_to_telegram import SEND_INTERVAL, send_to_telegram
+        # One connection pool and one rate limit for every message to the chat
+        session = pooled_session(pool_size=limits["telegram"])
+        limiter = RateLimiter(SEND_INTERVAL)
+        sinks.append(Sink("telegram", lambda path: send_to_telegram(
+            token, chat_id, [path], force, parallel=1, session=session, limiter=limiter,
+        ), limits["telegram"]))
+
+    urls = [url.strip() for url in os.environ.get("WEBHOOK_URLS", "").split(",") if url.strip()]
+    if "webhook" in names and urls:
+        from send_to_webhook import send_to_webhook
+        session = pooled_session(pool_size=limits["webhook"])
+        for i, url in enumerate(urls, 1):
+            # Named by position: webhook URLs often carry a secret
+            sinks.append(Sink("webhook" if len(urls) == 1 else f"webhook{i}", lambda path, url=url: send_to_webhook(
+                url, [path], WEBHOOK_METADATA, force, session,
+            ), limits["webhook"]))
+
+    if "drive" in names and os.environ.get("GDRIVE_REFRESH_TOKEN"):
+        from upload_to_gdrive import DriveUploader, get_credentials
+        try:
+            creds = get_credentials()
+        except Exception as e:
+            print(f"Drive disabled: {e}")
+            creds = None
+        if creds:
+            uploader = DriveUploader(os.environ.get("GOOGLE_DRIVE_FOLDER_ID"), creds, manifest_dir, force)
+
+            def upload(path):
+                uploader.upload(path)
+                return True
+
+            sinks.append(Sink("drive", upload, limits["drive"]))
+    return sinks
+
+
+def final_artifacts(manifest_dir: Path) -> list:
+    """Deliverable files a final stage recorded after they were last written."""
+    ready = []
+    for path in sorted(Path(manifest_dir).glob("*.json")):
+        try:
+            data = json.loads(path.read_text())
+        except ValueError:
+            continue
+        for key, entry in data.get("stages", {}).items():
+            if key.split(":")[0] not in FINAL_STAGES:
+                continue
+            for artifact in map(Path, entry.get("artifacts", [])):
+                if artifact.suffix.lower() not in DELIVERABLE:
+                    continue
+                try:
+                    written = artifact.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if written <= entry.get("finished_at", 0):
+                    ready.append(artifact)
+    return ready
+
+
+async def deliver_one(sink: Sink, path: Path, report: list) -> None:
+    async with sink.semaphore:
+        start = time.perf_counter()
+        error = None
+        try:
+            ok = await asyncio.to_thread(sink.deliver, path)
+        except Exception as e:
+            ok, error = False, f"{e.__class__.__name__}: {e}"
+        seconds = time.perf_counter() - start
+    print(f"[{sink.name}] {'delivered' if ok else 'FAILED'} {path.name} in {seconds:.1f}s")
+    entry = {"artifact": str(path), "sink": sink.name, "ok": bool(ok), "seconds": round(seconds, 2)}
+    if error:
+        entry["error"] = error
+    report.append(entry)
+
+
+async def deliver_all(sinks: list, files=(), watch_dir=None, until=None, interval=POLL_INTERVAL) -> list:
+    """
+    Deliver ``files`` and, with ``watch_dir``, every artifact that becomes
+    final there until ``until`` exists. Returns one report entry per
+    (artifact, sink).
+    """
+    # to_thread's pool must hold every sink's full concurrency
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max(1, sum(sink.limit for sink in sinks)))
+    )
+    report = []
+    tasks = []
+    seen = set()
+
+    def submit(paths):
+        for path in paths:
+            if path.resolve() in seen:
+                continue
+            seen.add(path.resolve())
+            print(f"Delivering {path} to {', '.join(sink.name for sink in sinks)}")
+            tasks.extend(asyncio.create_task(deliver_one(sink, path, report)) for sink in sinks)
+
+    submit([Path(f) for f in files])
+    if watch_dir:
+        watch_dir = Path(watch_dir)
+        while until and not Path(until).exists():
+            submit(final_artifacts(watch_dir / "manifests"))
+            await asyncio.sleep(interval)
+        submit(final_artifacts(watch_dir / "manifests"))
+        submit(sorted(p for p in watch_dir.rglob("*") if p.suffix.lower() in DELIVERABLE and p.is_file()))
+    await asyncio.gather(*tasks)
+    return report
+
+
+def summarize(report: list, wall_seconds: float) -> dict:
+    sinks = {}
+    for entry in report:
+        stats = sinks.setdefault(entry["sink"], {"delivered": 0, "failed": 0, "seconds": 0.0})
+        stats["delivered" if entry["ok"] else "failed"] += 1
+        stats["seconds"] = round(stats["seconds"] + entry["seconds"], 2)
+    for name, stats in sinks.items():
+        print(f"{name}: {stats['delivered']} delivered, {stats['failed']} failed, {stats['seconds']:.1f}s busy")
+    busy = sum(stats["seconds"] for stats in sinks.values())
+    print(f"Wall time {wall_seconds:.1f}s for {busy:.1f}s of deliveries")
+    return {"wall_seconds": round(wall_seconds, 2), "sinks": sinks, "deliveries": report}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Artifacts to deliver right away")
+    parser.add_argument("--watch", type=Path, help="Output directory to deliver final artifacts from")
+    parser.add_argument("--until", type=Path, help="Keep watching until this file exists")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="Seconds between scans")
+    parser.add_argument("--sinks", default=",".join(SINK_LIMITS), help="Comma-separated sinks to use")
+    for name, limit in SINK_LIMITS.items():
+        parser.add_argument(f"--{name}-limit", type=int, default=limit, help=f"Concurrent {name} deliveries")
+    parser.add_argument("--report", type=Path, default=Path("output/delivery_report.json"))
+    parser.add_argument("--force-stage", action="append", default=[], help="Redo a delivery stage (or all)")
+    args = parser.parse_args()
+    if not args.files and not args.watch:
+        parser.error("give files to deliver or --watch")
+    force = parse_force_stages(args.force_stage)
+
+    limits = {name: max(1, getattr(args, f"{name}_limit")) for name in SINK_LIMITS}
+    manifest_dir = (args.watch or Path("output")) / "manifests"
+    sinks = configured_sinks({s.strip() for s in args.sinks.split(",")}, force, limits, manifest_dir)
+    if not sinks:
+        print("No delivery sink is configured")
+        sys.exit(1)
+    print(f"Sinks: {', '.join(f'{sink.name} (x{sink.limit})' for sink in sinks)}")
+
+    start = time.perf_counter()
+    report = asyncio.run(deliver_all(sinks, args.files, args.watch, args.until, args.interval))
+    summary = summarize(report, time.perf_counter() - start)
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    args.report.write_text(json.dumps(summary, indent=2))
+    sys.exit(0 if all(entry["ok"] for entry in report) else 1)
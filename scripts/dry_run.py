@@ -5,6 +5,10 @@ import sys
 import json
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from validate_batch import check_request
+from budget import DEFAULT_DURATION
+
 
 def dry_run_test(json_file: str):
     """
@@ -16,91 +20,31 @@ def dry_run_test(json_file: str):
     print("=" * 50)
     print()
     
-    # Load JSON
-    try:
-        with open(json_file) as f:
-            data = json.load(f)
-        print("Step 1: JSON file loaded")
-    except Exception as e:
-        print(f"Step 1 FAILED: {e}")
-        return False
-    
-    # Validate schema
-    try:
-        from jsonschema import validate
-        schema_path = Path(__file__).parent.parent / "schemas" / "request.json"
-        with open(schema_path) as f:
-            schema = json.load(f)
-        validate(instance=data, schema=schema)
-        print("Step 2: JSON schema valid")
-    except Exception as e:
-        print(f"Step 2 FAILED: {e}")
-        return False
-    
-    # Validate Lyrics/Structure
-    try:
-        import re
-        lyrics = data.get('lyrics')
-        structure = data.get('structure')
-        
-        if lyrics:
-            print("Step 3: Validating LRC format...")
-            lines = lyrics.split('\n')
-            errors = []
-            for i, line in enumerate(lines, 1):
-                line = line.strip()
-                if not line:
-                    continue # Allow empty lines in lyrics
-                if not line.startswith('['):
-                    errors.append(f"Line {i}: No timestamp")
-            
-            if errors:
-                print(f"Step 3 FAILED: LRC errors:")
-                for err in errors[:5]:
-                    print(f"   - {err}")
-                return False
-            print("Step 3: LRC format valid")
-        elif structure:
-            print(f"Step 3: Validating structure ({len(structure)} sections)...")
-            for i, section in enumerate(structure):
-                if not section.get('type') or not section.get('lines'):
-                    print(f"   - Section {i} missing type or lines")
-                    return False
-            print("Step 3: Structure format valid")
-        else:
-            print("Step 3 FAILED: Missing both 'lyrics' and 'structure'")
+    # Same single pass over the request as validate_batch.py
+    result = check_request(json_file, Path(json_file).read_bytes())
+    steps = (("json", "Step 1"), ("schema", "Step 2"), ("lyrics", "Step 3"), ("budget", "Step 3"))
+    for check, step in steps:
+        errors = [e for e in result["errors"] if e["check"] == check]
+        if errors:
+            print(f"{step} FAILED:")
+            for err in errors[:5]:
+                where = f"{err['path']}: " if err["path"] else ""
+                print(f"   - {where}{err['message']}")
             return False
-    except Exception as e:
-        print(f"Step 3 FAILED: {e}")
-        return False
-    
-    # Check required fields
-    try:
-        request_id = data.get('request_id')
-        lyrics = data.get('lyrics')
-        structure = data.get('structure')
-        genre = data.get('genre', 'rock')
-        duration = data.get('duration', 95)
-        
-        if not request_id:
-            raise ValueError("Missing request_id")
-        if not lyrics and not structure:
-            raise ValueError("Missing lyrics/structure")
-        if duration < 30 or duration > 600:
-            raise ValueError(f"Invalid duration: {duration} (YuE recommended range 30-300s)")
-        
-        print("Step 4: Required fields present")
-        print(f"   - Request ID: {request_id}")
-        print(f"   - Genre: {genre}")
-        print(f"   - Duration: {duration}s")
-        if lyrics:
-            print(f"   - Lyrics length: {len(lyrics)} chars")
-        if structure:
-            total_lines = sum(len(s['lines']) for s in structure)
-            print(f"   - Structure: {len(structure)} sections, {total_lines} lines")
-    except Exception as e:
-        print(f"Step 4 FAILED: {e}")
-        return False
+    print("Step 1: JSON file loaded")
+    print("Step 2: JSON schema valid")
+    print(f"Step 3: {result['format']} format valid ({result['sections']} sections)")
+
+    with open(json_file) as f:
+        data = json.load(f)
+    print("Step 4: Required fields present")
+    print(f"   - Request ID: {data['request_id']}")
+    print(f"   - Genre: {data.get('genre', 'rock')}")
+    print(f"   - Duration: {data.get('duration', DEFAULT_DURATION)}s")
+    if data.get('lyrics'):
+        print(f"   - Lyrics length: {len(data['lyrics'])} chars")
+    if data.get('structure'):
+        print(f"   - Structure: {len(data['structure'])} sections, {result['lines']} lines")
     
     # Simulate Modal deployment (without actually deploying)
     print("Step 5: Modal deployment (simulated)")
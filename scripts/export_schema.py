@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Write schemas/request.json from the SongRequest model in src/models.py.
+
+The model is the single source of truth for the request shape; run this
+after changing it. ``--check`` only reports whether the file is up to date.
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from models import request_json_schema
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schemas" / "request.json"
+
+
+def render_schema() -> str:
+    return json.dumps(request_json_schema(), indent=2) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="Fail if the schema file is out of date")
+    args = parser.parse_args()
+
+    schema = render_schema()
+    if args.check:
+        if not SCHEMA_PATH.exists() or SCHEMA_PATH.read_text() != schema:
+            print(f"{SCHEMA_PATH} is out of date; run python3 scripts/export_schema.py")
+            sys.exit(1)
+        print(f"{SCHEMA_PATH} matches src/models.py")
+        sys.exit(0)
+
+    SCHEMA_PATH.write_text(schema)
+    print(f"Wrote {SCHEMA_PATH}")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Submit, poll, fetch and cancel asynchronous generation jobs on Modal."""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+import modal
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from artifacts import download_artifact
+
+APP_NAME = "musicmaker-yue"
+
+
+def _fn(name: str):
+    return modal.Function.from_name(APP_NAME, name)
+
+
+def submit(json_files: list) -> list:
+    """Submit every request file and return the job responses."""
+    responses = []
+    for json_file in json_files:
+        with open(json_file) as f:
+            request_data = json.load(f)
+        response = _fn("submit_job").remote(request_data)
+        print(f"Submitted {response['request_id']}: job {response['metadata']['job_id']}")
+        responses.append(response)
+    return responses
+
+
+def status(job_id: str) -> dict:
+    response = _fn("job_status").remote(job_id)
+    print(json.dumps(response, indent=2))
+    return response
+
+
+def fetch(job_id: str, output_dir: str = "output") -> Path:
+    """Stream the audio of a finished job from the artifacts volume into output_dir."""
+    response = _fn("job_status").remote(job_id)
+    if response["status"] != "success":
+        raise RuntimeError(f"Job {job_id} is {response['status']}: {response.get('error')}")
+
+    artifact = _fn("job_result").remote(job_id)
+    output_path = Path(output_dir) / f"{response['request_id']}_{job_id[:8]}.{artifact['format']}"
+    download_artifact(artifact, output_path)
+    print(f"Saved: {output_path} ({artifact['size'] / 1024 / 1024:.2f} MB, sha256 {artifact['sha256'][:12]})")
+    return output_path
+
+
+def wait(job_ids: list, interval: float = 15.0, output_dir: str = "output") -> bool:
+    """Poll until every job has finished, fetching results as they complete."""
+    pending = set(job_ids)
+    ok = True
+    while pending:
+        for job_id in sorted(pending):
+            response = _fn("job_status").remote(job_id)
+            if response["status"] == "processing":
+                continue
+            pending.discard(job_id)
+            if response["status"] == "success":
+                fetch(job_id, output_dir)
+            else:
+                ok = False
+                print(f"Job {job_id} failed: {response.get('error')}")
+        if pending:
+            time.sleep(interval)
+    return ok
+
+
+def cancel(job_id: str) -> dict:
+    response = _fn("cancel_job").remote(job_id)
+    print(f"Job {job_id}: {response['status']} ({response.get('error')})")
+    return response
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("submit", help="Submit request JSON files")
+    p.add_argument("json_files", nargs="+")
+    p.add_argument("--wait", action="store_true", help="Poll and fetch results")
+    sub.add_parser("status", help="Show job status").add_argument("job_id")
+    sub.add_parser("fetch", help="Download a finished job").add_argument("job_id")
+    sub.add_parser("cancel", help="Cancel a running job").add_argument("job_id")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "submit":
+            responses = submit(args.json_files)
+            if args.wait:
+                ok = wait([r["metadata"]["job_id"] for r in responses])
+                sys.exit(0 if ok else 1)
+        elif args.command == "status":
+            status(args.job_id)
+        elif args.command == "fetch":
+            fetch(args.job_id)
+        elif args.command == "cancel":
+            cancel(args.job_id)
+    except Exception as e:
+        print(f"Job command failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Trim silence and normalise loudness of generated songs before the video step.
+
+Runs between process_request.py and create_video.py. The song recorded in
+each request's stage manifest (or the file given as request.json=song.wav)
+is rewritten in place. The manifest keeps the measured loudness and the
+amount of leading silence removed, so create_video.py can shift the lyrics
+by the same amount.
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from audio_post import TARGET_LUFS, postprocess_wav
+from manifest import StageManifest, input_hash, parse_force_stages
+from prefetch import file_digest
+
+
+def postprocess_request(request_json: str, audio_file: Optional[str] = None, force: set = frozenset(),
+                        target_lufs: Optional[float] = TARGET_LUFS, trim: bool = True) -> dict:
+    """Post-process one request's song; returns the manifest entry."""
+    with open(request_json) as f:
+        request_id = json.load(f).get('request_id', 'unknown')
+
+    manifest = StageManifest(request_id, force=force)
+    if audio_file:
+        audio_path = Path(audio_file)
+    else:
+        generated = manifest.artifacts("generate")
+        if not generated or not generated[0].exists():
+            raise ValueError(f"No generated audio recorded for {request_id}; pass the audio file explicitly")
+        audio_path = generated[0]
+
+    params = {"target_lufs": target_lufs, "trim": trim}
+    # The song is rewritten in place, so the hash is taken of the file this
+    # stage leaves behind: a rerun sees its own output and skips, a
+    # regenerated song does not match
+    entry = manifest.done("postprocess", input_hash(audio_path, **params))
+    if entry:
+        print(f"{request_id}: already post-processed ({audio_path})")
+        return entry
+
+    with open(audio_path, "rb") as f:
+        is_wav = f.read(4) == b"RIFF"
+    if not is_wav:
+        print(f"{request_id}: {audio_path.suffix} is not WAV, skipping post-processing")
+        return {}
+
+    # A forced rerun on an already processed song adds to the earlier trim
+    previous = manifest.entry("postprocess") or {}
+    earlier_trim_ms = 0
+    if previous.get("audio_sha256") == file_digest(audio_path, "sha256"):
+        earlier_trim_ms = previous.get("lead_trim_ms", 0)
+
+    tmp_path = audio_path.with_name(audio_path.name + ".post")
+    try:
+        report = postprocess_wav(audio_path, tmp_path, target_lufs=target_lufs, trim=trim)
+        os.replace(tmp_path, audio_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    print(f"{request_id}: {report.input_lufs} -> {report.output_lufs} LUFS ({report.gain_db:+.2f} dB), "
+          f"trimmed {report.lead_trim_ms} ms lead / {report.tail_trim_ms} ms tail, "
+          f"{report.duration_ms / 1000:.1f}s left")
+    return manifest.record(
+        "postprocess",
+        input_hash(audio_path, **params),
+        [audio_path],
+        audio_sha256=file_digest(audio_path, "sha256"),
+        **{**report.to_dict(), "lead_trim_ms": earlier_trim_ms + report.lead_trim_ms},
+    )
+
+
+def _pair(value: str) -> tuple:
+    """``request.json`` or ``request.json=song.wav``."""
+    request_json, _, audio_file = value.partition("=")
+    return request_json, audio_file or None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="request.json[=song.wav]")
+    parser.add_argument("--target-lufs", type=float, default=TARGET_LUFS,
+                        help=f"Integrated loudness to normalise to (default {TARGET_LUFS})")
+    parser.add_argument("--no-normalize", action="store_true", help="Keep the original level")
+    parser.add_argument("--no-trim", action="store_true", help="Keep leading and trailing silence")
+    parser.add_argument("--force-stage", action="append", default=[], help="Redo a stage (postprocess or all)")
+    args = parser.parse_args()
+    force = parse_force_stages(args.force_stage)
+
+    target = None if args.no_normalize else args.target_lufs
+    failed = 0
+    for value in args.inputs:
+        request_json, audio_file = _pair(value)
+        try:
+            postprocess_request(request_json, audio_file, force, target, not args.no_trim)
+        except Exception as e:
+            print(f"Post-processing {request_json} failed: {e}")
+            failed += 1
+    sys.exit(1 if failed else 0)
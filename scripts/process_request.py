@@ -3,56 +3,327 @@
 
 import sys
 import json
+import time
+import wave
+import shutil
+import argparse
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
 from pathlib import Path
+from typing import Iterator, List, NamedTuple, Union
 import modal
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from artifacts import download_artifact
+from manifest import StageManifest, parse_force_stages
+from models import REQUEST_ADAPTER, REQUEST_LIST_ADAPTER
+from pydantic import ValidationError
+from scheduler import JobScheduler, request_key
 
-def process_request(json_file: str):
+
+class SegmentWriter:
+    """
+    Writes streamed segments to disk as they arrive.
+
+    Every segment is saved as its own WAV under ``segments_dir`` (so preview
+    and video steps can start on the first one) and appended to the full
+    song file at ``output_path``.
+    """
+
+    def __init__(self, output_path: Path, segments_dir: Path):
+        self.output_path = output_path
+        self.segments_dir = segments_dir
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        self._song = None
+
+    def add(self, chunk: bytes) -> Path:
+        # The worker converts every streamed chunk to WAV
+        if not chunk.startswith(b"RIFF"):
+            raise ValueError(f"Segment {self.count + 1} is not WAV audio")
+        self.count += 1
+        part_path = self.segments_dir / f"part{self.count:02d}.wav"
+        part_path.write_bytes(chunk)
+
+        with wave.open(str(part_path), "rb") as part:
+            if self._song is None:
+                self._song = wave.open(str(self.output_path), "wb")
+                self._song.setparams(part.getparams())
+            self._song.writeframes(part.readframes(part.getnframes()))
+        return part_path
+
+    def close(self, keep_segments: bool = False):
+        if self._song is not None:
+            self._song.close()
+        if not keep_segments:
+            shutil.rmtree(self.segments_dir, ignore_errors=True)
+
+
+def _generated(data: dict, force: set) -> tuple:
+    """(manifest, input hash, previous output path or None) for a request."""
+    manifest = StageManifest(data.get("request_id", "unknown"), force=force)
+    digest = request_key(data)
+    entry = None if data.get("bypass_cache") else manifest.done("generate", digest)
+    return manifest, digest, Path(entry["artifacts"][0]) if entry else None
+
+
+def process_request(json_file: str, keep_segments: bool = False, stream: bool = True,
+                    force: set = frozenset()) -> Path:
     """
-    Process lyrics-to-song request.
-    
+    Process lyrics-to-song request, streaming segments to disk.
+
     Args:
         json_file: Path to JSON request file
+        keep_segments: Keep per-segment WAVs in output/segments/<request_id>/
+        stream: Receive WAV segments as they are generated; otherwise (and for
+            any output_format other than wav) wait for the finished song and
+            download it from the artifacts volume in chunks
+        force: Stages to run even if the manifest says they are done
+
+    Returns:
+        Path of the song (the earlier one if the inputs have not changed)
     """
-    # Load request
-    with open(json_file) as f:
-        request_data = json.load(f)
-    
+    # Load and validate request
+    try:
+        request_data = REQUEST_ADAPTER.validate_json(Path(json_file).read_bytes())
+    except ValidationError as e:
+        raise ValueError(f"Invalid request in {json_file}: {'; '.join(_errors(e))}") from None
+    request_data = request_data.model_dump(mode="json", exclude_unset=True)
+
     print(f"Processing request: {request_data.get('request_id')}")
     print(f"Genre: {request_data.get('genre', 'rock')}")
-    
-    # Get Modal function (new API)
-    process_fn = modal.Function.from_name("musicmaker-yue", "process_request")
-    
-    # Call Modal function (returns audio bytes)
-    print("🎤 Generating song with vocals...")
-    audio_bytes = process_fn.remote(request_data)
-    
+
+    manifest, digest, previous = _generated(request_data, force)
+    if previous is not None:
+        print(f"Already generated with the same inputs: {previous} (use --force-stage generate to redo)")
+        return previous
+
     # Save to local output directory
     output_dir = Path("output")
     output_dir.mkdir(exist_ok=True)
-    
+
     request_id = request_data.get('request_id', 'unknown')
-    from datetime import datetime
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"{request_id}_{timestamp}.wav"
     output_path = output_dir / filename
-    
-    with open(output_path, "wb") as f:
-        f.write(audio_bytes)
-    
+
+    # Streamed segments are raw WAV; other formats are encoded in the worker
+    if not stream or request_data.get("output_format", "wav") != "wav":
+        print("Generating song with vocals...")
+        artifact = modal.Function.from_name("musicmaker-yue", "process_request").remote(request_data)
+        output_path = output_path.with_suffix(f".{artifact['format']}")
+        download_artifact(artifact, output_path)
+        print(f"Saved: {output_path} ({artifact['size'] / 1024 / 1024:.2f} MB, sha256 {artifact['sha256'][:12]})")
+        manifest.record("generate", digest, [output_path], sha256=artifact["sha256"])
+        return output_path
+
+    # Call Modal function (yields audio bytes per segment)
+    process_fn = modal.Function.from_name("musicmaker-yue", "process_request_stream")
+    print("🎤 Generating song with vocals...")
+    writer = SegmentWriter(output_path, output_dir / "segments" / request_id)
+    try:
+        for chunk in process_fn.remote_gen(request_data):
+            part_path = writer.add(chunk)
+            print(f"Segment {writer.count} saved: {part_path} ({len(chunk) / 1024 / 1024:.2f} MB)")
+    finally:
+        writer.close(keep_segments=keep_segments)
+
+    if writer.count == 0:
+        raise RuntimeError("Generation returned no audio")
+    manifest.record("generate", digest, [output_path])
+
     print(f"✅ Generation successful!")
     print(f"📁 Saved: {output_path}")
     print(f"📦 Will be uploaded as GitHub Artifact")
+    return output_path
+
+
+class InvalidRequest(NamedTuple):
+    """Input that failed validation; bulk mode logs it as a failed request."""
+    source: str
+    errors: List[str]
+
+
+def _errors(e: ValidationError, limit: int = 5) -> List[str]:
+    """The first ``limit`` validation errors as "field/path: message"."""
+    return [f"{'/'.join(map(str, error['loc'])) or 'request'}: {error['msg']}" for error in e.errors()[:limit]]
+
+
+def _validated(raw: bytes, source: str) -> Iterator[Union[dict, InvalidRequest]]:
+    """
+    Requests in ``raw`` (one request or a JSON array of them), parsed and
+    validated straight from the bytes by pydantic-core; invalid input is
+    reported and yielded as an InvalidRequest.
+    """
+    try:
+        if raw.lstrip()[:1] == b"[":
+            requests = REQUEST_LIST_ADAPTER.validate_json(raw)
+        else:
+            requests = [REQUEST_ADAPTER.validate_json(raw)]
+    except ValidationError as e:
+        print(f"Invalid request in {source}: {e.error_count()} error(s)")
+        for error in _errors(e):
+            print(f"  - {error}")
+        yield InvalidRequest(source, _errors(e))
+        return
+    for request in requests:
+        # Only the fields the request set, so it hashes and caches as before
+        yield request.model_dump(mode="json", exclude_unset=True)
+
+
+def iter_requests(paths: List[str]) -> Iterator[Union[dict, InvalidRequest]]:
+    """
+    Yield requests from JSON files, JSONL files (one request per line) and
+    directories of JSON files, reading lazily and validating each against
+    the SongRequest model. Input that fails validation is yielded as an
+    InvalidRequest so the caller can count it.
+    """
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from iter_requests(sorted(str(p) for p in path.glob("*.json")))
+        elif path.suffix == ".jsonl":
+            with open(path, "rb") as f:
+                for number, line in enumerate(f, 1):
+                    if line.strip():
+                        yield from _validated(line, f"{path}:{number}")
+        else:
+            yield from _validated(path.read_bytes(), str(path))
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+
+
+def process_bulk(paths: List[str], concurrency: int = 4, output_dir: str = "output",
+                 force: set = frozenset()) -> dict:
+    """
+    Generate every request in ``paths`` with at most ``concurrency`` songs in flight.
+
+    Requests go through a JobScheduler, so priorities are honored and identical
+    requests are generated once. Requests whose manifest already has a song for
+    the same inputs are skipped. Songs are downloaded and logged to
+    output/bulk_<timestamp>.jsonl in completion order; invalid inputs are
+    logged and counted as failed requests.
+
+    Returns the throughput summary.
+    """
+    process_fn = modal.Function.from_name("musicmaker-yue", "process_request")
+    scheduler = JobScheduler(process_fn.remote, max_workers=concurrency)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_path = output_dir / f"bulk_{timestamp}.jsonl"
+
+    # Future -> [(request_id, submit time, manifest, input hash)]; coalesced requests share a future
+    outstanding = {}
+    latencies, failures, skipped, invalid = [], [], [], []
+    start = time.perf_counter()
+
+    def finish(future, log):
+        artifact, error = None, None
+        try:
+            artifact = future.result()
+        except Exception as e:
+            error = str(e)
+
+        for request_id, submitted, manifest, digest in outstanding.pop(future):
+            record = {"request_id": request_id}
+            try:
+                if error:
+                    raise RuntimeError(error)
+                path = output_dir / f"{request_id}_{timestamp}.{artifact['format']}"
+                download_artifact(artifact, path)
+                manifest.record("generate", digest, [path], sha256=artifact["sha256"])
+                record.update(status="success", path=str(path), size=artifact["size"])
+            except Exception as e:
+                record.update(status="failed", error=str(e))
+                failures.append(request_id)
+            record["latency"] = round(time.perf_counter() - submitted, 2)
+            latencies.append(record["latency"])
+            log.write(json.dumps(record) + "\n")
+            log.flush()
+            print(f"[{len(latencies)}] {request_id}: {record['status']} in {record['latency']:.1f}s "
+                  f"{record.get('path') or record.get('error')}")
+
+    with open(log_path, "w") as log:
+        for data in iter_requests(paths):
+            if isinstance(data, InvalidRequest):
+                log.write(json.dumps({"source": data.source, "status": "failed", "error": "; ".join(data.errors)}) + "\n")
+                log.flush()
+                invalid.append(data.source)
+                failures.append(data.source)
+                continue
+
+            # Keep a bounded backlog instead of reading the whole input up front
+            while len(outstanding) >= concurrency * 2:
+                done, _ = wait(list(outstanding), return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future, log)
+
+            manifest, digest, previous = _generated(data, force)
+            if previous is not None:
+                print(f"Skipping {manifest.request_id}: already generated ({previous})")
+                skipped.append(manifest.request_id)
+                continue
+
+            future = scheduler.submit(data)
+            outstanding.setdefault(future, []).append((manifest.request_id, time.perf_counter(), manifest, digest))
+
+        while outstanding:
+            done, _ = wait(list(outstanding), return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(future, log)
+
+    elapsed = time.perf_counter() - start
+    succeeded = len(latencies) + len(invalid) - len(failures)
+    summary = {
+        "requests": len(latencies) + len(invalid),
+        "succeeded": succeeded,
+        "failed": failures,
+        "invalid": invalid,
+        "coalesced": scheduler.stats["coalesced"],
+        "skipped": skipped,
+        "elapsed": round(elapsed, 1),
+        "songs_per_hour": round(succeeded / elapsed * 3600, 1) if elapsed else 0.0,
+        "p50_latency": _percentile(latencies, 50) if latencies else None,
+        "p95_latency": _percentile(latencies, 95) if latencies else None,
+    }
+    print()
+    print(f"Bulk: {summary['succeeded']}/{summary['requests']} songs in {elapsed:.0f}s "
+          f"({summary['coalesced']} coalesced, {len(skipped)} unchanged, {len(invalid)} invalid), "
+          f"{summary['songs_per_hour']} songs/hour")
+    if latencies:
+        print(f"Latency: p50 {summary['p50_latency']:.0f}s, p95 {summary['p95_latency']:.0f}s")
+    if failures:
+        print(f"Failures ({len(failures)}): {', '.join(failures)}")
+    print(f"Log: {log_path}")
+    return summary
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python process_request.py <json_file>")
-        sys.exit(1)
-    
+    parser = argparse.ArgumentParser(description="Generate songs for request JSON/JSONL files or directories")
+    parser.add_argument("inputs", nargs="+",
+                        help="Request JSON file; several files, a .jsonl file or a directory run in bulk mode")
+    parser.add_argument("--keep-segments", action="store_true",
+                        help="Keep per-segment WAVs in output/segments/<request_id>/")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Wait for the full song and download it from the artifacts volume")
+    parser.add_argument("--bulk", action="store_true", help="Use bulk mode even for a single JSON file")
+    parser.add_argument("--concurrency", type=int, default=4, help="Songs in flight in bulk mode")
+    parser.add_argument("--force-stage", action="append", default=[], metavar="STAGE",
+                        help="Regenerate even if the manifest has a song for the same inputs (generate or all)")
+    args = parser.parse_args()
+
+    bulk = args.bulk or len(args.inputs) > 1 or Path(args.inputs[0]).is_dir() or args.inputs[0].endswith(".jsonl")
     try:
-        process_request(sys.argv[1])
+        force = parse_force_stages(args.force_stage)
+        if bulk:
+            summary = process_bulk(args.inputs, concurrency=args.concurrency, force=force)
+            sys.exit(1 if summary["failed"] or not (summary["requests"] or summary["skipped"]) else 0)
+        process_request(args.inputs[0], keep_segments=args.keep_segments, stream=not args.no_stream, force=force)
     except Exception as e:
         print(f"❌ Processing failed: {e}")
         sys.exit(1)
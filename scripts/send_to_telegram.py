@@ -1,57 +1,240 @@
 import sys
 import os
-import requests
+import json
+import math
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def send_to_telegram(token, chat_id, file_paths):
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from delivery import MultipartStream, RateLimiter, pooled_session, retry_after_header, send_with_retries
+from manifest import StageManifest, input_hash, parse_force_stages
+from transcode import probe_duration, transcode_file
+
+# Saxta Bot API serveri ile yoxlamaq ucun deyishdirile biler
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+# Bot API-nin multipart yukleme limiti
+UPLOAD_LIMIT = 50 * 1000 * 1000
+# Multipart bashliqlari ve konteyner ucun ehtiyat
+FIT_MARGIN = 0.95
+ALBUM_SIZE = 10
+MIN_VIDEO_KBPS = 300
+FIT_AUDIO_KBPS = 128
+# Eyni chat-a saniyede texminen bir mesaj
+SEND_INTERVAL = 1.0
+
+VIDEO_SUFFIXES = ['.mp4', '.mov', '.avi']
+AUDIO_SUFFIXES = ['.wav', '.mp3', '.m4a']
+# sendAudio qebul etmese de, olchuye salmaq ucun mp3-e kodlana bilen fayllar
+ENCODABLE_AUDIO = AUDIO_SUFFIXES + ['.flac', '.opus']
+
+
+def _kind(path: Path) -> str:
+    """Fayl tipine gore uygun media novu: video, audio ve ya document."""
+    if path.suffix.lower() in VIDEO_SUFFIXES:
+        return "video"
+    if path.suffix.lower() in AUDIO_SUFFIXES:
+        return "audio"
+    return "document"
+
+
+def _retry_after(response):
+    """429 cavabinda Telegram gozleme muddetini parameters.retry_after-de verir."""
+    try:
+        hint = response.json().get("parameters", {}).get("retry_after")
+    except ValueError:
+        hint = None
+    return float(hint) if hint is not None else retry_after_header(response)
+
+
+def _ffmpeg(*args):
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-y', *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg xetasi: {result.stderr.strip()}")
+
+
+def split_media(path: Path, work_dir: Path, limit: int) -> list:
+    """Fayli yeniden kodlamadan (stream copy) limite sigan hisselere bolur."""
+    parts = math.ceil(path.stat().st_size / (limit * FIT_MARGIN))
+    segment_time = probe_duration(path) / parts
+    pattern = work_dir / f"{path.stem}_part%02d{path.suffix}"
+    _ffmpeg('-i', str(path), '-map', '0', '-c', 'copy', '-f', 'segment',
+            '-segment_time', f"{segment_time:.3f}", '-reset_timestamps', '1', str(pattern))
+    outputs = sorted(work_dir.glob(f"{path.stem}_part*{path.suffix}"))
+    too_big = [p.name for p in outputs if p.stat().st_size > limit]
+    if too_big:
+        raise RuntimeError(f"Hisseler limitden boyukdur: {too_big}")
+    return outputs
+
+
+def fit_to_limit(path: Path, work_dir: Path, limit: int = UPLOAD_LIMIT) -> list:
+    """
+    Limitden boyuk fayli gonderile bilen fayllara cevirir:
+    audio -> mp3 (lazim olsa hisselere bolunur), video -> limite uygun bitreytle yeniden kodlanir,
+    bu mumkun deyilse hisselere bolunur. Kicik fayllar oldugu kimi qalir.
+    """
+    if path.stat().st_size <= limit:
+        return [path]
+    print(f"Fayl limitden boyukdur ({path.stat().st_size / 1e6:.1f} MB): {path.name}")
+
+    if path.suffix.lower() in ENCODABLE_AUDIO:
+        mp3 = transcode_file(path, work_dir, "mp3", "high")
+        if mp3.stat().st_size <= limit:
+            return [mp3]
+        return split_media(mp3, work_dir, limit)
+
+    if path.suffix.lower() in VIDEO_SUFFIXES:
+        duration = probe_duration(path)
+        video_kbps = int(limit * 8 * FIT_MARGIN / duration / 1000) - FIT_AUDIO_KBPS
+        if video_kbps >= MIN_VIDEO_KBPS:
+            fitted = work_dir / f"{path.stem}.mp4"
+            _ffmpeg('-i', str(path), '-c:v', 'libx264', '-b:v', f"{video_kbps}k",
+                    '-maxrate', f"{video_kbps}k", '-bufsize', f"{2 * video_kbps}k",
+                    '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', f"{FIT_AUDIO_KBPS}k",
+                    '-movflags', '+faststart', str(fitted))
+            if fitted.stat().st_size <= limit:
+                return [fitted]
+        return split_media(path, work_dir, limit)
+
+    raise RuntimeError(f"{path.name} limitden boyukdur ve kicildile bilmir")
+
+
+def plan_albums(items: list) -> list:
+    """(esas fayl, gonderilecek fayl) cutlerini eyni novlu, en chox 10 elementli albomlara bolur."""
+    albums = []
+    current = []
+    for item in items:
+        if current and (len(current) == ALBUM_SIZE or _kind(current[0][1]) != _kind(item[1])):
+            albums.append(current)
+            current = []
+        current.append(item)
+    if current:
+        albums.append(current)
+    return albums
+
+
+def send_album(session, base_url, chat_id, album, limiter, captions) -> bool:
+    """Bir fayli sendVideo/sendAudio/sendDocument ile, bir necesini sendMediaGroup ile gonderir."""
+    kind = _kind(album[0][1])
+    fields = [('chat_id', str(chat_id))]
+    if len(album) == 1:
+        method = f"send{kind.capitalize()}"
+        part = album[0][1]
+        files = [(kind, part, part.name)]
+        if captions.get(part):
+            fields.append(('caption', captions[part]))
+    else:
+        method = "sendMediaGroup"
+        media = []
+        files = []
+        for i, (_, part) in enumerate(album):
+            entry = {'type': kind, 'media': f"attach://file{i}"}
+            if captions.get(part):
+                entry['caption'] = captions[part]
+            media.append(entry)
+            files.append((f"file{i}", part, part.name))
+        fields.append(('media', json.dumps(media)))
+
+    def build():
+        body = MultipartStream(fields, files)
+        return {'data': body, 'headers': {'Content-Type': body.content_type}}
+
+    names = ", ".join(part.name for _, part in album)
+    try:
+        response = send_with_retries(session, "POST", f"{base_url}/{method}", build,
+                                     limiter=limiter, retry_after=_retry_after)
+    except Exception as e:
+        print(f"Gonderilme ugursuz oldu: {names} ({e.__class__.__name__})")
+        return False
+
+    if response.status_code == 200:
+        print(f"Ugurla gonderildi: {names}")
+        return True
+    print(f"Gonderilme ugursuz oldu: {names}")
+    print(f"Status: {response.status_code}")
+    print(f"Cavab: {response.text}")
+    return False
+
+
+def send_to_telegram(token, chat_id, file_paths, force=frozenset(), parallel=3, api_url=None,
+                     session=None, limiter=None):
     """
     Fayllari Telegram botu vasitesile gonderir.
+    Eyni chat-a evvel gonderilmish ve deyishmemish fayllar (manifest) otururulur.
+    Limitden boyuk fayllar evvelce kicildilir ve ya bolunur, eyni novlu fayllar albom kimi,
+    albomlar ise ortaq baglanti hovuzu ile paralel gonderilir; 429 cavabinda butun ishciler
+    Telegram-in dediyi muddet gozleyir.
+    Bir nece chagirish eyni session ve limiter-i paylasha biler (meselen deliver.py).
     """
     # Eger token 'bot' ile bashlayirsa, uni temizleyirik
     clean_token = token[3:] if token.startswith('bot') else token
-    base_url = f"https://api.telegram.org/bot{clean_token}"
-    
+    base_url = f"{api_url or TELEGRAM_API_URL}/bot{clean_token}"
+
+    pending = []
     for path in file_paths:
         p = Path(path)
         if not p.exists():
             print(f"Fayl tapilmadi: {path}")
             continue
-            
-        print(f"Telegram-a gonderilir: {p.name}")
-        
-        # Fayl tipine gore uygun method secilir
-        if p.suffix.lower() in ['.mp4', '.mov', '.avi']:
-            method = "sendVideo"
-            file_key = "video"
-        elif p.suffix.lower() in ['.wav', '.mp3', '.m4a']:
-            method = "sendAudio"
-            file_key = "audio"
-        else:
-            method = "sendDocument"
-            file_key = "document"
-            
-        url = f"{base_url}/{method}"
-        
-        with open(p, 'rb') as f:
-            payload = {'chat_id': chat_id}
-            files = {file_key: f}
-            
-            response = requests.post(url, data=payload, files=files)
-            
-            if response.status_code == 200:
-                print(f"Ugurla gonderildi: {p.name}")
-            else:
-                print(f"Gonderilme ugursuz oldu: {p.name}")
-                print(f"Status: {response.status_code}")
-                print(f"Cavab: {response.text}")
+
+        # Bu fayl bu chat-a artiq gonderilibse, yeniden gondermirik
+        manifest = StageManifest.owner(p, force=force)
+        digest = input_hash(p, chat_id=str(chat_id))
+        if manifest and manifest.done("telegram", digest, item=p.name):
+            print(f"Artiq gonderilib, otururulur: {p.name}")
+            continue
+        pending.append((p, manifest, digest))
+
+    if not pending:
+        return True
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        items = []
+        captions = {}
+        failed = set()
+        for p, _, _ in pending:
+            try:
+                parts = fit_to_limit(p, Path(work_dir))
+            except Exception as e:
+                print(f"Gonderilme ugursuz oldu: {p.name} ({e})")
+                failed.add(p)
+                continue
+            for i, part in enumerate(parts, 1):
+                items.append((p, part))
+                if len(parts) > 1:
+                    captions[part] = f"{p.name} ({i}/{len(parts)})"
+
+        albums = plan_albums(items)
+        print(f"Telegram-a gonderilir: {len(items)} fayl, {len(albums)} mesaj")
+        session = session or pooled_session(pool_size=parallel)
+        limiter = limiter or RateLimiter(SEND_INTERVAL)
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            results = list(pool.map(
+                lambda album: send_album(session, base_url, chat_id, album, limiter, captions), albums
+            ))
+
+    for album, ok in zip(albums, results):
+        if not ok:
+            failed.update(original for original, _ in album)
+    for p, manifest, digest in pending:
+        if p not in failed and manifest:
+            manifest.record("telegram", digest, item=p.name)
+    return not failed
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Istifade: python send_to_telegram.py <token> <chat_id> <fayl1> <fayl2> ...")
-        sys.exit(1)
-
-    bot_token = sys.argv[1]
-    target_chat_id = sys.argv[2]
-    files = sys.argv[3:]
-    
-    send_to_telegram(bot_token, target_chat_id, files)
+    parser = argparse.ArgumentParser(
+        usage="python send_to_telegram.py <token> <chat_id> <fayl1> <fayl2> ... [--parallel N] [--force-stage telegram]"
+    )
+    parser.add_argument("token")
+    parser.add_argument("chat_id")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--parallel", type=int, default=3, help="Eyni vaxtda gonderilen mesajlar")
+    parser.add_argument("--force-stage", action="append", default=[])
+    args = parser.parse_args()
+    force = parse_force_stages(args.force_stage)
+
+    success = send_to_telegram(args.token, args.chat_id, args.files, force=force, parallel=args.parallel)
+    sys.exit(0 if success else 1)
@@ -1,52 +1,133 @@
 import sys
-import os
-import requests
 import json
+import math
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def send_to_webhook(url, file_paths, metadata=None):
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from delivery import FileSlice, MultipartStream, pooled_session, send_with_retries
+from manifest import StageManifest, input_hash, parse_force_stages
+from prefetch import file_digest
+from result_cache import cache_key
+
+AUDIO_SUFFIXES = ['.wav', '.flac', '.mp3', '.opus']
+VIDEO_SUFFIXES = ['.mp4']
+
+
+def _field(path: Path) -> str:
+    """Fayl tipine gore achar: audio, video ve ya file."""
+    if path.suffix.lower() in AUDIO_SUFFIXES:
+        return 'audio'
+    if path.suffix.lower() in VIDEO_SUFFIXES:
+        return 'video'
+    return 'file'
+
+
+def upload_chunked(session, url, path: Path, chunk_size: int) -> str:
+    """
+    Boyuk fayli hisse-hisse (resumable) yukleyir ve upload_id qaytarir.
+
+    Protokol (Google resumable upload kimi):
+      PUT <url>  Upload-Id: <sha256>, Content-Range: bytes */<olcu>  -> 308 + Range: bytes=0-N
+      PUT <url>  Upload-Id: <sha256>, Content-Range: bytes a-b/<olcu> -> 308 (davam) / 200, 201 (bitdi)
+    upload_id faylin sha256-idir, ona gore yarimchiq yukleme novbeti ishe salinmada davam edir.
+    """
+    total = path.stat().st_size
+    upload_id = file_digest(path, "sha256")
+    headers = {'Upload-Id': upload_id}
+
+    # Server artiq ne qeder qebul edib?
+    status = send_with_retries(session, "PUT", url, lambda: {
+        'headers': {**headers, 'Content-Range': f"bytes */{total}"}, 'data': b"",
+    })
+    if status.status_code in (200, 201):
+        print(f"Artiq yuklenib: {path.name}")
+        return upload_id
+    offset = 0
+    received = status.headers.get('Range', '')
+    if status.status_code == 308 and received.startswith('bytes='):
+        offset = int(received.split('-')[-1]) + 1
+    if offset:
+        print(f"Yukleme davam edir: {path.name} ({offset}/{total} bayt)")
+
+    while offset < total:
+        length = min(chunk_size, total - offset)
+        response = send_with_retries(session, "PUT", url, lambda: {
+            'headers': {**headers, 'Content-Range': f"bytes {offset}-{offset + length - 1}/{total}"},
+            'data': FileSlice(path, offset, length),
+        })
+        if response.status_code in (200, 201):
+            return upload_id
+        if response.status_code != 308:
+            raise RuntimeError(f"Hisse yuklenmedi ({path.name}): {response.status_code} {response.text[:200]}")
+        received = response.headers.get('Range', '')
+        offset = int(received.split('-')[-1]) + 1 if received.startswith('bytes=') else offset + length
+        print(f"  {path.name}: {offset}/{total} bayt ({math.floor(offset * 100 / total)}%)")
+    return upload_id
+
+
+def send_to_webhook(url, file_paths, metadata=None, force=frozenset(), session=None, chunk_size=None):
     """
     Fayllari ve metadatani webhook-a gonderir.
-    WAV fayllari 'audio' achari ile, MP4 fayllari 'video' achari ile gonderilir.
+    Audio fayllari (WAV, FLAC, MP3, Opus) 'audio' achari ile, MP4 fayllari 'video' achari ile gonderilir;
+    eyni acharli bir nece fayl ayri-ayri hisseler kimi gedir.
+    Sorgu axinla (sabit yaddashla) kodlanir, ugursuz olduqda eksponensial gozleme ile tekrarlanir ve
+    Idempotency-Key bashligi dashiyir ki, server tekrar gelen sorgunu tanisin.
+    chunk_size verilibse, ondan boyuk MP4 fayllari evvelce hisse-hisse yuklenir (upload_chunked).
+    Eyni fayllar eyni URL-e evvel gonderilibse (manifest), istek tekrarlanmir.
     """
-    payload_files = {}
-    opened_files = []
-    
+    session = session or pooled_session()
+
+    existing = []
+    for path in file_paths:
+        p = Path(path)
+        if not p.exists():
+            print(f"Fayl tapilmadi: {path}")
+            continue
+        existing.append(p)
+
+    # Fayllarin sahibi olan sorgularin manifestleri; her URL ayrica qeyd olunur
+    owners = [StageManifest.owner(p, force=force) for p in existing]
+    digest = input_hash(*existing, url=url, metadata=metadata)
+    url_item = cache_key(url=url)[:12]
+    if existing and all(owners) and all(o.done("webhook", digest, item=url_item) for o in owners):
+        print("Bu fayllar artiq gonderilib, istek otururulur.")
+        return True
+
     try:
-        for path in file_paths:
-            p = Path(path)
-            if not p.exists():
-                print(f"Fayl tapilmadi: {path}")
-                continue
-            
-            f = open(p, 'rb')
-            opened_files.append(f)
-            
-            # Fayl tipine gore achar teyin edirik
-            if p.suffix.lower() == '.wav':
-                key = 'audio'
-            elif p.suffix.lower() == '.mp4':
-                key = 'video'
+        fields = []
+        files = []
+        for p in existing:
+            key = _field(p)
+            if chunk_size and key == 'video' and p.stat().st_size > chunk_size:
+                upload_id = upload_chunked(session, url, p, chunk_size)
+                fields.append((f"{key}_upload", json.dumps(
+                    {'upload_id': upload_id, 'name': p.name, 'size': p.stat().st_size}
+                )))
+                print(f"Hazirlanir: {p.name} ({key} olaraq, hisse-hisse yuklenib)")
             else:
-                key = 'file'
-                
-            payload_files[key] = (p.name, f)
-            print(f"Hazirlanir: {p.name} ({key} olaraq)")
+                files.append((key, p, p.name))
+                print(f"Hazirlanir: {p.name} ({key} olaraq)")
 
         # Metadata varsa, data hissesine elave edirik
-        data = {}
         if metadata:
-            data['metadata'] = json.dumps(metadata)
+            fields.append(('metadata', json.dumps(metadata)))
             print("Metadata elave edildi.")
 
-        # POST isteyi
-        response = requests.post(url, files=payload_files, data=data)
-        
-        for f in opened_files:
-            f.close()
+        def build():
+            body = MultipartStream(fields, files)
+            return {
+                'data': body,
+                'headers': {'Content-Type': body.content_type, 'Idempotency-Key': digest},
+            }
+
+        response = send_with_retries(session, "POST", url, build)
 
         if 200 <= response.status_code < 300:
             print(f"Ugurla gonderildi. Status: {response.status_code}")
+            for owner in {o.request_id: o for o in owners if o}.values():
+                owner.record("webhook", digest, item=url_item)
             return True
         else:
             print(f"Gonderilme ugursuz oldu. Status: {response.status_code}")
@@ -57,19 +138,40 @@ def send_to_webhook(url, file_paths, metadata=None):
         print(f"Xeta: {e}")
         return False
 
+
+def send_to_webhooks(urls, file_paths, metadata=None, force=frozenset(), chunk_size=None):
+    """Eyni fayllari bir nece URL-e eyni vaxtda gonderir (ortaq baglanti hovuzu ile)."""
+    if not urls:
+        print("Webhook URL-i verilmeyib, hech ne gonderilmir.")
+        return True
+    session = pooled_session(pool_size=max(4, len(urls)))
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        results = list(pool.map(
+            lambda url: send_to_webhook(url, file_paths, metadata, force, session, chunk_size), urls
+        ))
+    return all(results)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Istifade: python send_to_webhook.py <url> <fayl1> <fayl2> ...")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        usage="python send_to_webhook.py <url[,url2,...]> <fayl1> <fayl2> ... [--chunk-size MB] [--force-stage webhook]"
+    )
+    parser.add_argument("urls", help="Webhook URL-i (vergulle bir nece)")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--chunk-size", type=float,
+                        help="Bu olcuden (MB) boyuk MP4 fayllarini hisse-hisse yukle")
+    parser.add_argument("--force-stage", action="append", default=[])
+    args = parser.parse_args()
+    force = parse_force_stages(args.force_stage)
+
+    webhook_urls = [url.strip() for url in args.urls.split(",") if url.strip()]
+    chunk_size = int(args.chunk_size * 1024 * 1024) if args.chunk_size else None
 
-    webhook_url = sys.argv[1]
-    file_list = sys.argv[2:]
-    
     # Test ucun sade metadata temin edirik
     test_metadata = {
         "source": "github_actions",
         "project": "musicmaker"
     }
-    
-    success = send_to_webhook(webhook_url, file_list, metadata=test_metadata)
+
+    success = send_to_webhooks(webhook_urls, args.files, metadata=test_metadata, force=force, chunk_size=chunk_size)
     sys.exit(0 if success else 1)
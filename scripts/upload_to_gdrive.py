@@ -1,14 +1,32 @@
 import os
 import sys
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 
-def get_gdrive_service():
-    """Build and return a Google Drive service object with diagnostics."""
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from delivery import send_with_retries
+from manifest import StageManifest, input_hash, pop_force_stages, write_atomic
+from prefetch import file_digest
+from result_cache import cache_key
+
+MB = 1024 * 1024
+LIST_PAGE_SIZE = 1000
+# Files up to this size go in a single multipart request
+SIMPLE_UPLOAD_MAX = 5 * MB
+UPLOAD_RETRIES = 5
+UPLOAD_WORKERS = 4
+# Under the manifest directory: one state file per interrupted resumable upload
+SESSION_DIR = "drive_sessions"
+
+def get_credentials():
+    """Refreshed OAuth credentials from the environment, with diagnostics."""
     client_id = os.environ.get("GDRIVE_CLIENT_ID", "").strip()
     client_secret = os.environ.get("GDRIVE_CLIENT_SECRET", "").strip()
     refresh_token = os.environ.get("GDRIVE_REFRESH_TOKEN", "").strip()
@@ -40,66 +58,255 @@ def get_gdrive_service():
             print("------------------------------------------\n")
             raise
 
-    return build("drive", "v3", credentials=creds)
+    return creds
 
-def check_file_exists(service, name, folder_id):
-    """Check if a file with the same name exists in the target folder."""
-    if not folder_id:
-        # If no folder_id, search in overall drive (less safe but works as fallback)
-        query = f"name = '{name}' and trashed = false"
+def get_gdrive_service(creds=None):
+    """Build and return a Google Drive service object."""
+    creds = creds or get_credentials()
+    if not creds:
+        return None
+    return build("drive", "v3", credentials=creds, cache_discovery=False)
+
+def list_folder(service, folder_id):
+    """
+    Every file in the target folder (the Drive root without a folder id),
+    fetched once page by page and indexed by (md5Checksum, size).
+    """
+    parent = folder_id or "root"
+    query = f"'{parent}' in parents and trashed = false"
+    by_md5 = {}
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=query,
+            spaces="drive",
+            fields="nextPageToken, files(id, name, size, md5Checksum)",
+            pageSize=LIST_PAGE_SIZE,
+            pageToken=page_token,
+        ).execute()
+        for item in response.get("files", []):
+            if item.get("md5Checksum"):
+                by_md5.setdefault((item["md5Checksum"], int(item.get("size", -1))), item)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return by_md5
+
+def chunk_size_for(size):
+    """Resumable chunk size: a multiple of 256 KiB, larger for larger files."""
+    if size <= 64 * MB:
+        return 8 * MB
+    if size <= 512 * MB:
+        return 32 * MB
+    return 64 * MB
+
+def load_session(state_path, size):
+    """The saved resumable session for a file of ``size`` bytes, if any."""
+    try:
+        state = json.loads(state_path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if state.get("size") != size or not state.get("session_uri"):
+        return None
+    return state
+
+def save_session(state_path, **state):
+    write_atomic(state_path, json.dumps(state, indent=2, sort_keys=True))
+
+def query_session(creds, session_uri, size):
+    """
+    Ask Drive how much of an interrupted resumable upload it has stored.
+
+    Returns ("complete", file id), ("partial", next byte to send) or
+    ("expired", None) when the session is gone (Drive keeps them about a
+    week). Other failures raise, so the session is kept for the next run.
+    """
+    session = AuthorizedSession(creds)
+    response = send_with_retries(session, "PUT", session_uri, lambda: {
+        "headers": {"Content-Range": f"bytes */{size}"}, "data": b"",
+    })
+    if response.status_code in (200, 201):
+        return "complete", response.json().get("id")
+    if response.status_code == 308:
+        received = response.headers.get("Range", "")
+        return "partial", int(received.split("-")[-1]) + 1 if received.startswith("bytes=") else 0
+    if response.status_code in (404, 410):
+        return "expired", None
+    raise RuntimeError(f"Could not query the upload session: HTTP {response.status_code}")
+
+def upload_file(service, file_path, folder_id, state_path=None, creds=None):
+    """
+    Upload one file as a new Drive file.
+
+    With ``state_path``, a resumable upload saves its session URI and the
+    offset Drive has acknowledged after every chunk, and continues an
+    interrupted session saved there by an earlier run (queried with ``creds``).
+    Returns (Drive file id, seconds, bytes sent).
+    """
+    size = file_path.stat().st_size
+    start = time.perf_counter()
+    if size <= SIMPLE_UPLOAD_MAX:
+        # One request; a resumable session would add a round trip
+        media = MediaFileUpload(str(file_path), resumable=False)
     else:
-        query = f"name = '{name}' and '{folder_id}' in parents and trashed = false"
-    
-    response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-    return response.get('files', [])
+        media = MediaFileUpload(str(file_path), chunksize=chunk_size_for(size), resumable=True)
+
+    file_metadata = {
+        "name": file_path.name,
+        "parents": [folder_id] if folder_id else []
+    }
+    request = service.files().create(body=file_metadata, media_body=media, fields="id")
+
+    if not media.resumable():
+        response = request.execute(num_retries=UPLOAD_RETRIES)
+        return response.get("id"), time.perf_counter() - start, size
 
-def upload_files(folder_id, local_dir="output"):
-    """Upload all files from local_dir to Google Drive if they don't exist."""
-    service = get_gdrive_service()
-    if not service:
-        return
+    offset = 0
+    state = load_session(state_path, size) if state_path else None
+    if state:
+        status, value = query_session(creds, state["session_uri"], size)
+        if status == "complete":
+            print(f"{file_path.name} finished uploading in an earlier run")
+            state_path.unlink(missing_ok=True)
+            return value, time.perf_counter() - start, 0
+        if status == "partial":
+            offset = value
+            request.resumable_uri = state["session_uri"]
+            request.resumable_progress = offset
+            print(f"Resuming {file_path.name} at {offset / MB:.1f}/{size / MB:.1f} MiB")
+        else:
+            print(f"Upload session of {file_path.name} expired, starting over")
+            state_path.unlink(missing_ok=True)
+
+    response = None
+    while response is None:
+        _, response = request.next_chunk(num_retries=UPLOAD_RETRIES)
+        if response is None and state_path:
+            save_session(state_path, session_uri=request.resumable_uri, offset=request.resumable_progress,
+                         size=size, name=file_path.name)
+    if state_path:
+        state_path.unlink(missing_ok=True)
+    return response.get("id"), time.perf_counter() - start, size - offset
+
+class DriveUploader:
+    """
+    Uploads single files into one Drive folder; safe to share between threads.
+
+    A file whose request manifest records an upload of the same content to
+    the same folder is skipped without asking Drive. Otherwise the folder
+    listing (fetched once, on first use) decides: a file whose md5 and size
+    match a Drive file is skipped and the rest are uploaded as new files.
+    Drive files are never overwritten, so a local file sharing a name with
+    an earlier render is uploaded next to it. Forcing the "drive" stage
+    uploads everything again.
+    """
+
+    def __init__(self, folder_id, creds, manifest_dir=Path("output/manifests"), force=frozenset()):
+        self.folder_id = folder_id
+        self.creds = creds
+        self.manifest_dir = Path(manifest_dir)
+        self.force = force
+        self.forced = "drive" in force or "all" in force
+        self._index = None
+        self._lock = threading.Lock()
+        # googleapiclient services are not thread-safe: one per thread
+        self._local = threading.local()
+
+    def service(self):
+        if not hasattr(self._local, "service"):
+            self._local.service = get_gdrive_service(self.creds)
+        return self._local.service
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = {} if self.forced else list_folder(self.service(), self.folder_id)
+                if not self.forced:
+                    print(f"Drive folder holds {len(self._index)} file(s) with a checksum")
+            return self._index
+
+    def upload(self, file_path):
+        """Upload ``file_path`` unless Drive has it already; returns the bytes sent."""
+        file_path = Path(file_path)
+        manifest = StageManifest.owner(file_path, root=self.manifest_dir, force=self.force)
+        digest = input_hash(file_path, folder_id=self.folder_id)
+        if manifest and manifest.done("drive", digest, item=file_path.name):
+            print(f"Skipping {file_path.name} (uploaded in an earlier run)")
+            return 0
+
+        by_md5 = self.index()
+        size = file_path.stat().st_size
+        content = (file_digest(file_path, "md5"), size)
+        if not self.forced:
+            with self._lock:
+                existing = by_md5.get(content)
+            if existing:
+                print(f"Skipping {file_path.name} (same content on Drive as {existing['name']})")
+                if manifest:
+                    manifest.record("drive", digest, item=file_path.name, drive_file_id=existing["id"])
+                return 0
+
+        # Same content to the same folder: an interrupted session can be picked up again
+        state_path = self.manifest_dir / SESSION_DIR / f"{cache_key(digest=digest)[:24]}.json"
+        print(f"Uploading {file_path.name} ({size / MB:.1f} MiB)...")
+        file_id, seconds, sent = upload_file(self.service(), file_path, self.folder_id, state_path, self.creds)
+        print(f"Uploaded {file_path.name} in {seconds:.1f}s ({sent / MB / max(seconds, 1e-6):.2f} MiB/s), "
+              f"Drive File ID: {file_id}")
+        with self._lock:
+            by_md5[content] = {"id": file_id, "name": file_path.name}
+        if manifest:
+            manifest.record("drive", digest, item=file_path.name, drive_file_id=file_id)
+        return sent
+
+def upload_files(folder_id, local_dir="output", force=frozenset(), workers=UPLOAD_WORKERS):
+    """
+    Upload all files from local_dir to Google Drive if their content is not
+    there yet (see DriveUploader), ``workers`` at a time. Returns the number
+    of files that failed to upload.
+    """
+    creds = get_credentials()
+    if not creds:
+        return 0
 
     output_path = Path(local_dir)
     if not output_path.exists():
         print(f"Warning: Directory {local_dir} does not exist.")
-        return
+        return 0
 
     # Use rglob for recursive searching (correct way for pathlib)
-    files_to_upload = list(output_path.rglob("*.wav")) + list(output_path.rglob("*.mp4"))
+    files_to_upload = [
+        path for pattern in ("*.wav", "*.flac", "*.mp3", "*.opus", "*.mp4")
+        for path in output_path.rglob(pattern)
+    ]
     
     if not files_to_upload:
         print("No files found to upload.")
-        return
+        return 0
 
-    for file_path in files_to_upload:
-        # Check if already exists to ensure sync logic
-        existing_files = check_file_exists(service, file_path.name, folder_id)
-        if existing_files:
-            print(f"Skipping {file_path.name} (already exists on Drive)")
-            continue
-
-        print(f"Uploading {file_path.name}...")
-        
-        file_metadata = {
-            "name": file_path.name,
-            "parents": [folder_id] if folder_id else []
-        }
-        
-        media = MediaFileUpload(str(file_path), resumable=True)
-        
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields="id"
-        ).execute()
-        
-        print(f"Uploaded! Drive File ID: {file.get('id')}")
+    uploader = DriveUploader(folder_id, creds, output_path / "manifests", force)
+    start = time.perf_counter()
+    total = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(uploader.upload, path): path for path in files_to_upload}
+        for future in as_completed(futures):
+            try:
+                total += future.result()
+            except Exception as e:
+                print(f"Upload of {futures[future].name} failed: {e}")
+                failed += 1
+    if total or failed:
+        seconds = time.perf_counter() - start
+        print(f"Uploaded {total / MB:.1f} MiB in {seconds:.1f}s ({total / MB / max(seconds, 1e-6):.2f} MiB/s overall), "
+              f"{failed} of {len(files_to_upload)} file(s) failed")
+    return failed
 
 if __name__ == "__main__":
+    force = pop_force_stages(sys.argv)
     folder_id = os.environ.get("GOOGLE_DRIVE_FOLDER_ID")
     local_dir = "output"
     
     if len(sys.argv) > 1:
         local_dir = sys.argv[1]
         
-    upload_files(folder_id, local_dir)
+    failed = upload_files(folder_id, local_dir, force=force)
+    sys.exit(1 if failed else 0)
@@ -5,20 +5,11 @@ echo "FULL SYSTEM VALIDATION"
 echo "=========================="
 echo ""
 
-# 1. JSON Schema
-echo "1. JSON Schema Validation..."
-python3 scripts/validate_request.py requests/silhouettes_indie.json
+# 1-2. JSON Schema and LRC Format
+echo "1. JSON Schema and LRC Format Validation..."
+python3 scripts/export_schema.py --check && python3 scripts/validate_batch.py requests/
 if [ $? -ne 0 ]; then
-    echo "JSON validation failed"
-    exit 1
-fi
-echo ""
-
-# 2. LRC Format
-echo "2. LRC Format Validation..."
-python3 scripts/test_lrc.py requests/silhouettes_indie.json
-if [ $? -ne 0 ]; then
-    echo "LRC validation failed"
+    echo "Request validation failed"
     exit 1
 fi
 echo ""
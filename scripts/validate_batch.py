@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Validate many requests in one process and write a machine-readable report.
+
+Replaces running validate_request.py, test_lrc.py and dry_run.py once per
+file: the JSON schema is loaded and compiled once, and every request is
+parsed once and goes through the schema (generated from src/models.py,
+so it covers the duration range too), lyrics/structure checks and the
+stage 1 token budget in a single pass. Inputs are request files,
+directories of them and JSONL streams (``-`` reads JSONL from stdin).
+Batches of PARALLEL_MIN requests or more are spread over worker processes.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from jsonschema.validators import validator_for
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from budget import DEFAULT_DURATION, plan_budget, section_tags
+from lyrics_parser import parse_request, to_yue, validate as validate_timeline
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schemas" / "request.json"
+PARALLEL_MIN = 256
+CHUNK_SIZE = 64
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+
+_validator = None
+
+
+def compiled_validator(schema_path: Path = SCHEMA_PATH):
+    """The request schema's validator, built once per process."""
+    global _validator
+    if _validator is None:
+        schema = json.loads(Path(schema_path).read_text())
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        _validator = cls(schema)
+    return _validator
+
+
+def _error(check: str, message: str, path: str = "") -> dict:
+    return {"check": check, "path": path, "message": message}
+
+
+def check_request(source: str, raw: Union[bytes, str, None]) -> dict:
+    """
+    All checks for one request. Returns ``{"source", "request_id", "valid",
+    "errors"}`` plus the lyrics format and line counts when they parse.
+    """
+    result = {"source": source, "request_id": None, "valid": False, "errors": []}
+    errors = result["errors"]
+    if raw is None:
+        errors.append(_error("json", "file not found"))
+        return result
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        errors.append(_error("json", str(e)))
+        return result
+    if not isinstance(data, dict):
+        errors.append(_error("json", "request is not a JSON object"))
+        return result
+    result["request_id"] = data.get("request_id")
+
+    schema_errors = sorted(compiled_validator().iter_errors(data), key=lambda e: list(map(str, e.absolute_path)))
+    errors.extend(_error("schema", e.message, "/".join(map(str, e.absolute_path))) for e in schema_errors)
+
+    # A schema error on lyrics/structure (or neither being present) already
+    # says what the lyrics check would
+    lyrics_reported = any(
+        (e.absolute_path and e.absolute_path[0] in ("lyrics", "structure")) or
+        (not e.absolute_path and e.validator == "anyOf")
+        for e in schema_errors
+    )
+    if not lyrics_reported:
+        try:
+            timeline = parse_request(data)
+            result.update(format=timeline.source, sections=len(timeline.sections),
+                          lines=len(timeline.lines), timed_lines=len(timeline.timed_lines))
+            errors.extend(_error("lyrics", message) for message in validate_timeline(timeline))
+        except Exception as e:
+            errors.append(_error("lyrics", f"{e.__class__.__name__}: {e}"))
+        else:
+            # The sections must be able to carry the requested length
+            if not errors:
+                try:
+                    plan_budget(data.get("duration", DEFAULT_DURATION), section_tags(to_yue(timeline)))
+                except ValueError as e:
+                    errors.append(_error("budget", str(e), "duration"))
+
+    result["valid"] = not errors
+    return result
+
+
+def _check_item(item: Tuple[str, Optional[bytes]]) -> dict:
+    return check_request(*item)
+
+
+def _jsonl(name: str, stream) -> Iterator[Tuple[str, bytes]]:
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            yield f"{name}:{number}", line
+
+
+def iter_inputs(values: Iterable[str]) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """(source, raw JSON) for every request in the given files, directories and streams."""
+    for value in values:
+        if value == "-":
+            yield from _jsonl("stdin", sys.stdin.buffer)
+            continue
+        path = Path(value)
+        if path.is_dir():
+            for child in sorted(path.glob("*.json")):
+                yield str(child), child.read_bytes()
+        elif path.suffix.lower() in JSONL_SUFFIXES:
+            with open(path, "rb") as f:
+                yield from _jsonl(str(path), f)
+        elif path.is_file():
+            yield str(path), path.read_bytes()
+        else:
+            yield str(path), None
+
+
+def validate_batch(items: Iterable[Tuple[str, Optional[bytes]]], workers: int = 1) -> List[dict]:
+    """Check every item, in worker processes once the batch is large enough."""
+    items = list(items)
+    if workers > 1 and len(items) >= PARALLEL_MIN:
+        with ProcessPoolExecutor(max_workers=workers, initializer=compiled_validator) as pool:
+            return list(pool.map(_check_item, items, chunksize=CHUNK_SIZE))
+    return [_check_item(item) for item in items]
+
+
+def build_report(results: List[dict], seconds: float, workers: int) -> dict:
+    valid = sum(result["valid"] for result in results)
+    return {
+        "schema": str(SCHEMA_PATH),
+        "total": len(results),
+        "valid": valid,
+        "invalid": len(results) - valid,
+        "seconds": round(seconds, 3),
+        "workers": workers,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Request files, directories or JSONL files ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help=f"Worker processes for batches of {PARALLEL_MIN}+ requests")
+    parser.add_argument("--report", type=Path, help="Write the JSON report here")
+    parser.add_argument("--json", action="store_true", help="Print the JSON report instead of a summary")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = validate_batch(iter_inputs(args.inputs), max(1, args.workers))
+    report = build_report(results, time.perf_counter() - start, max(1, args.workers))
+
+    if args.report:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        args.report.write_text(json.dumps(report, indent=2))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for result in results:
+            if result["valid"]:
+                continue
+            print(f"Invalid: {result['source']} ({result['request_id'] or 'no request_id'})")
+            for error in result["errors"][:10]:
+                where = f" at {error['path']}" if error["path"] else ""
+                print(f"  - [{error['check']}]{where} {error['message']}")
+            if len(result["errors"]) > 10:
+                print(f"  ... and {len(result['errors']) - 10} more errors")
+        print(f"{report['valid']}/{report['total']} requests valid in {report['seconds']:.2f}s")
+    sys.exit(0 if report["invalid"] == 0 else 1)
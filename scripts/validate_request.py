@@ -6,13 +6,17 @@ import json
 from pathlib import Path
 from jsonschema import validate, ValidationError
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from manifest import StageManifest, input_hash, pop_force_stages
 
-def validate_request(json_file: str) -> bool:
+
+def validate_request(json_file: str, force: set = frozenset()) -> bool:
     """
     Validate request JSON against schema.
     
     Args:
         json_file: Path to JSON file
+        force: Stages to run even if the manifest says they are done
         
     Returns:
         True if valid, raises exception otherwise
@@ -26,10 +30,18 @@ def validate_request(json_file: str) -> bool:
     with open(json_file) as f:
         request = json.load(f)
     
+    # Same request and schema as a previous successful run
+    digest = input_hash(json_file, schema_path)
+    manifest = StageManifest(request.get("request_id", "unknown"), force=force)
+    if manifest.done("validate", digest, item="schema"):
+        print(f"Valid (unchanged since last run): {json_file}")
+        return True
+    
     # Validate
     try:
         validate(instance=request, schema=schema)
         print(f"✅ Valid: {json_file}")
+        manifest.record("validate", digest, item="schema")
         return True
     except ValidationError as e:
         print(f"Invalid: {json_file}")
@@ -38,12 +50,13 @@ def validate_request(json_file: str) -> bool:
 
 
 if __name__ == "__main__":
+    force = pop_force_stages(sys.argv)
     if len(sys.argv) != 2:
-        print("Usage: python validate_request.py <json_file>")
+        print("Usage: python validate_request.py <json_file> [--force-stage validate]")
         sys.exit(1)
     
     try:
-        validate_request(sys.argv[1])
+        validate_request(sys.argv[1], force=force)
     except Exception as e:
         print(f"Validation failed: {e}")
         sys.exit(1)
@@ -0,0 +1,132 @@
+"""Generated audio handed over as files on a shared volume.
+
+Instead of returning the song as ``bytes`` through every Modal call, the
+worker writes it once to the ``musicmaker-artifacts`` volume and returns an
+``Artifact`` handle (volume, path, size, sha256, format). Clients stream the
+file from the volume straight to disk and check size and checksum on the
+way, so no hop holds more than one chunk in memory.
+
+Files are content-addressed by sha256, so the same song is stored once, and
+the store is a ``ResultCache`` so old artifacts are evicted by LRU.
+"""
+
+import hashlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from result_cache import ResultCache
+
+HASH_CHUNK = 8 * 1024 * 1024
+DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+
+# Leading bytes -> format, for audio whose producer does not say
+_MAGIC = [
+    (b"RIFF", "wav"),
+    (b"fLaC", "flac"),
+    (b"OggS", "ogg"),
+    (b"ID3", "mp3"),
+    (b"\xff\xfb", "mp3"),
+    (b"\xff\xf3", "mp3"),
+    (b"\xff\xf2", "mp3"),
+]
+
+
+def sniff_format(head: bytes) -> str:
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return "bin"
+
+
+@dataclass
+class Artifact:
+    """Handle to a file on a Modal volume."""
+    volume: str
+    path: str
+    size: int
+    sha256: str
+    format: str
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Artifact":
+        return cls(**{name: data[name] for name in cls.__dataclass_fields__})
+
+
+class ArtifactStore:
+    """Content-addressed artifact files under ``root`` (the volume mount)."""
+
+    def __init__(
+        self,
+        root: Path,
+        volume_name: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        commit: Optional[Callable[[], None]] = None,
+    ):
+        self.root = Path(root)
+        self.volume_name = volume_name
+        self.files = ResultCache(self.root, max_bytes=max_bytes, commit=commit)
+
+    def _artifact(self, path: Path, digest: str, size: int, fmt: str) -> Artifact:
+        return Artifact(
+            volume=self.volume_name,
+            path=str(path.relative_to(self.root)),
+            size=size,
+            sha256=digest,
+            format=fmt,
+        )
+
+    def put_bytes(self, data: bytes, fmt: Optional[str] = None) -> Artifact:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.files.put(digest, data)
+        return self._artifact(path, digest, len(data), fmt or sniff_format(data[:4]))
+
+    def put_file(self, src: Path, fmt: Optional[str] = None) -> Artifact:
+        """Hash and copy ``src`` chunk by chunk."""
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        with open(src, "rb") as f:
+            while chunk := f.read(HASH_CHUNK):
+                if not head:
+                    head = chunk[:4]
+                digest.update(chunk)
+                size += len(chunk)
+        path = self.files.put_file(digest.hexdigest(), src)
+        return self._artifact(path, digest.hexdigest(), size, fmt or sniff_format(head))
+
+
+def download_artifact(artifact: Union[Artifact, dict], dest: Path) -> Path:
+    """
+    Stream an artifact from its volume into ``dest``.
+
+    The file is written to ``dest.part`` and renamed once size and sha256 match.
+    """
+    import modal
+
+    if isinstance(artifact, dict):
+        artifact = Artifact.from_dict(artifact)
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_name(dest.name + ".part")
+
+    digest = hashlib.sha256()
+    size = 0
+    volume = modal.Volume.from_name(artifact.volume)
+    with open(tmp_path, "wb") as f:
+        for chunk in volume.read_file(artifact.path):
+            f.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+
+    if size != artifact.size or digest.hexdigest() != artifact.sha256:
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(
+            f"Artifact {artifact.path} is corrupt: got {size} bytes / {digest.hexdigest()[:12]}, "
+            f"expected {artifact.size} bytes / {artifact.sha256[:12]}"
+        )
+    tmp_path.replace(dest)
+    return dest
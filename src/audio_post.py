@@ -0,0 +1,298 @@
+"""Silence trim and loudness normalisation of generated WAV files.
+
+YuE songs come out with leading and trailing silence and uneven loudness.
+``postprocess_wav`` reads the WAV through a memory map in fixed-size chunks
+and makes two passes over it:
+
+1. analysis: per 100 ms block K-weighted power (for BS.1770 integrated
+   loudness with the -70 LUFS absolute and -10 LU relative gates) and per
+   10 ms window peaks (for the silence boundaries and the sample peak);
+2. output: the kept range, scaled to the target loudness (never above the
+   peak ceiling) with short fades at the cut points, written chunk by chunk.
+
+Memory use depends on the chunk size, not on the song length. The K-weighting
+is applied as a magnitude response to each block's spectrum, which filters
+every 100 ms block on its own. Against a time-domain BS.1770 meter (the same
+filters run with scipy's lfilter) the measured difference is about 1e-5 LU
+on broadband noise and on harmonic tones from 110 Hz up, and 0.16-0.18 LU
+on synthetic music with strong 41-55 Hz bass. Signals with most of their
+energy below the 38 Hz high-pass read up to 3 LU high.
+"""
+
+import math
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+TARGET_LUFS = -14.0
+PEAK_CEILING_DB = -1.0
+SILENCE_DB = -50.0
+LEAD_PAD_SECONDS = 0.1
+TAIL_PAD_SECONDS = 1.0
+FADE_IN_SECONDS = 0.01
+FADE_OUT_SECONDS = 0.5
+CHUNK_SECONDS = 10.0
+
+_PCM = 1
+_FLOAT = 3
+_EXTENSIBLE = 0xFFFE
+
+
+@dataclass
+class WavInfo:
+    """Sample layout of a WAV file's ``data`` chunk."""
+    format: int
+    channels: int
+    sample_rate: int
+    bits: int
+    data_offset: int
+    frames: int
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.bits // 8
+
+
+@dataclass
+class PostprocessReport:
+    """What ``postprocess_wav`` measured and changed; times in milliseconds."""
+    input_lufs: Optional[float]
+    output_lufs: Optional[float]
+    gain_db: float
+    peak_db: Optional[float]
+    lead_trim_ms: int
+    tail_trim_ms: int
+    duration_ms: int
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def read_wav_info(path: Path) -> WavInfo:
+    """Parse the RIFF header of ``path`` (PCM 16/24/32-bit or 32-bit float)."""
+    size = Path(path).stat().st_size
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size + (chunk_size & 1))
+                tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == _EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path} has data before its fmt chunk")
+                tag, channels, rate, bits = fmt
+                if (tag, bits) not in ((_PCM, 16), (_PCM, 24), (_PCM, 32), (_FLOAT, 32)):
+                    raise ValueError(f"Unsupported WAV sample format {tag}/{bits}-bit in {path}")
+                offset = f.tell()
+                # Streamed WAVs may carry a placeholder size
+                data_size = min(chunk_size, size - offset)
+                block_align = channels * bits // 8
+                return WavInfo(tag, channels, rate, bits, offset, data_size // block_align)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def _open_samples(path: Path, info: WavInfo) -> np.memmap:
+    if info.bits == 24:
+        return np.memmap(path, np.uint8, "r", info.data_offset, (info.frames, info.channels * 3))
+    dtype = {16: "<i2", 32: "<f4" if info.format == _FLOAT else "<i4"}[info.bits]
+    return np.memmap(path, np.dtype(dtype), "r", info.data_offset, (info.frames, info.channels))
+
+
+def _decode(raw: np.ndarray, info: WavInfo) -> np.ndarray:
+    """Samples of one chunk as float32 in [-1, 1), shape (frames, channels)."""
+    if info.format == _FLOAT:
+        return np.asarray(raw, dtype=np.float32)
+    if info.bits == 24:
+        b = raw.reshape(len(raw), info.channels, 3).astype(np.int32)
+        ints = (b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)) << 8 >> 8
+        return ints.astype(np.float32) / 8388608.0
+    return raw.astype(np.float32) / float(2 ** (info.bits - 1))
+
+
+def _encode(samples: np.ndarray, info: WavInfo) -> bytes:
+    if info.format == _FLOAT:
+        return np.clip(samples, -1.0, 1.0).astype("<f4").tobytes()
+    scale = 2 ** (info.bits - 1)
+    ints = np.clip(np.rint(samples * scale), -scale, scale - 1).astype(np.int32)
+    if info.bits == 24:
+        packed = ints.astype("<i4").view(np.uint8).reshape(len(ints), info.channels, 4)[..., :3]
+        return packed.tobytes()
+    return ints.astype("<i2" if info.bits == 16 else "<i4").tobytes()
+
+
+def _wav_header(info: WavInfo, frames: int) -> bytes:
+    data_size = frames * info.block_align
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, info.format, info.channels, info.sample_rate,
+        info.sample_rate * info.block_align, info.block_align, info.bits,
+        b"data", data_size,
+    )
+
+
+def k_weighting_power(sample_rate: int, block: int) -> np.ndarray:
+    """
+    |H(f)|^2 of the BS.1770 K-weighting filter at the ``rfft`` bins of a
+    ``block``-sample block, times the one-sided spectrum weights.
+    """
+    # Pre-filter (high shelf) and RLB (high pass), designed for any rate so
+    # that 48 kHz reproduces the coefficients in the standard
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    pass_b = [1.0, -2.0, 1.0]
+    pass_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    z = np.exp(-1j * 2 * np.pi * np.arange(block // 2 + 1) / block)
+
+    def response(b, a):
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+    power = np.abs(response(shelf_b, shelf_a) * response(pass_b, pass_a)) ** 2
+    weights = np.full(len(power), 2.0)
+    weights[0] = 1.0
+    if block % 2 == 0:
+        weights[-1] = 1.0
+    return power * weights / (block * block)
+
+
+def integrated_loudness(block_power: np.ndarray) -> Optional[float]:
+    """
+    Gated loudness in LUFS from per-100 ms mean-square powers of shape
+    (blocks, channels). Returns None when every 400 ms block is gated out.
+    """
+    if len(block_power) < 4:
+        return None
+    # 400 ms blocks with 75 % overlap
+    cumulative = np.concatenate([np.zeros((1, block_power.shape[1])), np.cumsum(block_power, axis=0)])
+    z = (cumulative[4:] - cumulative[:-4]) / 4
+    total = z.sum(axis=1)
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(total)
+    gated = total[loudness > -70.0]
+    if not len(gated):
+        return None
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    gated = total[(loudness > -70.0) & (loudness > relative)]
+    if not len(gated):
+        return None
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def analyze(path: Path, chunk_seconds: float = CHUNK_SECONDS) -> Tuple[WavInfo, np.ndarray, np.ndarray, int]:
+    """
+    One chunked pass over ``path``: per 100 ms K-weighted block powers,
+    per-window peaks and the window length in frames.
+    """
+    info = read_wav_info(path)
+    window = max(1, info.sample_rate // 100)
+    block = window * 10
+    chunk = block * max(1, round(chunk_seconds * 10))
+    weights = k_weighting_power(info.sample_rate, block)
+
+    samples = _open_samples(path, info)
+    powers, peaks = [], []
+    for start in range(0, info.frames, chunk):
+        x = _decode(samples[start:start + chunk], info)
+
+        n_blocks = len(x) // block
+        if n_blocks:
+            spectrum = np.fft.rfft(x[:n_blocks * block].reshape(n_blocks, block, info.channels), axis=1)
+            powers.append(np.einsum("bfc,f->bc", np.abs(spectrum) ** 2, weights))
+
+        n_windows = len(x) // window
+        magnitude = np.abs(x)
+        peaks.append(magnitude[:n_windows * window].reshape(n_windows, window * info.channels).max(axis=1))
+        if len(x) % window:
+            peaks.append(magnitude[n_windows * window:].max(keepdims=True).ravel())
+    del samples
+
+    power = np.concatenate(powers) if powers else np.zeros((0, info.channels))
+    peak = np.concatenate(peaks) if peaks else np.zeros(0)
+    return info, power, peak, window
+
+
+def postprocess_wav(
+    src: Path,
+    dest: Path,
+    target_lufs: Optional[float] = TARGET_LUFS,
+    trim: bool = True,
+    silence_db: float = SILENCE_DB,
+    ceiling_db: float = PEAK_CEILING_DB,
+    chunk_seconds: float = CHUNK_SECONDS,
+) -> PostprocessReport:
+    """
+    Write ``src`` to ``dest`` without its leading/trailing silence and at
+    ``target_lufs`` (None keeps the level), in one streaming pass after
+    the analysis pass. ``src`` and ``dest`` must differ.
+    """
+    info, power, peaks, window = analyze(src, chunk_seconds)
+    rate = info.sample_rate
+
+    start, end = 0, info.frames
+    loud = np.flatnonzero(peaks > 10 ** (silence_db / 20))
+    if trim and len(loud):
+        start = max(0, int(loud[0]) * window - round(LEAD_PAD_SECONDS * rate))
+        end = min(info.frames, (int(loud[-1]) + 1) * window + round(TAIL_PAD_SECONDS * rate))
+
+    kept = peaks[start // window:-(-end // window)]
+    peak = float(kept.max()) if len(kept) else 0.0
+    # None for digital silence, like the loudness (-inf is not valid JSON)
+    peak_db = 20 * math.log10(peak) if peak > 0 else None
+
+    input_lufs = integrated_loudness(power)
+    gain_db = 0.0
+    if target_lufs is not None and input_lufs is not None:
+        gain_db = target_lufs - input_lufs
+        if peak_db is not None:
+            gain_db = min(gain_db, ceiling_db - peak_db)
+    gain = 10 ** (gain_db / 20)
+
+    fade_in = min(round(FADE_IN_SECONDS * rate), end - start) if start > 0 else 0
+    fade_out = min(round(FADE_OUT_SECONDS * rate), end - start) if end < info.frames else 0
+    chunk = window * 10 * max(1, round(chunk_seconds * 10))
+
+    samples = _open_samples(src, info)
+    with open(dest, "wb") as out:
+        out.write(_wav_header(info, end - start))
+        for offset in range(start, end, chunk):
+            x = _decode(samples[offset:min(offset + chunk, end)], info) * gain
+            position = np.arange(offset - start, offset - start + len(x))
+            if fade_in and position[0] < fade_in:
+                x *= np.minimum(1.0, position / fade_in).astype(np.float32)[:, None]
+            if fade_out and position[-1] >= end - start - fade_out:
+                x *= np.minimum(1.0, (end - start - 1 - position) / fade_out).astype(np.float32)[:, None]
+            out.write(_encode(x, info))
+    del samples
+
+    return PostprocessReport(
+        input_lufs=None if input_lufs is None else round(input_lufs, 2),
+        output_lufs=None if input_lufs is None else round(input_lufs + gain_db, 2),
+        gain_db=round(gain_db, 2),
+        peak_db=None if peak_db is None else round(peak_db + gain_db, 2),
+        lead_trim_ms=round(start * 1000 / rate),
+        tail_trim_ms=round((info.frames - end) * 1000 / rate),
+        duration_ms=round((end - start) * 1000 / rate),
+    )
@@ -0,0 +1,85 @@
+"""Duration- and structure-aware token budgeting for YuE stage 1.
+
+Stage 1 emits interleaved vocal/instrumental xcodec ids at 50 frames per
+second each, so every second of audio costs 100 tokens. Instead of a fixed
+``--run_n_segments 2 --max_new_tokens 3000`` the planner spreads the
+requested duration over the lyric sections, weighting short sections
+(intro, outro) lower, and caps the total so generation stops once the
+target length is reached. Each lyric section is one stage 1 segment of at
+most MAX_SEGMENT_SECONDS, so a request whose sections cannot carry its
+duration is rejected rather than silently cut short.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List
+
+TOKENS_PER_SECOND = 100
+
+# Song length for requests that leave out ``duration``. It lives here rather
+# than in models.py because yue_image cannot import models (xcodec_mini_infer
+# ships its own "models" package); SongRequest takes its default from here.
+DEFAULT_DURATION = 95
+
+# A segment shorter than this is not worth a separate stage 1 pass
+MIN_SEGMENT_SECONDS = 8
+# YuE is trained on ~30 s segments; longer ones lose coherence
+MAX_SEGMENT_SECONDS = 60
+
+SECTION_WEIGHTS = {
+    "intro": 0.5,
+    "outro": 0.5,
+    "bridge": 0.75,
+    "instrumental": 0.75,
+}
+
+
+@dataclass
+class TokenBudget:
+    """Stage 1 plan for one request."""
+    sections: List[str]
+    segment_tokens: List[int]
+    target_tokens: int
+
+    @property
+    def planned_seconds(self) -> float:
+        return min(sum(self.segment_tokens), self.target_tokens) / TOKENS_PER_SECOND
+
+
+def section_tags(lyrics: str) -> List[str]:
+    """Section tags in YuE-formatted lyrics, in order (same pattern as infer.py)."""
+    return [tag.lower() for tag in re.findall(r"\[(\w+)\]", lyrics)]
+
+
+def plan_budget(duration: int, sections: List[str]) -> TokenBudget:
+    """
+    Derive segment count and per-segment token limits for ``duration`` seconds.
+
+    Args:
+        duration: Requested song length in seconds
+        sections: Section tags in lyric order, e.g. ["verse", "chorus"]
+
+    Raises:
+        ValueError: if the sections cannot carry ``duration`` seconds
+    """
+    sections = sections or ["verse"]
+    max_segments = max(1, int(duration // MIN_SEGMENT_SECONDS))
+    used = sections[:max_segments]
+
+    target_tokens = int(duration * TOKENS_PER_SECOND)
+    weights = [SECTION_WEIGHTS.get(tag, 1.0) for tag in used]
+    total_weight = sum(weights)
+
+    segment_tokens = []
+    for weight in weights:
+        tokens = round(target_tokens * weight / total_weight)
+        tokens = max(MIN_SEGMENT_SECONDS * TOKENS_PER_SECOND, min(tokens, MAX_SEGMENT_SECONDS * TOKENS_PER_SECOND))
+        segment_tokens.append(tokens)
+
+    budget = TokenBudget(sections=used, segment_tokens=segment_tokens, target_tokens=target_tokens)
+    if budget.planned_seconds < duration - 1:
+        raise ValueError(
+            f"{len(used)} lyric section(s) can only carry {budget.planned_seconds:.0f}s of the requested "
+            f"{duration}s (at most {MAX_SEGMENT_SECONDS}s each); add sections or shorten the song"
+        )
+    return budget
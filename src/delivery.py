@@ -0,0 +1,216 @@
+"""HTTP plumbing shared by the webhook and Telegram delivery scripts.
+
+- ``MultipartStream``: a multipart/form-data body with a known length that
+  reads files from disk as it is sent, so memory use does not grow with the
+  files being uploaded;
+- ``FileSlice``: a byte range of a file as a streamed request body;
+- ``pooled_session``: one ``requests.Session`` whose connections are reused
+  by every upload thread;
+- ``send_with_retries``: retries with exponential backoff and jitter,
+  honouring ``Retry-After`` (or a caller-supplied rate-limit hint) through
+  a ``RateLimiter`` shared by all workers.
+"""
+
+import mimetypes
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+READ_CHUNK = 1024 * 1024
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# (connect, read) seconds; the read timeout covers the server's answer to a whole upload
+DEFAULT_TIMEOUT = (10, 600)
+
+
+class MultipartStream:
+    """multipart/form-data body streamed from disk, with Content-Length known upfront."""
+
+    def __init__(
+        self,
+        fields: Sequence[Tuple[str, str]] = (),
+        files: Sequence[Tuple[str, Union[str, Path], Optional[str]]] = (),
+        boundary: Optional[str] = None,
+    ):
+        """
+        Args:
+            fields: (name, value) form fields
+            files: (field name, path, file name or None) parts; names may repeat
+            boundary: multipart boundary (random by default)
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self._parts: List[Union[bytes, Path]] = []
+        for name, value in fields:
+            self._parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'.encode()
+                + str(value).encode() + b"\r\n"
+            )
+        for name, path, filename in files:
+            path = Path(path)
+            filename = filename or path.name
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            self._parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"; '
+                f'filename="{_quote(filename)}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+            )
+            self._parts.append(path)
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+        self.length = sum(len(p) if isinstance(p, bytes) else p.stat().st_size for p in self._parts)
+        self._chunks = None
+        self._buffer = b""
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            with open(part, "rb") as f:
+                while chunk := f.read(READ_CHUNK):
+                    yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if self._chunks is None:
+            self._chunks = iter(self)
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class FileSlice:
+    """Bytes ``[start, start + length)`` of a file as a streamed request body."""
+
+    def __init__(self, path: Union[str, Path], start: int, length: int):
+        self.path = Path(path)
+        self.start = start
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        remaining = self.length
+        with open(self.path, "rb") as f:
+            f.seek(self.start)
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\r", " ").replace("\n", " ")
+
+
+def pooled_session(pool_size: int = 8) -> requests.Session:
+    """Session keeping up to ``pool_size`` connections per host alive for reuse."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RateLimiter:
+    """
+    Spaces requests at least ``min_interval`` seconds apart and lets any
+    worker pause all of them after a rate-limit answer.
+    """
+
+    def __init__(self, min_interval: float = 0.0):
+        self.min_interval = min_interval
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at)
+            self._next_at = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter for retry number ``attempt`` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_header(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def send_with_retries(
+    session: requests.Session,
+    method: str,
+    url: str,
+    build: Callable[[], dict],
+    retries: int = 5,
+    base_delay: float = 1.0,
+    limiter: Optional[RateLimiter] = None,
+    retry_after: Callable[[requests.Response], Optional[float]] = retry_after_header,
+    timeout=DEFAULT_TIMEOUT,
+) -> requests.Response:
+    """
+    Send a request, retrying connection errors and ``RETRY_STATUSES``.
+
+    ``build`` returns the keyword arguments of ``session.request`` and is
+    called again for every attempt, so streamed bodies start from the
+    beginning. Returns the last response (successful or not); raises the
+    last connection error if no attempt got a response.
+    """
+    limiter = limiter or RateLimiter()
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            response = session.request(method, url, timeout=timeout, **build())
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            # The URL is not printed: bot tokens are part of it
+            print(f"{method} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        hint = retry_after(response)
+        if hint is not None:
+            # Rate limited: hold back every worker sharing the limiter
+            limiter.pause(hint)
+            print(f"HTTP {response.status_code}, waiting {hint:.1f}s as asked")
+        else:
+            delay = backoff_delay(attempt, base_delay)
+            print(f"HTTP {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return response
@@ -0,0 +1,324 @@
+"""Single-pass lyrics parser shared by generation, video and validation.
+
+Requests carry lyrics in one of three shapes:
+
+- LRC text, one ``[MM:SS.xx] text`` line per lyric line, with section
+  markers such as ``[00:20.00] Chorus`` on their own line;
+- plain text, optionally with YuE-style ``[verse]`` tags or bare
+  ``Verse 1`` headers;
+- the ``structure`` array of ``{"type", "start", "lines"}`` sections.
+
+Each one is parsed once into a ``Timeline`` (sections of lines with start
+and end times in milliseconds). YuE prompts, LRC, SRT and ASS subtitles and
+the LRC validation report are all rendered from it.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Seconds a structure line is given before the next one starts
+STRUCTURE_LINE_SECONDS = 4.0
+# Display time of a line that is not followed by another timestamp
+DEFAULT_LINE_MS = 5000
+DEFAULT_SECTION = "verse"
+
+SECTION_NAMES = ("verse", "chorus", "pre-chorus", "intro", "outro", "bridge", "hook", "instrumental")
+
+# One match per line of the whole input: optional leading timestamp, then
+# the text. The strict timestamp form is [MM:SS.cc] (or .ccc).
+_LINE = re.compile(r"^[ \t]*(?:\[(\d{2,}):([0-5]\d)\.(\d{2,3})\])?[ \t]*(.*\S)?[ \t\r]*$", re.MULTILINE)
+# Anything that looks like a timestamp but is not in the strict form
+_LOOSE_TIMESTAMP = re.compile(r"\[(\d{1,3}):(\d{1,2}(?:\.\d{1,3})?)\][ \t]*(.*)")
+_HEADER = re.compile(
+    r"\[([A-Za-z][\w -]*)\]|(" + "|".join(SECTION_NAMES) + r")(?:[ \t]*\d+)?(?:[ \t]*\(.*\))?:?",
+    re.IGNORECASE,
+)
+_START = re.compile(r"(\d{1,3}):(\d{1,2}(?:\.\d{1,3})?)")
+
+
+@dataclass
+class LyricLine:
+    """One lyric line; times are None for untimed input."""
+    text: str
+    start_ms: Optional[int] = None
+    end_ms: Optional[int] = None
+    line_no: int = 0
+
+
+@dataclass
+class Section:
+    tag: str
+    lines: List[LyricLine] = field(default_factory=list)
+    start_ms: Optional[int] = None
+
+    @property
+    def end_ms(self) -> Optional[int]:
+        ends = [line.end_ms for line in self.lines if line.end_ms is not None]
+        return max(ends) if ends else None
+
+
+@dataclass
+class Timeline:
+    """Parsed lyrics. ``issues`` holds LRC format problems found while parsing."""
+    sections: List[Section] = field(default_factory=list)
+    issues: List[str] = field(default_factory=list)
+    source: str = "text"
+
+    @property
+    def lines(self) -> List[LyricLine]:
+        return [line for section in self.sections for line in section.lines]
+
+    @property
+    def timed_lines(self) -> List[LyricLine]:
+        return [line for line in self.lines if line.start_ms is not None and line.text]
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.issues
+
+    def __bool__(self) -> bool:
+        return any(section.lines for section in self.sections)
+
+
+def _tag(name: str) -> str:
+    """Normalise a section name to a YuE tag (``Pre-Chorus`` -> ``prechorus``)."""
+    return re.sub(r"\W+", "", name.lower()) or DEFAULT_SECTION
+
+
+def _seconds_ms(minutes: str, seconds: str) -> int:
+    return int(minutes) * 60000 + round(float(seconds) * 1000)
+
+
+def parse_lyrics(text: str) -> Timeline:
+    """
+    Parse LRC or plain-text lyrics in one pass.
+
+    A line whose text is only a section name (``Chorus``, ``Verse 2``,
+    ``[bridge]``) opens a new section; lines before the first header go into
+    a ``verse``. A timed line ends where the next line's timestamp begins,
+    or ``DEFAULT_LINE_MS`` later when the next line is blank or untimed.
+    """
+    timeline = Timeline(source="lrc")
+    section = None
+    awaiting = None
+    any_timestamp = False
+
+    for line_no, match in enumerate(_LINE.finditer((text or "").strip()), 1):
+        minutes, seconds, fraction, body = match.groups("")
+        start_ms = None
+
+        if minutes:
+            start_ms = int(minutes) * 60000 + int(seconds) * 1000 + int(fraction) * (10 if len(fraction) == 2 else 1)
+        elif body:
+            loose = _LOOSE_TIMESTAMP.match(body)
+            if loose:
+                start_ms = _seconds_ms(loose.group(1), loose.group(2))
+                body = loose.group(3)
+            if body.startswith("[") or loose:
+                timeline.issues.append(f"Line {line_no}: Invalid timestamp format - '{match.group().strip()[:30]}...'")
+            else:
+                timeline.issues.append(f"Line {line_no}: Missing timestamp - '{match.group().strip()[:50]}...'")
+
+        if awaiting is not None:
+            awaiting.end_ms = start_ms if start_ms is not None else awaiting.start_ms + DEFAULT_LINE_MS
+            awaiting = None
+        if start_ms is not None:
+            any_timestamp = True
+
+        if not body:
+            continue
+
+        header = _HEADER.fullmatch(body)
+        if header:
+            section = Section(tag=_tag(header.group(1) or header.group(2)), start_ms=start_ms)
+            timeline.sections.append(section)
+            continue
+
+        if section is None:
+            section = Section(tag=DEFAULT_SECTION, start_ms=start_ms)
+            timeline.sections.append(section)
+        if section.start_ms is None:
+            section.start_ms = start_ms
+
+        line = LyricLine(text=body, start_ms=start_ms, line_no=line_no)
+        section.lines.append(line)
+        if start_ms is not None:
+            awaiting = line
+
+    if awaiting is not None:
+        awaiting.end_ms = awaiting.start_ms + DEFAULT_LINE_MS
+    if not any_timestamp:
+        timeline.source = "text"
+    return timeline
+
+
+def parse_structure(structure: List[dict]) -> Timeline:
+    """
+    Parse the ``structure`` array.
+
+    Lines of a section are spaced ``STRUCTURE_LINE_SECONDS`` apart from its
+    ``start``; every line ends where the next timed line starts.
+    """
+    timeline = Timeline(source="structure")
+    previous = None
+
+    for index, entry in enumerate(structure or []):
+        if not entry.get("type") or not entry.get("lines"):
+            timeline.issues.append(f"Section {index}: missing type or lines")
+
+        start = _START.search(entry.get("start") or "00:00.00")
+        base_ms = _seconds_ms(start.group(1), start.group(2)) if start else None
+        section = Section(tag=_tag(entry.get("type") or DEFAULT_SECTION), start_ms=base_ms)
+        timeline.sections.append(section)
+
+        for i, text in enumerate(entry.get("lines") or []):
+            line_ms = None if base_ms is None else base_ms + round(i * STRUCTURE_LINE_SECONDS * 1000)
+            line = LyricLine(text=str(text).strip(), start_ms=line_ms)
+            section.lines.append(line)
+            if line_ms is None:
+                continue
+            if previous is not None:
+                previous.end_ms = line_ms
+            previous = line
+
+    if previous is not None:
+        previous.end_ms = previous.start_ms + DEFAULT_LINE_MS
+    return timeline
+
+
+def parse_request(data: dict) -> Timeline:
+    """Timeline of a request: ``structure`` when present, otherwise ``lyrics``."""
+    if data.get("structure"):
+        return parse_structure(data["structure"])
+    return parse_lyrics(data.get("lyrics") or "")
+
+
+def shift(timeline: Timeline, delta_ms: int) -> Timeline:
+    """
+    Copy of ``timeline`` with every time moved by ``delta_ms`` (clamped at 0),
+    e.g. after leading silence was cut from the song. Lines that would end
+    before 0 are dropped.
+    """
+    def moved(ms: Optional[int]) -> Optional[int]:
+        return None if ms is None else max(0, ms + delta_ms)
+
+    sections = []
+    for section in timeline.sections:
+        lines = [
+            LyricLine(line.text, moved(line.start_ms), moved(line.end_ms), line.line_no)
+            for line in section.lines
+            if line.end_ms is None or line.end_ms + delta_ms > 0
+        ]
+        sections.append(Section(section.tag, lines, moved(section.start_ms)))
+    return Timeline(sections, list(timeline.issues), timeline.source)
+
+
+def validate(timeline: Timeline) -> List[str]:
+    """Problems that make the timeline unusable for the pipeline."""
+    errors = list(timeline.issues)
+    if not timeline:
+        errors.append("No lyrics or structure found")
+    return errors
+
+
+# ---------------------------------------------------------------------------
+# Renderers
+# ---------------------------------------------------------------------------
+
+def to_yue(timeline: Timeline) -> str:
+    """YuE prompt: ``[tag]`` blocks separated by blank lines, lower-cased."""
+    blocks = []
+    for section in timeline.sections:
+        if section.lines:
+            blocks.append("\n".join([f"[{section.tag}]"] + [line.text for line in section.lines]))
+    return "\n\n".join(blocks).lower()
+
+
+def format_lrc_time(ms: int) -> str:
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    return "[%02d:%02d.%02d]" % (minutes, seconds, ms // 10)
+
+
+def format_srt_time(ms: int) -> str:
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, ms)
+
+
+def format_ass_time(ms: int) -> str:
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d.%02d" % (hours, minutes, seconds, ms // 10)
+
+
+def to_lrc(timeline: Timeline) -> str:
+    return "\n".join(f"{format_lrc_time(line.start_ms)} {line.text}" for line in timeline.timed_lines)
+
+
+def to_srt(timeline: Timeline) -> str:
+    return "\n".join(
+        f"{index}\n{format_srt_time(line.start_ms)} --> {format_srt_time(line.end_ms)}\n{line.text}\n"
+        for index, line in enumerate(timeline.timed_lines, 1)
+    )
+
+
+# Same look as the force_style used for SRT burn-in in create_video.py
+ASS_STYLE: Dict[str, str] = {
+    "Fontname": "Arial",
+    "Fontsize": "18",
+    "PrimaryColour": "&H00FFFFFF",
+    "SecondaryColour": "&H00FFFFFF",
+    "OutlineColour": "&H66222222",
+    "BackColour": "&H88000000",
+    "Bold": "0",
+    "Italic": "0",
+    "Underline": "0",
+    "StrikeOut": "0",
+    "ScaleX": "100",
+    "ScaleY": "100",
+    "Spacing": "0",
+    "Angle": "0",
+    "BorderStyle": "1",
+    "Outline": "0.5",
+    "Shadow": "0.5",
+    "Alignment": "2",
+    "MarginL": "10",
+    "MarginR": "10",
+    "MarginV": "60",
+    "Encoding": "1",
+}
+
+
+def to_ass(timeline: Timeline, width: int = 1920, height: int = 1080, style: Optional[Dict[str, str]] = None) -> str:
+    """
+    Advanced SubStation Alpha subtitles.
+
+    ``PlayResY`` is 288 (libass's default for SRT) so font sizes and margins
+    match the SRT force_style at any output resolution.
+    """
+    style = {**ASS_STYLE, **(style or {})}
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {round(288 * width / height)}",
+        "PlayResY: 288",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, " + ", ".join(style),
+        "Style: Default," + ",".join(style.values()),
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for line in timeline.timed_lines:
+        text = line.text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+        lines.append(
+            f"Dialogue: 0,{format_ass_time(line.start_ms)},{format_ass_time(line.end_ms)},Default,,0,0,0,,{text}"
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,175 @@
+"""Per-request record of finished pipeline stages.
+
+Every stage script (validation, generation, audio post-processing, video,
+Telegram, webhook, Drive) hashes its inputs and looks the stage up in
+``output/manifests/<request_id>.json``. If the stage already finished with
+the same input hash and its artifacts are still on disk, the work is
+skipped, so a rerun after a failed upload does not regenerate the song.
+
+Hashes chain through artifacts: a regenerated song has a new checksum,
+which invalidates the video and every delivery of it.
+
+``--force-stage <name>`` (repeatable, or ``all``) and the ``FORCE_STAGES``
+environment variable (comma separated) make a stage run regardless.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from prefetch import file_digest
+from result_cache import cache_key
+
+STAGES = ("validate", "generate", "postprocess", "video", "telegram", "webhook", "drive")
+MANIFEST_DIR = Path("output/manifests")
+# Delivery threads record into the same manifests; other processes are
+# kept out by an flock on a sidecar ``<request_id>.json.lock``
+_RECORD_LOCK = threading.Lock()
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """
+    Replace ``path`` with ``text`` through a uniquely named temporary file,
+    so readers never see a partial file and concurrent writers do not move
+    each other's temporary files away.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp",
+                                     delete=False) as tmp:
+        tmp.write(text)
+    try:
+        os.replace(tmp.name, path)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+
+
+@contextmanager
+def _locked(path: Path):
+    """Hold the thread lock and an exclusive flock for ``path``'s read-modify-write."""
+    lock_path = path.with_name(path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with _RECORD_LOCK, open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def input_hash(*files, **parts) -> str:
+    """Hash of file contents plus any JSON-serialisable parameters."""
+    return cache_key(files=[file_digest(Path(f), "sha256") for f in files], **parts)
+
+
+def parse_force_stages(values: Optional[Iterable[str]] = None) -> Set[str]:
+    """Stages named on the command line and in ``FORCE_STAGES``."""
+    names = list(values or [])
+    names += os.environ.get("FORCE_STAGES", "").split(",")
+    stages = {name.strip() for name in names if name.strip()}
+    unknown = stages - set(STAGES) - {"all"}
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {sorted(unknown)}; expected one of {list(STAGES)} or 'all'")
+    return stages
+
+
+def pop_force_stages(argv: List[str]) -> Set[str]:
+    """Remove ``--force-stage X`` / ``--force-stage=X`` from ``argv`` and parse them."""
+    values = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--force-stage" and i + 1 < len(argv):
+            values.append(argv[i + 1])
+            del argv[i:i + 2]
+        elif argv[i].startswith("--force-stage="):
+            values.append(argv.pop(i).split("=", 1)[1])
+        else:
+            i += 1
+    return parse_force_stages(values)
+
+
+class StageManifest:
+    """Finished stages of one request, stored as JSON under ``root``."""
+
+    def __init__(self, request_id: str, root: Path = MANIFEST_DIR, force: Iterable[str] = ()):
+        self.request_id = request_id
+        self.path = Path(root) / f"{request_id}.json"
+        self.force = set(force)
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {"request_id": self.request_id, "stages": {}}
+
+    @staticmethod
+    def _key(stage: str, item: Optional[str]) -> str:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        return f"{stage}:{item}" if item else stage
+
+    def done(self, stage: str, digest: str, item: Optional[str] = None) -> Optional[dict]:
+        """
+        The stage's record if it finished with ``digest`` and its artifacts
+        still exist, otherwise None. ``item`` distinguishes per-file entries
+        of a stage (e.g. each file sent to Telegram).
+        """
+        if stage in self.force or "all" in self.force:
+            return None
+        entry = self.data["stages"].get(self._key(stage, item))
+        if entry is None or entry["input_hash"] != digest:
+            return None
+        if not all(Path(p).exists() for p in entry["artifacts"]):
+            return None
+        return entry
+
+    def entry(self, stage: str, item: Optional[str] = None) -> Optional[dict]:
+        """The stage's last record (whether or not it is current)."""
+        return self.data["stages"].get(self._key(stage, item))
+
+    def artifacts(self, stage: str, item: Optional[str] = None) -> List[Path]:
+        """Artifacts recorded for the stage (whether or not it is current)."""
+        entry = self.entry(stage, item) or {}
+        return [Path(p) for p in entry.get("artifacts", [])]
+
+    def record(self, stage: str, digest: str, artifacts: Iterable = (), item: Optional[str] = None, **extra) -> dict:
+        """
+        Mark the stage finished and save the manifest, keeping entries other
+        threads and processes recorded since it was loaded.
+        """
+        entry = {
+            "input_hash": digest,
+            "artifacts": [str(p) for p in artifacts],
+            "finished_at": time.time(),
+            **extra,
+        }
+        with _locked(self.path):
+            self.data = self._load()
+            self.data["stages"][self._key(stage, item)] = entry
+            self.save()
+        return entry
+
+    def save(self) -> None:
+        write_atomic(self.path, json.dumps(self.data, indent=2, sort_keys=True))
+
+    @classmethod
+    def owner(cls, artifact: Path, root: Path = MANIFEST_DIR, force: Iterable[str] = ()) -> Optional["StageManifest"]:
+        """Manifest of the request that produced ``artifact``, if any."""
+        target = Path(artifact).resolve()
+        for path in sorted(Path(root).glob("*.json")):
+            try:
+                data = json.loads(path.read_text())
+            except ValueError:
+                continue
+            for entry in data.get("stages", {}).values():
+                if any(Path(p).resolve() == target for p in entry.get("artifacts", [])):
+                    return cls(data["request_id"], root, force)
+        return None
@@ -1,15 +1,38 @@
 
 import os
 import time
-import re
+import tempfile
 from pathlib import Path
 import modal
 
+from artifacts import ArtifactStore, sniff_format
+from budget import DEFAULT_DURATION, plan_budget, section_tags
+from lyrics_parser import parse_lyrics, parse_request, to_yue
+from prefetch import Lockfile, ModelSpec, prefetch_models
+from result_cache import DEFAULT_MAX_BYTES, ResultCache, cache_key
+from scheduler import request_key
+from transcode import DEFAULT_FORMAT, DEFAULT_QUALITY, encoder_args, transcode_file
+
 # YuE Model Configuration
 # Stage 1: Music Language Modeling (LLaMA-2 7B)
 S1_MODEL = "m-a-p/YuE-s1-7B-anneal-en-cot"
 # Stage 2: Acoustic Modeling (LLaMA-2 1B)
 S2_MODEL = "m-a-p/YuE-s2-1B-general"
+# Model revisions; resolved to a commit sha and pinned in the volume lockfile
+# on first download. Cache keys use the pinned sha (see _model_ref).
+S1_REVISION = "main"
+S2_REVISION = "main"
+LOCK_PATH = Path("/models/yue.lock.json")
+
+# Result cache on the model volume, bounded by YUE_CACHE_MAX_BYTES
+CACHE_ROOT = Path("/models/cache")
+CACHE_MAX_BYTES = int(os.environ.get("YUE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+# Stage 1 codec tokens, kept so stage 2 / xcodec can re-render without the 7B model
+TOKENS_ROOT = Path("/models/tokens")
+TOKENS_MAX_BYTES = int(os.environ.get("YUE_TOKENS_MAX_BYTES", 5 * 1024 ** 3))
+
+# Quality tags appended to every genre prompt
+GENRE_QUALITY_TAGS = "[warm analog tone, mid-range focus, vintage tube compression, thick organic bass, professional mixing]"
 
 # Define Modal App
 app = modal.App("musicmaker-yue")
@@ -17,6 +40,30 @@ app = modal.App("musicmaker-yue")
 # Shared Volume for Model Cache
 volume = modal.Volume.from_name("yue-models", create_if_missing=True)
 
+# Async job API state: job records in a Dict, finished audio as artifacts
+jobs = modal.Dict.from_name("musicmaker-jobs", create_if_missing=True)
+# Spawned call ids live apart from job records so run_job never races submit_job
+job_calls = modal.Dict.from_name("musicmaker-job-calls", create_if_missing=True)
+# Request input hash -> job id of the queued/running job producing it
+inflight = modal.Dict.from_name("musicmaker-inflight", create_if_missing=True)
+
+# Cap on concurrently running A100 containers
+MAX_GPU_WORKERS = int(os.environ.get("YUE_MAX_GPU_WORKERS", 4))
+
+# Generated audio is written here and handed to callers as an artifact handle
+ARTIFACTS_VOLUME = "musicmaker-artifacts"
+artifacts_volume = modal.Volume.from_name(ARTIFACTS_VOLUME, create_if_missing=True)
+ARTIFACTS_ROOT = Path("/artifacts")
+ARTIFACTS_MAX_BYTES = int(os.environ.get("YUE_ARTIFACTS_MAX_BYTES", 50 * 1024 ** 3))
+
+# Lightweight CPU image for the job API. It carries src/models.py, which is
+# kept out of yue_image because xcodec_mini_infer ships its own "models" package.
+api_image = (
+    modal.Image.debian_slim(python_version="3.10")
+    .pip_install("pydantic")
+    .add_local_python_source("models", "result_cache", "scheduler", "budget", "prefetch", "lyrics_parser", "artifacts", "transcode")
+)
+
 # Docker Image setup with YuE dependencies
 yue_image = (
     modal.Image.from_registry("nvidia/cuda:12.1.0-devel-ubuntu22.04", add_python="3.10")
@@ -73,13 +120,139 @@ yue_image = (
         "GIT_TERMINAL_PROMPT=0 git clone https://github.com/multimodal-art-projection/YuE.git /root/YuE",
         "GIT_TERMINAL_PROMPT=0 git clone https://huggingface.co/m-a-p/xcodec_mini_infer /root/YuE/inference/xcodec_mini_infer"
     )
+    # Layer 6: Local engine modules
+    .add_local_python_source("yue_engine", "result_cache", "budget", "prefetch", "scheduler", "lyrics_parser", "artifacts", "transcode")
 )
 
+# Engine code needs torch/numpy, which only exist inside the image
+with yue_image.imports():
+    from dataclasses import asdict
+    from yue_engine import SamplingParams, Stage1Output, concat_wav, create_engine
+
+
+def _result_cache() -> ResultCache:
+    return ResultCache(CACHE_ROOT, max_bytes=CACHE_MAX_BYTES, commit=volume.commit)
+
+
+def _sampling_params(lyrics_processed: str, duration: int):
+    """Sampling parameters with a stage 1 token budget sized to ``duration``."""
+    budget = plan_budget(duration, section_tags(lyrics_processed))
+    print(
+        f"Budget: {len(budget.segment_tokens)} segments, {budget.segment_tokens} tokens, "
+        f"target {budget.target_tokens} tokens (~{budget.planned_seconds:.0f}s)"
+    )
+    return SamplingParams(
+        run_n_segments=len(budget.segment_tokens),
+        max_new_tokens=max(budget.segment_tokens),
+        segment_tokens=budget.segment_tokens,
+        target_tokens=budget.target_tokens,
+    )
+
+
+def _token_store() -> ResultCache:
+    return ResultCache(TOKENS_ROOT, max_bytes=TOKENS_MAX_BYTES, commit=volume.commit)
+
+
+def _artifact_store() -> ArtifactStore:
+    return ArtifactStore(ARTIFACTS_ROOT, ARTIFACTS_VOLUME, max_bytes=ARTIFACTS_MAX_BYTES, commit=artifacts_volume.commit)
+
+
+def _output_options(data: dict) -> tuple:
+    """Validated (output_format, output_quality) of a request."""
+    output_format = data.get("output_format") or DEFAULT_FORMAT
+    output_quality = data.get("output_quality") or DEFAULT_QUALITY
+    encoder_args(output_format, output_quality)
+    return output_format, output_quality
+
+
+def _publish(audio, output_format: str = DEFAULT_FORMAT, output_quality: str = DEFAULT_QUALITY) -> dict:
+    """
+    Encode a song (bytes or a file path) to ``output_format`` and store it as
+    an artifact. Returns the Artifact handle as a dict.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = audio
+        if isinstance(audio, bytes):
+            src = Path(tmp_dir) / "song"
+            src.write_bytes(audio)
+
+        start = time.perf_counter()
+        encoded = transcode_file(src, Path(tmp_dir), output_format, output_quality)
+        artifact = _artifact_store().put_file(encoded, fmt=output_format)
+        if encoded != src:
+            print(
+                f"Encoded {output_format} ({output_quality}) in {time.perf_counter() - start:.1f}s: "
+                f"{Path(src).stat().st_size / 1024 / 1024:.1f} MB -> {artifact.size / 1024 / 1024:.1f} MB"
+            )
+    return artifact.to_dict()
+
+
+def _as_wav(audio: bytes) -> bytes:
+    """WAV bytes of a song; the subprocess engine (and results cached from it) give mp3."""
+    if sniff_format(audio[:4]) == "wav":
+        return audio
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = Path(tmp_dir) / "song"
+        src.write_bytes(audio)
+        return transcode_file(src, Path(tmp_dir), "wav").read_bytes()
+
+
+_pinned_refs = {}
+
+
+def _model_ref(repo_id: str, revision: str) -> str:
+    """
+    ``repo@sha`` of the weights on the volume, as pinned in the lockfile, so
+    cache keys change when the models do. Falls back to ``repo@revision``
+    until the first download has resolved the label.
+    """
+    if repo_id not in _pinned_refs:
+        sha = Lockfile(LOCK_PATH).pinned_revision(repo_id, revision)
+        if sha is None:
+            return f"{repo_id}@{revision}"
+        _pinned_refs[repo_id] = f"{repo_id}@{sha}"
+    return _pinned_refs[repo_id]
+
+
+def _stage1_key(lyrics_processed: str, enhanced_genre: str, duration: int, params) -> str:
+    """Cache key for stage 1 tokens; stage 2 settings do not affect them."""
+    return cache_key(
+        lyrics=lyrics_processed,
+        genre=enhanced_genre,
+        duration=duration,
+        sampling={
+            "top_p": params.top_p,
+            "temperature": params.temperature,
+            "repetition_penalty": params.repetition_penalty,
+            "max_new_tokens": params.max_new_tokens,
+            "run_n_segments": params.run_n_segments,
+            "segment_tokens": params.segment_tokens,
+            "target_tokens": params.target_tokens,
+        },
+        s1=_model_ref(S1_MODEL, S1_REVISION),
+    )
+
+
+def _result_key(lyrics_processed: str, enhanced_genre: str, duration: int, params) -> str:
+    """Cache key covering every input that changes the generated audio."""
+    return cache_key(
+        lyrics=lyrics_processed,
+        genre=enhanced_genre,
+        duration=duration,
+        sampling=asdict(params),
+        s1=_model_ref(S1_MODEL, S1_REVISION),
+        s2=_model_ref(S2_MODEL, S2_REVISION),
+    )
+
+
 @app.cls(
     image=yue_image,
     gpu="A100", 
-    volumes={"/models": volume},
+    volumes={"/models": volume, "/artifacts": artifacts_volume},
     timeout=1200,
+    max_containers=MAX_GPU_WORKERS,
+    # "resident" keeps models in memory, "subprocess" runs infer.py per call
+    secrets=[modal.Secret.from_dict({"YUE_ENGINE_MODE": os.environ.get("YUE_ENGINE_MODE", "resident")})],
 )
 class YuEGenerator:
     s1_path: Path = Path("/models/s1")
@@ -87,128 +260,471 @@ class YuEGenerator:
 
     @modal.enter()
     def download_models(self):
-        from huggingface_hub import snapshot_download
-        
-        if not self.s1_path.exists():
-            print(f"📥 Downloading YuE Stage 1 ({S1_MODEL})...")
-            snapshot_download(S1_MODEL, local_dir=self.s1_path)
-            volume.commit()
-            
-        if not self.s2_path.exists():
-            print(f"📥 Downloading YuE Stage 2 ({S2_MODEL})...")
-            snapshot_download(S2_MODEL, local_dir=self.s2_path)
-            volume.commit()
+        report = prefetch_models(
+            [
+                ModelSpec(S1_MODEL, S1_REVISION, self.s1_path),
+                ModelSpec(S2_MODEL, S2_REVISION, self.s2_path),
+            ],
+            lock_path=LOCK_PATH,
+            # One commit for both models, only if something changed
+            commit=volume.commit,
+        )
+
+        start = time.perf_counter()
+        self.engine = self._load_engine()
+        report.phases["engine_load"] = time.perf_counter() - start
+        print(report.summary())
+
+    def _load_engine(self):
+        """Load the configured engine, falling back to infer.py subprocesses."""
+        mode = os.environ.get("YUE_ENGINE_MODE", "resident")
+        print(f"Loading YuE engine ({mode})")
+        engine = create_engine(mode, self.s1_path, self.s2_path)
+        try:
+            engine.load()
+        except Exception as e:
+            if mode == "subprocess":
+                raise
+            print(f"Resident engine failed to load ({e}), using subprocess mode")
+            engine = create_engine("subprocess", self.s1_path, self.s2_path)
+        return engine
 
     @modal.method()
     def generate(
         self,
         lyrics: str,
         genre: str = "rock",
-        duration: int = 95,
+        duration: int = DEFAULT_DURATION,
         ref_audio_urls: list = None,
-    ) -> bytes:
+        use_cache: bool = True,
+        cache_checked: bool = False,
+        output_format: str = DEFAULT_FORMAT,
+        output_quality: str = DEFAULT_QUALITY,
+        preprocessed: bool = False,
+    ) -> dict:
         """
         Produce a full song using YuE (樂) model.
+
+        The audio is encoded to ``output_format`` and written to the artifacts
+        volume; returns its Artifact handle as a dict. ``preprocessed`` means
+        ``lyrics`` are already in YuE format (the gateways parse them once).
         """
-        import subprocess
-        import tempfile
-        from pathlib import Path
-        
-        print(f"� YuE Generating: {genre} ({duration}s)")
-        
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            tmp_root = Path(tmp_dir)
-            
-            # 1. Prepare Lyrics and Genre text files (YuE requirement)
-            # YuE expects a specific format for lyrics [verse] [chorus]
-            lyrics_processed = self._process_lyrics(lyrics)
-            lyrics_file = tmp_root / "lyrics.txt"
-            lyrics_file.write_text(lyrics_processed)
-            
-            genre_file = tmp_root / "genre.txt"
-            # Enhance genre with benchmark quality tags
-            enhanced_genre = f"{genre}. [warm analog tone, mid-range focus, vintage tube compression, thick organic bass, professional mixing]"
-            genre_file.write_text(enhanced_genre)
-            
-            output_dir = tmp_root / "output"
-            output_dir.mkdir()
-
-            # Prepare YuE Command
-            infer_script = "/root/YuE/inference/infer.py"
-            
-            # YuE adds 'xcodec_mini_infer' to path automatically in infer.py
-            bash_cmd = f"python3 {infer_script} " \
-                       f"--stage1_model {self.s1_path} " \
-                       f"--stage2_model {self.s2_path} " \
-                       f"--genre_txt {genre_file} " \
-                       f"--lyrics_txt {lyrics_file} " \
-                       f"--run_n_segments 2 " \
-                       f"--output_dir {output_dir} " \
-                       f"--cuda_idx 0 " \
-                       f"--max_new_tokens 3000"
-
-            print(f"🚀 Executing High-Fidelity YuE Engine: {bash_cmd}")
-            
-            process = subprocess.run(
-                ["bash", "-c", bash_cmd],
-                capture_output=True,
-                text=True,
-                cwd="/root/YuE/inference" # Run from inference dir where infer.py lives
-            )
-            
-            if process.returncode != 0:
-                print(f"❌ YuE Failed: {process.stderr}")
-                raise RuntimeError(f"YuE Inference Error: {process.stderr}")
-
-            # Collect output
-            output_files = list(output_dir.glob("*.mp3")) or list(output_dir.glob("*.wav"))
-            if not output_files:
-                raise RuntimeError("YuE did not generate any audio files.")
-                
-            with open(output_files[0], "rb") as f:
-                return f.read()
-
-    def _process_lyrics(self, raw_lyrics: str) -> str:
+        print(f"YuE Generating: {genre} ({duration}s, {output_format})")
+        encoder_args(output_format, output_quality)
+
+        # YuE expects a specific format for lyrics [verse] [chorus]
+        lyrics_processed = lyrics if preprocessed else process_lyrics(lyrics)
+        # Enhance genre with benchmark quality tags
+        enhanced_genre = f"{genre}. {GENRE_QUALITY_TAGS}"
+        params = _sampling_params(lyrics_processed, duration)
+
+        cache = _result_cache()
+        key = _result_key(lyrics_processed, enhanced_genre, duration, params)
+        # cache_checked: the gateway already looked up (and counted) this key
+        if use_cache and not cache_checked:
+            cached_path = cache.get_path(key)
+            if cached_path is not None:
+                print(f"Result cache hit: {key[:12]}")
+                return _publish(cached_path, output_format, output_quality)
+
+        if self.engine.supports_tokens:
+            stage1 = self._stage1_tokens(lyrics_processed, enhanced_genre, duration, params, reuse=use_cache)
+            audio = self.engine.render(stage1, params)
+        else:
+            audio = self.engine.generate(lyrics_processed, enhanced_genre, params)
+        cache.put(key, audio)
+        return _publish(audio, output_format, output_quality)
+
+    @modal.method()
+    def generate_stream(
+        self,
+        lyrics: str,
+        genre: str = "rock",
+        duration: int = DEFAULT_DURATION,
+        ref_audio_urls: list = None,
+        use_cache: bool = True,
+        cache_checked: bool = False,
+        preprocessed: bool = False,
+    ):
+        """
+        Streaming variant of generate: yields WAV bytes for each lyric segment
+        as soon as stage 2 and decoding finish it.
+
+        Cached results, stored tokens and the subprocess engine yield the whole
+        song as a single chunk, converted to WAV if it is not one already.
+        """
+        print(f"YuE Streaming: {genre} ({duration}s)")
+
+        lyrics_processed = lyrics if preprocessed else process_lyrics(lyrics)
+        enhanced_genre = f"{genre}. {GENRE_QUALITY_TAGS}"
+        params = _sampling_params(lyrics_processed, duration)
+
+        cache = _result_cache()
+        key = _result_key(lyrics_processed, enhanced_genre, duration, params)
+        # cache_checked: the gateway already looked up (and counted) this key
+        if use_cache and not cache_checked:
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Result cache hit: {key[:12]}")
+                yield _as_wav(cached)
+                return
+
+        if not self.engine.supports_tokens:
+            audio = self.engine.generate(lyrics_processed, enhanced_genre, params)
+            cache.put(key, audio)
+            yield _as_wav(audio)
+            return
+
+        tokens = _token_store()
+        stage1_key = _stage1_key(lyrics_processed, enhanced_genre, duration, params)
+        saved = tokens.get(stage1_key) if use_cache else None
+        if saved is not None:
+            print(f"Reusing stage 1 tokens: {stage1_key[:12]}")
+            audio = self.engine.render(Stage1Output.from_bytes(saved), params)
+            cache.put(key, audio)
+            yield _as_wav(audio)
+            return
+
+        parts = []
+        stream = self.engine.generate_stream(
+            lyrics_processed,
+            enhanced_genre,
+            params,
+            on_stage1=lambda stage1: tokens.put(stage1_key, stage1.to_bytes()),
+        )
+        for n, part in enumerate(stream, 1):
+            print(f"Segment {n} ready ({len(part)} bytes)")
+            parts.append(part)
+            yield part
+        cache.put(key, concat_wav(parts))
+
+    def _stage1_tokens(self, lyrics_processed: str, enhanced_genre: str, duration: int,
+                       params, reuse: bool = True):
+        """Load persisted stage 1 tokens, or run stage 1 and persist them."""
+        tokens = _token_store()
+        key = _stage1_key(lyrics_processed, enhanced_genre, duration, params)
+        if reuse:
+            saved = tokens.get(key)
+            if saved is not None:
+                print(f"Reusing stage 1 tokens: {key[:12]}")
+                return Stage1Output.from_bytes(saved)
+
+        stage1 = self.engine.generate_stage1(lyrics_processed, enhanced_genre, params)
+        # Stored before stage 2 runs, so a stage 2 crash does not lose them
+        tokens.put(key, stage1.to_bytes())
+        return stage1
+
+    @modal.method()
+    def rerender(
+        self,
+        lyrics: str,
+        genre: str = "rock",
+        duration: int = DEFAULT_DURATION,
+        sample_rate: int = None,
+        output_format: str = DEFAULT_FORMAT,
+        output_quality: str = DEFAULT_QUALITY,
+    ) -> dict:
+        """
+        Re-run stage 2 and xcodec decoding from persisted stage 1 tokens.
+
+        Returns an Artifact handle dict. Raises if no tokens were stored for
+        these inputs; the 7B model is never used.
+        """
+        if not self.engine.supports_tokens:
+            raise RuntimeError("Re-rendering needs the resident engine (YUE_ENGINE_MODE=resident)")
+
+        lyrics_processed = process_lyrics(lyrics)
+        enhanced_genre = f"{genre}. {GENRE_QUALITY_TAGS}"
+        params = _sampling_params(lyrics_processed, duration)
+        key = _stage1_key(lyrics_processed, enhanced_genre, duration, params)
+        saved = _token_store().get(key)
+        if saved is None:
+            raise RuntimeError(f"No stage 1 tokens stored for key {key[:12]}")
+
+        print(f"Re-rendering from stage 1 tokens: {key[:12]}")
+        audio = self.engine.render(Stage1Output.from_bytes(saved), params, sample_rate=sample_rate)
+        return _publish(audio, output_format, output_quality)
+
+    @modal.method()
+    def generate_batch(self, requests: list) -> list:
         """
-        Convert timestamped LRC or plain text to YuE format.
-        YuE format: 
-        [verse]
-        Lyric lines...
-        [chorus]
-        Lyric lines...
+        Generate several requests together through shared stage 1 / stage 2 passes.
+
+        Each request is a dict like the ones process_request builds. Returns one
+        dict per request with either "artifact" (handle dict) or "error" (str).
         """
-        # Remove timestamps if present
-        clean = re.sub(r'\[\d{2}:\d{2}\.\d{2}\]', '', raw_lyrics)
-        
-        # Ensure section tags are lowercase and bracketed
-        clean = re.sub(r'(Verse|Chorus|Intro|Outro|Bridge)', r'[\1]', clean, flags=re.IGNORECASE)
-        clean = clean.lower()
-        
-        return clean.strip()
-
-@app.function(image=yue_image, timeout=300)
-def process_request(data: dict):
+        print(f"YuE Generating batch of {len(requests)} requests")
+
+        cache = _result_cache()
+        results = [None] * len(requests)
+        # Bad output options fail their own request up front, not the batch after generation
+        options = [None] * len(requests)
+        for idx, data in enumerate(requests):
+            try:
+                options[idx] = _output_options(data)
+            except ValueError as e:
+                results[idx] = {"error": str(e)}
+
+        keys, stage1_keys, items, misses = {}, {}, [], []
+        for idx, data in enumerate(requests):
+            if results[idx] is not None:
+                continue
+            lyrics = _request_lyrics(data)
+            genre = f"{data.get('genre', 'rock')}. {GENRE_QUALITY_TAGS}"
+            duration = data.get("duration", DEFAULT_DURATION)
+            try:
+                params = _sampling_params(lyrics, duration)
+            except ValueError as e:
+                results[idx] = {"error": str(e)}
+                continue
+            keys[idx] = _result_key(lyrics, genre, duration, params)
+            stage1_keys[idx] = _stage1_key(lyrics, genre, duration, params)
+
+            cached_path = None if data.get("bypass_cache") else cache.get_path(keys[idx])
+            if cached_path is not None:
+                results[idx] = {"artifact": _publish(cached_path, *options[idx])}
+            else:
+                items.append((lyrics, genre, params))
+                misses.append(idx)
+
+        print(f"Result cache: {len(keys) - len(misses)} hits, {len(misses)} to generate, "
+              f"{len(requests) - len(keys)} invalid")
+        if items:
+            tokens = _token_store()
+
+            def save_tokens(item_idx, stage1):
+                tokens.put(stage1_keys[misses[item_idx]], stage1.to_bytes())
+
+            batch_results = self.engine.generate_batch(items, on_stage1=save_tokens)
+            for idx, result in zip(misses, batch_results):
+                if "audio" in result:
+                    audio = result.pop("audio")
+                    cache.put(keys[idx], audio)
+                    result["artifact"] = _publish(audio, *options[idx])
+                results[idx] = result
+
+        for data, result in zip(requests, results):
+            result["request_id"] = data.get("request_id")
+            if "error" in result:
+                print(f"Request {result['request_id']} failed: {result['error']}")
+        return results
+
+def process_lyrics(raw_lyrics: str) -> str:
+    """
+    Convert timestamped LRC or plain text to YuE format.
+    YuE format: 
+    [verse]
+    Lyric lines...
+    [chorus]
+    Lyric lines...
+    """
+    return to_yue(parse_lyrics(raw_lyrics))
+
+def _request_lyrics(data: dict) -> str:
+    """Return request lyrics in YuE format, converting the structure format if needed."""
+    if data.get("lyrics"):
+        return process_lyrics(data["lyrics"])
+    return to_yue(parse_request(data))
+
+@app.function(image=yue_image, volumes={"/models": volume, "/artifacts": artifacts_volume}, timeout=1500)
+def process_request(data: dict) -> dict:
     """
     Gateway function for processing requests.
+
+    Returns an Artifact handle dict; download it with artifacts.download_artifact.
+    Cached results are published directly, without starting a GPU container.
+    Set "bypass_cache": true in the request to force a fresh generation.
     """
-    lyrics = data.get("lyrics")
-    # If using structure format, convert it
-    if "structure" in data and not lyrics:
-        lyrics = ""
-        for section in data["structure"]:
-            lyrics += f"\n[{section['type']}]\n"
-            lyrics += "\n".join(section["lines"])
-    
+    # Parsed to YuE format once; the generator is told not to parse again
+    lyrics = _request_lyrics(data)
     genre = data.get("genre", "rock")
-    duration = data.get("duration", 95)
+    duration = data.get("duration", DEFAULT_DURATION)
     ref_audio_urls = data.get("ref_audio_urls", [])
+    output_format, output_quality = _output_options(data)
+
+    if not data.get("bypass_cache"):
+        # Pick up entries committed by other containers
+        volume.reload()
+        params = _sampling_params(lyrics, duration)
+        key = _result_key(lyrics, f"{genre}. {GENRE_QUALITY_TAGS}", duration, params)
+        cached_path = _result_cache().get_path(key)
+        if cached_path is not None:
+            print(f"Result cache hit for {data.get('request_id')}: {key[:12]}")
+            return _publish(cached_path, output_format, output_quality)
 
     gen = YuEGenerator()
-    audio_bytes = gen.generate.remote(
+    artifact = gen.generate.remote(
         lyrics=lyrics,
         genre=genre,
         duration=duration,
-        ref_audio_urls=ref_audio_urls
+        ref_audio_urls=ref_audio_urls,
+        use_cache=not data.get("bypass_cache", False),
+        cache_checked=True,
+        output_format=output_format,
+        output_quality=output_quality,
+        preprocessed=True,
     )
-    
-    return audio_bytes
+    return artifact
+
+
+@app.function(image=yue_image, volumes={"/models": volume}, timeout=1200)
+def process_request_stream(data: dict):
+    """
+    Streaming gateway: yields the song segment by segment (WAV bytes).
+
+    Segments are always WAV; output_format applies to process_request only.
+    """
+    lyrics = _request_lyrics(data)
+    genre = data.get("genre", "rock")
+    duration = data.get("duration", DEFAULT_DURATION)
+
+    if not data.get("bypass_cache"):
+        volume.reload()
+        params = _sampling_params(lyrics, duration)
+        key = _result_key(lyrics, f"{genre}. {GENRE_QUALITY_TAGS}", duration, params)
+        cached = _result_cache().get(key)
+        if cached is not None:
+            print(f"Result cache hit for {data.get('request_id')}: {key[:12]}")
+            yield _as_wav(cached)
+            return
+
+    gen = YuEGenerator()
+    yield from gen.generate_stream.remote_gen(
+        lyrics=lyrics,
+        genre=genre,
+        duration=duration,
+        ref_audio_urls=data.get("ref_audio_urls", []),
+        use_cache=not data.get("bypass_cache", False),
+        cache_checked=True,
+        preprocessed=True,
+    )
+
+
+@app.function(image=yue_image, volumes={"/models": volume})
+def cache_stats() -> dict:
+    """Hit/miss counters and size of the result cache."""
+    return _result_cache().stats()
+
+
+
+def _job_response(job_id: str, record: dict) -> dict:
+    """Render a job record as a MusicGenerationResponse dict."""
+    from models import MusicGenerationResponse
+
+    return MusicGenerationResponse(
+        request_id=record["request_id"],
+        status=record["status"],
+        audio_url=(record.get("artifact") or {}).get("path"),
+        audio_format=(record.get("artifact") or {}).get("format"),
+        duration=record.get("duration"),
+        generation_time=record.get("generation_time"),
+        model_used=f"{S1_MODEL} + {S2_MODEL}",
+        error=record.get("error"),
+        metadata={"job_id": job_id, "submitted_at": record["submitted_at"], "artifact": record.get("artifact")},
+    ).model_dump()
+
+
+@app.function(image=yue_image, volumes={"/models": volume, "/artifacts": artifacts_volume}, timeout=1500)
+def run_job(job_id: str, data: dict):
+    """
+    Worker behind submit_job: generates the song and persists the outcome.
+    """
+    start = time.time()
+    try:
+        artifact = process_request.local(data)
+    except Exception as e:
+        jobs[job_id] = {**jobs[job_id], "status": "failed", "error": str(e)}
+        raise
+    finally:
+        inflight.pop(request_key(data), None)
+
+    jobs[job_id] = {
+        **jobs[job_id],
+        "status": "success",
+        "artifact": artifact,
+        "generation_time": time.time() - start,
+    }
+
+
+@app.function(image=api_image)
+def submit_job(data: dict) -> dict:
+    """
+    Start generation in the background and return immediately.
+
+    The response has status "processing" and the job id in metadata["job_id"].
+    """
+    import uuid
+
+    # Identical inputs already queued or running: attach to that job
+    key = request_key(data)
+    existing = inflight.get(key)
+    if existing is not None and not data.get("bypass_cache"):
+        record = jobs.get(existing)
+        if record is not None and record["status"] == "processing":
+            print(f"Coalesced {data.get('request_id')} onto job {existing}")
+            return _job_response(existing, record)
+
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = {
+        "request_id": data.get("request_id", "unknown"),
+        "status": "processing",
+        "duration": data.get("duration", DEFAULT_DURATION),
+        "submitted_at": time.time(),
+        "key": key,
+    }
+    inflight[key] = job_id
+    job_calls[job_id] = run_job.spawn(job_id, data).object_id
+    print(f"Submitted job {job_id} for {data.get('request_id')}")
+    return _job_response(job_id, jobs[job_id])
+
+
+@app.function(image=api_image)
+def job_status(job_id: str) -> dict:
+    """
+    Current state of a job: "processing", "success" or "failed".
+    """
+    record = jobs.get(job_id)
+    if record is None:
+        raise KeyError(f"Unknown job: {job_id}")
+
+    call_id = job_calls.get(job_id)
+    if record["status"] == "processing" and call_id:
+        # Catch workers that died without recording their outcome
+        try:
+            modal.FunctionCall.from_id(call_id).get(timeout=0)
+        except TimeoutError:
+            pass
+        except Exception as e:
+            record = jobs.get(job_id)
+            if record["status"] == "processing":
+                record = {**record, "status": "failed", "error": str(e)}
+                jobs[job_id] = record
+    return _job_response(job_id, record)
+
+
+@app.function(image=api_image)
+def job_result(job_id: str) -> dict:
+    """
+    Artifact handle of a finished job. Raises if the job has not succeeded.
+    """
+    record = jobs.get(job_id)
+    if record is None or record["status"] != "success":
+        raise RuntimeError(f"Job {job_id} has no result (status: {record and record['status']})")
+    return record["artifact"]
+
+
+@app.function(image=api_image)
+def cancel_job(job_id: str) -> dict:
+    """
+    Cancel a running job. Finished jobs are returned unchanged.
+    """
+    record = jobs.get(job_id)
+    if record is None:
+        raise KeyError(f"Unknown job: {job_id}")
+    if record["status"] == "processing":
+        modal.FunctionCall.from_id(job_calls[job_id]).cancel()
+        record = {**record, "status": "failed", "error": "Cancelled by client"}
+        jobs[job_id] = record
+        if record.get("key"):
+            inflight.pop(record["key"], None)
+    return _job_response(job_id, record)
@@ -1,9 +1,162 @@
-"""Pydantic models for request/response validation."""
+"""Pydantic models for request/response validation.
 
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field, HttpUrl, field_validator
+``SongRequest`` is the YuE request (``requests/*.json``) and the single
+source of truth for its shape: ``schemas/request.json`` is generated from
+it by ``scripts/export_schema.py``. Bulk ingestion validates raw JSON bytes
+through ``REQUEST_ADAPTER`` without building dicts first.
+"""
+
+from typing import Optional, List, Dict, Any, Literal, Annotated
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, TypeAdapter, WithJsonSchema, field_validator, model_validator
+from pydantic.json_schema import GenerateJsonSchema
 import re
 
+from budget import DEFAULT_DURATION
+
+MIN_DURATION = 30
+MAX_DURATION = 600
+SCHEMA_DIALECT = "https://json-schema.org/draft/2020-12/schema"
+
+
+def _reject_null(value):
+    """Optional request fields may be left out but, as in the JSON schema, not set to null."""
+    if value is None:
+        raise ValueError("may not be null")
+    return value
+
+
+class SongSection(BaseModel):
+    """One timed section of a request's ``structure``."""
+    model_config = ConfigDict(strict=True, extra="allow")
+
+    type: str
+    start: str = Field(..., pattern=r"^\d{2}:\d{2}\.\d{2}$")
+    lines: List[str]
+
+
+class RequestMetadata(BaseModel):
+    """Optional request metadata; ``project`` is used for fair-share scheduling."""
+    model_config = ConfigDict(strict=True, extra="allow")
+
+    project: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+    _not_null = field_validator("project", "tags", mode="before")(_reject_null)
+
+
+class SongRequest(BaseModel):
+    """YuE lyrics-to-song generation request."""
+    model_config = ConfigDict(
+        strict=True,
+        extra="allow",
+        title="YuE Music Generation Request",
+        json_schema_extra={
+            "description": "Schema for lyrics-to-song generation with YuE - Foundation Music Model",
+            "anyOf": [
+                {"required": ["request_id", "lyrics"]},
+                {"required": ["request_id", "structure"]},
+            ],
+        },
+    )
+
+    request_id: str = Field(
+        ...,
+        description="Unique identifier for the request",
+        pattern=r"^req_[a-zA-Z0-9_-]+$"
+    )
+    structure: Optional[List[SongSection]] = Field(
+        default=None,
+        description="Song structure with timed sections"
+    )
+    lyrics: Optional[str] = Field(
+        default=None,
+        description="Song lyrics in LRC format (with timestamps) or plain text",
+        min_length=10,
+        max_length=5000
+    )
+    genre: str = Field(
+        default="rock",
+        description="Music genre/style or detailed style prompt"
+    )
+    duration: int = Field(
+        default=DEFAULT_DURATION,
+        description=f"Target duration ({MIN_DURATION}s to {MAX_DURATION}s)",
+        ge=MIN_DURATION,
+        le=MAX_DURATION
+    )
+    ref_audio_urls: Optional[List[Annotated[str, WithJsonSchema({"type": "string", "format": "uri"})]]] = Field(
+        default=None,
+        description="Optional list of reference audio URLs for style/vocal cloning"
+    )
+    output_format: Literal["wav", "flac", "mp3", "opus"] = Field(
+        default="wav",
+        description="Audio format delivered to clients; encoded in the worker"
+    )
+    output_quality: Literal["low", "medium", "high"] = Field(
+        default="high",
+        description="Encoder quality for mp3/opus (low, medium, high)"
+    )
+    priority: Literal["preview", "high", "normal", "bulk"] = Field(
+        default="normal",
+        description="Scheduling priority; previews run before full renders"
+    )
+    metadata: Optional[RequestMetadata] = Field(
+        default=None,
+        description="Optional request metadata; project is used for fair-share scheduling"
+    )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Skip the result cache and always run a fresh generation"
+    )
+
+    _not_null = field_validator("structure", "lyrics", "ref_audio_urls", "metadata", mode="before")(_reject_null)
+
+    @model_validator(mode="after")
+    def require_lyrics(self) -> "SongRequest":
+        """A request needs lyrics or a structure."""
+        if self.lyrics is None and self.structure is None:
+            raise ValueError("Request needs 'lyrics' or 'structure'")
+        return self
+
+
+# Built once: validates raw JSON bytes (one request, or a JSON array of them)
+REQUEST_ADAPTER = TypeAdapter(SongRequest)
+REQUEST_LIST_ADAPTER = TypeAdapter(List[SongRequest])
+
+
+class _RequestSchema(GenerateJsonSchema):
+    """Schema generator for the request file format."""
+
+    def nullable_schema(self, schema):
+        # Optional fields may be left out, not set to null
+        return self.generate_inner(schema["schema"])
+
+    def default_schema(self, schema):
+        json_schema = super().default_schema(schema)
+        if schema.get("default", ...) is None:
+            json_schema.pop("default", None)
+        return json_schema
+
+    def generate(self, schema, mode="validation"):
+        return _plain_descriptions(super().generate(schema, mode))
+
+
+def _plain_descriptions(value):
+    """Drop the ``literal`` markup docstrings carry into schema descriptions."""
+    if isinstance(value, dict):
+        return {
+            key: item.replace("``", "") if key == "description" and isinstance(item, str) else _plain_descriptions(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_plain_descriptions(item) for item in value]
+    return value
+
+
+def request_json_schema() -> dict:
+    """JSON schema of ``SongRequest``, as stored in ``schemas/request.json``."""
+    return {"$schema": SCHEMA_DIALECT, **SongRequest.model_json_schema(schema_generator=_RequestSchema)}
+
 
 class MusicMetadata(BaseModel):
     """Metadata for music generation request."""
@@ -40,6 +193,10 @@ class MusicGenerationRequest(BaseModel):
         default="wav",
         description="Output audio format"
     )
+    output_quality: str = Field(
+        default="high",
+        description="Encoder quality for lossy formats (low, medium, high)"
+    )
     melody_file: Optional[HttpUrl] = Field(
         default=None,
         description="Optional URL to melody file for conditioning"
@@ -77,10 +234,19 @@ class MusicGenerationRequest(BaseModel):
     @classmethod
     def validate_format(cls, v: str) -> str:
         """Validate output format."""
-        allowed_formats = ["wav", "mp3", "flac"]
+        allowed_formats = ["wav", "flac", "mp3", "opus"]
         if v not in allowed_formats:
             raise ValueError(f"Format must be one of {allowed_formats}")
         return v
+    
+    @field_validator('output_quality')
+    @classmethod
+    def validate_quality(cls, v: str) -> str:
+        """Validate output quality."""
+        allowed_qualities = ["low", "medium", "high"]
+        if v not in allowed_qualities:
+            raise ValueError(f"Quality must be one of {allowed_qualities}")
+        return v
 
 
 class MusicGenerationResponse(BaseModel):
@@ -89,6 +255,7 @@ class MusicGenerationResponse(BaseModel):
     request_id: str
     status: str  # "success", "failed", "processing"
     audio_url: Optional[str] = None
+    audio_format: Optional[str] = None
     duration: Optional[float] = None
     generation_time: Optional[float] = None
     model_used: Optional[str] = None
@@ -0,0 +1,216 @@
+"""Parallel, integrity-checked model prefetch for the yue-models volume.
+
+The first fetch of a repo resolves its revision to a commit sha. It records
+every file's size and hash (sha256 for LFS files, git blob sha1 for the
+rest) in a lockfile on the volume. Later cold starts read the lockfile
+instead of asking the Hub, and they re-hash only files whose size or mtime
+changed since they were last verified. Missing or corrupt files are
+downloaded again. A half-finished download therefore no longer counts as
+cached.
+
+All files of all repos go through one thread pool. ``hf_hub_download``
+resumes partial transfers, and the volume is committed once at the end.
+"""
+
+import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+@dataclass
+class ModelSpec:
+    """A Hub repo to mirror into ``local_dir`` at ``revision``."""
+    repo_id: str
+    revision: str
+    local_dir: Path
+
+
+@dataclass
+class PrefetchReport:
+    """Cold-start timing broken down by phase, in seconds."""
+    phases: Dict[str, float] = field(default_factory=dict)
+    downloaded: List[str] = field(default_factory=list)
+    verified: int = 0
+    hashed: int = 0
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name}={seconds:.1f}s" for name, seconds in self.phases.items())
+        return (
+            f"Cold start: {phases} | {self.verified} files ok "
+            f"({self.hashed} re-hashed), {len(self.downloaded)} downloaded"
+        )
+
+
+class _Timer:
+    def __init__(self, report: PrefetchReport, phase: str):
+        self.report = report
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.report.phases[self.phase] = self.report.phases.get(self.phase, 0.0) + time.perf_counter() - self.start
+
+
+def file_digest(path: Path, algorithm: str) -> str:
+    """Hash a file in chunks. ``git_sha1`` reproduces git's blob object id."""
+    if algorithm == "git_sha1":
+        digest = hashlib.sha1(f"blob {path.stat().st_size}\0".encode())
+    else:
+        digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_manifest(spec: ModelSpec) -> dict:
+    """Ask the Hub for the commit sha and per-file hashes of ``spec``."""
+    from huggingface_hub import HfApi
+
+    info = HfApi().model_info(spec.repo_id, revision=spec.revision, files_metadata=True)
+    files = {}
+    for sibling in info.siblings:
+        if sibling.lfs:
+            files[sibling.rfilename] = {"size": sibling.lfs.size, "algorithm": "sha256", "hash": sibling.lfs.sha256}
+        else:
+            files[sibling.rfilename] = {"size": sibling.size, "algorithm": "git_sha1", "hash": sibling.blob_id}
+    return {"requested": spec.revision, "revision": info.sha, "files": files}
+
+
+class Lockfile:
+    """JSON lockfile mapping repo ids to pinned revisions and file hashes."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        try:
+            self.data = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.data = {"repos": {}}
+
+    def manifest(self, spec: ModelSpec) -> Optional[dict]:
+        entry = self.data["repos"].get(spec.repo_id)
+        if entry and entry.get("requested") == spec.revision:
+            return entry
+        return None
+
+    def pinned_revision(self, repo_id: str, revision: str) -> Optional[str]:
+        """Commit sha ``repo_id@revision`` was resolved to, if it has been."""
+        entry = self.data["repos"].get(repo_id)
+        if entry and entry.get("requested") == revision:
+            return entry["revision"]
+        return None
+
+    def set_manifest(self, spec: ModelSpec, manifest: dict) -> None:
+        self.data["repos"][spec.repo_id] = manifest
+
+    def save(self) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.data, indent=2, sort_keys=True))
+        tmp_path.replace(self.path)
+
+
+def _check_file(local_dir: Path, name: str, entry: dict) -> str:
+    """Return "ok", "hashed" (ok after re-hashing) or "fetch"."""
+    path = local_dir / name
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return "fetch"
+    if stat.st_size != entry["size"]:
+        return "fetch"
+    # Unchanged since the last successful verification
+    if entry.get("verified") == [stat.st_size, stat.st_mtime]:
+        return "ok"
+    if file_digest(path, entry["algorithm"]) != entry["hash"]:
+        return "fetch"
+    entry["verified"] = [stat.st_size, stat.st_mtime]
+    return "hashed"
+
+
+def _fetch_file(spec: ModelSpec, revision: str, name: str, entry: dict) -> str:
+    from huggingface_hub import hf_hub_download
+
+    # Partial files are kept under local_dir/.cache and resumed
+    path = Path(hf_hub_download(spec.repo_id, name, revision=revision, local_dir=spec.local_dir))
+    if file_digest(path, entry["algorithm"]) != entry["hash"]:
+        path.unlink(missing_ok=True)
+        raise RuntimeError(f"Checksum mismatch for {spec.repo_id}/{name}")
+    stat = path.stat()
+    entry["verified"] = [stat.st_size, stat.st_mtime]
+    return name
+
+
+def prefetch_models(
+    specs: List[ModelSpec],
+    lock_path: Path,
+    commit: Callable[[], None] = None,
+    max_workers: int = 8,
+) -> PrefetchReport:
+    """
+    Make sure every file of every spec is present and intact.
+
+    Args:
+        specs: Repos to mirror
+        lock_path: Lockfile location (on the same volume as the weights)
+        commit: Called once at the end if anything changed (e.g. volume.commit)
+        max_workers: Threads shared by verification and downloads
+    """
+    report = PrefetchReport()
+    lock = Lockfile(lock_path)
+    changed = False
+
+    with _Timer(report, "resolve"):
+        manifests = []
+        for spec in specs:
+            manifest = lock.manifest(spec)
+            if manifest is None:
+                print(f"Resolving {spec.repo_id}@{spec.revision}")
+                manifest = resolve_manifest(spec)
+                lock.set_manifest(spec, manifest)
+                changed = True
+            manifests.append(manifest)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        with _Timer(report, "verify"):
+            checks = {
+                pool.submit(_check_file, spec.local_dir, name, entry): (spec, manifest, name, entry)
+                for spec, manifest in zip(specs, manifests)
+                for name, entry in manifest["files"].items()
+            }
+            missing = []
+            for future in as_completed(checks):
+                status = future.result()
+                if status == "fetch":
+                    missing.append(checks[future])
+                else:
+                    report.verified += 1
+                    if status == "hashed":
+                        report.hashed += 1
+                        changed = True
+
+        with _Timer(report, "download"):
+            if missing:
+                print(f"Downloading {len(missing)} files with {max_workers} workers")
+            downloads = [
+                pool.submit(_fetch_file, spec, manifest["revision"], name, entry)
+                for spec, manifest, name, entry in missing
+            ]
+            for future in as_completed(downloads):
+                report.downloaded.append(future.result())
+                changed = True
+
+    with _Timer(report, "commit"):
+        if changed:
+            lock.save()
+            if commit is not None:
+                commit()
+
+    return report
@@ -0,0 +1,177 @@
+"""Content-addressed cache for generated songs.
+
+Entries live on the ``yue-models`` Modal Volume and are keyed by a hash of
+everything that influences the YuE output: processed lyrics, enhanced genre,
+duration, sampling parameters and the stage 1 / stage 2 model revisions.
+
+Recency is tracked through file modification times, so several containers
+can share the cache without a central index. Eviction removes the least
+recently used entries once the total size exceeds ``max_bytes``.
+
+Only writes commit the volume at once. Lookups count hits and misses in
+memory and bump mtimes locally; both reach the volume with the next write,
+or with a commit at most every STATS_FLUSH_SECONDS, so concurrent workers
+do not queue up behind one volume commit per lookup.
+"""
+
+import json
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+STATS_FLUSH_SECONDS = 60.0
+
+# Per cache root, shared by every ResultCache instance in the process
+_pending_stats: Dict[str, Counter] = defaultdict(Counter)
+_last_flush: Dict[str, float] = {}
+_stats_lock = threading.Lock()
+
+
+def cache_key(**parts) -> str:
+    """Hash the generation inputs into a stable hex key."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU cache of audio blobs stored under ``root``."""
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        commit: Optional[Callable[[], None]] = None,
+    ):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.stats_path = self.root / "stats.json"
+        self.max_bytes = max_bytes
+        # Called after every write so other containers see the change
+        self.commit = commit or (lambda: None)
+        self._stats_id = str(self.root)
+
+    def _path(self, key: str) -> Path:
+        return self.objects / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached audio for ``key`` or None, updating the counters."""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # Evicted by another container in between
+            return None
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """Like ``get`` but returns the entry's path instead of reading it."""
+        path = self._path(key)
+        try:
+            # Mark as recently used
+            now = time.time()
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return path
+
+    def put(self, key: str, data: bytes) -> Path:
+        """Store ``data`` under ``key`` and evict old entries if over budget."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write-then-rename so readers never see a partial file
+        tmp_path = path.with_name(f".{key}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+        self._evict()
+        self.flush()
+        return path
+
+    def put_file(self, key: str, src: Path) -> Path:
+        """Copy the file at ``src`` in under ``key`` without loading it into memory."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = path.with_name(f".{key}.tmp")
+        shutil.copyfile(src, tmp_path)
+        tmp_path.replace(path)
+
+        self._evict()
+        self.flush()
+        return path
+
+    def _entries(self):
+        if not self.objects.exists():
+            return []
+        entries = []
+        for path in self.objects.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            print(f"Result cache evicted {evicted} entries")
+            self._count("evictions", evicted, flush=False)
+
+    def _read_stats(self) -> dict:
+        try:
+            return json.loads(self.stats_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _count(self, counter: str, amount: int = 1, flush: bool = True) -> None:
+        """Count in memory; commit once STATS_FLUSH_SECONDS have passed since the last commit."""
+        with _stats_lock:
+            _pending_stats[self._stats_id][counter] += amount
+            now = time.monotonic()
+            due = now - _last_flush.setdefault(self._stats_id, now) >= STATS_FLUSH_SECONDS
+        if flush and due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the pending counters to the stats file and commit the volume."""
+        with _stats_lock:
+            pending = _pending_stats.pop(self._stats_id, Counter())
+            _last_flush[self._stats_id] = time.monotonic()
+            if pending:
+                stats = self._read_stats()
+                for counter, amount in pending.items():
+                    stats[counter] = stats.get(counter, 0) + amount
+                self.root.mkdir(parents=True, exist_ok=True)
+                self.stats_path.write_text(json.dumps(stats))
+        self.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters plus current size."""
+        entries = self._entries()
+        stats = self._read_stats()
+        with _stats_lock:
+            for counter, amount in _pending_stats.get(self._stats_id, {}).items():
+                stats[counter] = stats.get(counter, 0) + amount
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        stats["max_bytes"] = self.max_bytes
+        return stats
@@ -0,0 +1,152 @@
+"""Priority job queue with per-project fair share and in-flight coalescing.
+
+``JobScheduler`` sits between callers and the generation backend:
+
+- jobs are ordered by priority level (previews before full renders);
+- within a level, the project that has received the least service so far
+  goes next, so one busy project cannot starve the others;
+- a request whose inputs match a queued or running job is attached to that
+  job instead of running twice;
+- at most ``max_workers`` jobs run at the same time.
+
+The worker is any callable taking the request dict, so the scheduler can be
+driven by a stub locally and by ``process_request.remote`` in production.
+"""
+
+import itertools
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from budget import DEFAULT_DURATION
+from result_cache import cache_key
+
+PRIORITIES = {"preview": 0, "high": 1, "normal": 2, "bulk": 3}
+DEFAULT_PRIORITY = "normal"
+
+
+def request_key(data: dict) -> str:
+    """Hash of the request fields that determine the generated song."""
+    return cache_key(
+        lyrics=data.get("lyrics"),
+        structure=data.get("structure"),
+        genre=data.get("genre", "rock"),
+        duration=data.get("duration", DEFAULT_DURATION),
+        ref_audio_urls=data.get("ref_audio_urls", []),
+        output_format=data.get("output_format", "wav"),
+        output_quality=data.get("output_quality", "high"),
+    )
+
+
+def request_project(data: dict) -> str:
+    """Fair-share bucket of a request (``metadata.project``)."""
+    return (data.get("metadata") or {}).get("project") or "default"
+
+
+@dataclass
+class _Job:
+    key: str
+    data: dict
+    priority: int
+    project: str
+    seq: int
+    future: Future = field(default_factory=Future)
+    waiters: int = 1
+
+
+class JobScheduler:
+    """Thread-based dispatcher; see the module docstring."""
+
+    def __init__(self, worker: Callable[[dict], Any], max_workers: int = 2):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.worker = worker
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._queued: List[_Job] = []
+        self._inflight: Dict[str, _Job] = {}
+        self._running = 0
+        self._served: Dict[str, int] = defaultdict(int)
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self.stats = {"submitted": 0, "coalesced": 0, "completed": 0, "failed": 0}
+
+    def submit(self, data: dict, priority: Optional[str] = None, key: Optional[str] = None) -> Future:
+        """
+        Queue a request and return a Future for the worker's result.
+
+        Requests with the same key as a queued or running job share its Future.
+        A queued job inherits the most urgent priority of everyone waiting on it.
+        """
+        level = PRIORITIES[priority or data.get("priority") or DEFAULT_PRIORITY]
+        key = key or request_key(data)
+
+        with self._lock:
+            self.stats["submitted"] += 1
+            job = self._inflight.get(key)
+            if job is not None:
+                self.stats["coalesced"] += 1
+                job.waiters += 1
+                job.priority = min(job.priority, level)
+                return job.future
+
+            job = _Job(key=key, data=data, priority=level, project=request_project(data), seq=next(self._seq))
+            self._inflight[key] = job
+            self._queued.append(job)
+            self._dispatch_locked()
+            return job.future
+
+    def _next_locked(self) -> _Job:
+        level = min(job.priority for job in self._queued)
+        candidates = [job for job in self._queued if job.priority == level]
+        # Least-served project first, FIFO inside a project
+        job = min(candidates, key=lambda j: (self._served[j.project], j.seq))
+        self._queued.remove(job)
+        return job
+
+    def _dispatch_locked(self) -> None:
+        while self._queued and self._running < self.max_workers:
+            job = self._next_locked()
+            self._running += 1
+            self._served[job.project] += 1
+            thread = threading.Thread(target=self._run, args=(job,), daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _run(self, job: _Job) -> None:
+        try:
+            result = self.worker(job.data)
+        except BaseException as e:
+            outcome, value = "failed", e
+        else:
+            outcome, value = "completed", result
+
+        with self._lock:
+            self._running -= 1
+            self._inflight.pop(job.key, None)
+            self.stats[outcome] += 1
+            self._dispatch_locked()
+
+        if outcome == "failed":
+            job.future.set_exception(value)
+        else:
+            job.future.set_result(value)
+
+    def pending(self) -> int:
+        """Jobs queued or running."""
+        with self._lock:
+            return len(self._queued) + self._running
+
+    def join(self) -> None:
+        """Block until every submitted job has finished."""
+        while True:
+            with self._lock:
+                threads = [t for t in self._threads if t.is_alive()]
+                self._threads = threads
+                if not threads and not self._queued:
+                    return
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,75 @@
+"""Encode generated songs to the requested ``output_format`` with ffmpeg.
+
+YuE decodes to 44.1 kHz WAV (infer.py itself writes mp3). Encoding to
+FLAC, MP3 or Opus happens in the worker before the song becomes an
+artifact, so the webhook, Telegram and Drive steps move the small file.
+"""
+
+import subprocess
+from pathlib import Path
+from typing import List
+
+from artifacts import sniff_format
+
+OUTPUT_FORMATS = ("wav", "flac", "mp3", "opus")
+QUALITIES = ("low", "medium", "high")
+DEFAULT_FORMAT = "wav"
+DEFAULT_QUALITY = "high"
+
+_CODECS = {
+    "wav": ["-c:a", "pcm_s16le"],
+    "flac": ["-c:a", "flac", "-sample_fmt", "s16", "-compression_level", "8"],
+    "mp3": ["-c:a", "libmp3lame"],
+    "opus": ["-c:a", "libopus", "-vbr", "on"],
+}
+
+# Lossless formats ignore the quality level
+BITRATES = {
+    "mp3": {"low": "128k", "medium": "192k", "high": "320k"},
+    "opus": {"low": "64k", "medium": "96k", "high": "160k"},
+}
+
+# What sniff_format reports for a file already in the target format
+_CONTAINERS = {"opus": "ogg"}
+
+
+def encoder_args(output_format: str, quality: str = DEFAULT_QUALITY) -> List[str]:
+    """ffmpeg output options for ``output_format`` at ``quality``."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Format must be one of {list(OUTPUT_FORMATS)}")
+    if quality not in QUALITIES:
+        raise ValueError(f"Quality must be one of {list(QUALITIES)}")
+    args = list(_CODECS[output_format])
+    if output_format in BITRATES:
+        args += ["-b:a", BITRATES[output_format][quality]]
+    return args
+
+
+def probe_duration(path: Path) -> float:
+    """Length of a media file in seconds (ffprobe)."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(f"ffprobe could not read {path}: {result.stderr.strip()}")
+    return float(result.stdout.strip())
+
+
+def transcode_file(src: Path, dest_dir: Path, output_format: str, quality: str = DEFAULT_QUALITY) -> Path:
+    """
+    Encode ``src`` into ``dest_dir`` and return the new file.
+
+    ``src`` is returned unchanged when it is already in ``output_format``,
+    so a lossy source is never re-encoded into itself.
+    """
+    args = encoder_args(output_format, quality)
+    with open(src, "rb") as f:
+        source_format = sniff_format(f.read(4))
+    if source_format == _CONTAINERS.get(output_format, output_format):
+        return Path(src)
+
+    dest = Path(dest_dir) / f"{Path(src).stem}.{output_format}"
+    cmd = ["ffmpeg", "-v", "error", "-y", "-i", str(src), "-vn", "-map_metadata", "-1", *args, str(dest)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not encode {output_format}: {result.stderr.strip()}")
+    return dest
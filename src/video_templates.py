@@ -0,0 +1,131 @@
+"""Pre-processed video backgrounds, reused across renders.
+
+Decoding and scaling ``images/background.jpg``, converting it to yuv420p and
+encoding the stretches of a song where no lyric is on screen come out the
+same for every render with the same image, size and encoder settings.
+``TemplateCache`` does that work once per combination and keeps:
+
+- the background frame at the image's own size (the size the ``-loop 1``
+  encode produces), or scaled and padded to a requested size, as a single
+  yuv420p Y4M frame that the concat demuxer reads without decoding or
+  converting it (a black frame when there is no background image);
+- a pre-encoded H.264 chunk of the bare background, one frame per ``hold``
+  seconds, that is stream-copied into videos wherever no lyric is shown.
+
+Entries are stored in a ``ResultCache`` under ``output/templates``, so they
+are evicted by LRU and travel with the workflow's pipeline cache.
+"""
+
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from prefetch import file_digest
+from result_cache import ResultCache, cache_key
+
+TEMPLATE_DIR = Path("output/templates")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Size of the black frame used when there is no background image
+WIDTH, HEIGHT = 1920, 1080
+
+
+def _ffmpeg(cmd: List[str], what: str) -> None:
+    result = subprocess.run(["ffmpeg", "-v", "error", "-y", *cmd], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not build {what}: {result.stderr.strip()}")
+
+
+def image_size(image_path: Path) -> Tuple[int, int]:
+    """Width and height of an image (ffprobe)."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height",
+         "-of", "csv=p=0:s=x", str(image_path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0 or "x" not in result.stdout:
+        raise RuntimeError(f"ffprobe could not read {image_path}: {result.stderr.strip()}")
+    width, height = result.stdout.strip().split("x")[:2]
+    return int(width), int(height)
+
+
+class TemplateCache:
+    """Background frames and static chunks keyed by image hash, size and encoder settings."""
+
+    def __init__(self, root: Path = TEMPLATE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.files = ResultCache(root, max_bytes=max_bytes)
+        # Renders of a batch share the cache; each template is built once
+        self._lock = threading.Lock()
+
+    def _get_or_build(self, key: str, build, what: str) -> Path:
+        with self._lock:
+            path = self.files.get_path(key)
+            if path is not None:
+                return path
+            print(f"Building {what} template")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_path = Path(tmp_dir) / "template"
+                build(tmp_path)
+                return self.files.put_file(key, tmp_path)
+
+    def frame(self, image_path: Optional[Path], width: Optional[int] = None, height: Optional[int] = None) -> Path:
+        """
+        The background as one yuv420p Y4M frame.
+
+        Without ``width`` and ``height`` the frame keeps the image's own
+        size, like the looped-image encode. With them the image is scaled
+        to fit and padded with black. A missing ``image_path`` gives a
+        plain black frame (``WIDTH`` x ``HEIGHT`` by default, the size of
+        the background ``--loop`` creates).
+        """
+        image = Path(image_path) if image_path else None
+        if image is not None and not image.exists():
+            image = None
+        native = width is None or height is None
+        if native:
+            width, height = image_size(image) if image else (WIDTH, HEIGHT)
+        key = cache_key(
+            kind="frame",
+            image=file_digest(image, "sha256") if image else "black",
+            width=width,
+            height=height,
+        )
+
+        def build(dest: Path):
+            source = ["-i", str(image)] if image else ["-f", "lavfi", "-i", f"color=c=black:s={width}x{height}"]
+            fit = "" if native else (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                                     f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,")
+            _ffmpeg([
+                *source,
+                "-vf", f"{fit}format=yuv420p",
+                "-frames:v", "1", "-f", "yuv4mpegpipe", str(dest),
+            ], "background frame")
+
+        return self._get_or_build(key, build, "background frame")
+
+    def static_chunk(self, frame: Path, encoder_args: List[str], hold: float, frames: int) -> Path:
+        """
+        ``frames`` frames of the bare ``frame``, one every ``hold`` seconds,
+        encoded with ``encoder_args`` into an MP4 without audio.
+
+        Videos encoded with the same ``encoder_args`` can stream-copy any
+        leading part of it (concat ``outpoint``).
+        """
+        key = cache_key(
+            kind="static",
+            frame=file_digest(Path(frame), "sha256"),
+            style=encoder_args,
+            hold=hold,
+            frames=frames,
+        )
+
+        def build(dest: Path):
+            _ffmpeg([
+                "-i", str(frame),
+                "-vf", f"loop=loop={frames - 1}:size=1:start=0,setpts=N*{hold}/TB",
+                *encoder_args,
+                "-an", "-f", "mp4", str(dest),
+            ], "static chunk")
+
+        return self._get_or_build(key, build, "static chunk")
@@ -0,0 +1,749 @@
+"""In-process YuE inference engine.
+
+The original pipeline launched ``/root/YuE/inference/infer.py`` for every
+request, which reloaded both LLaMA checkpoints and the xcodec decoder from
+``/models`` each time. ``ResidentYuEEngine`` loads everything once (from
+``@modal.enter``) and serves every later call from memory.
+
+The model work is hidden behind ``YuEBackend`` so the engine can be driven by
+a small stub backend on CPU. ``SubprocessYuEEngine`` keeps the old
+``infer.py`` path available as a fallback mode.
+"""
+
+import io
+import os
+import re
+import sys
+import wave
+import subprocess
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Location of the cloned YuE repository inside the Modal image
+YUE_INFERENCE_DIR = Path("/root/YuE/inference")
+
+# xcodec runs at 50 frames per second; stage 2 works on 6 second windows
+CODEC_FRAME_RATE = 50
+STAGE2_WINDOW_FRAMES = 6 * CODEC_FRAME_RATE
+OUTPUT_SAMPLE_RATE = 44100
+
+
+@dataclass
+class SamplingParams:
+    """Decoding parameters shared by every engine mode."""
+    top_p: float = 0.93
+    temperature: float = 1.0
+    repetition_penalty: float = 1.2
+    max_new_tokens: int = 3000
+    run_n_segments: int = 2
+    stage2_batch_size: int = 4
+    # Per-segment stage 1 limits from the duration budget (None: max_new_tokens each)
+    segment_tokens: Optional[List[int]] = None
+    # Stop stage 1 once this many audio tokens were produced (0: no limit)
+    target_tokens: int = 0
+
+    def segment_count(self, available: int) -> int:
+        """Number of lyric segments stage 1 should run."""
+        planned = len(self.segment_tokens) if self.segment_tokens else self.run_n_segments
+        return min(available, planned)
+
+    def segment_limit(self, i: int, produced: int) -> int:
+        """Token limit for segment ``i`` after ``produced`` audio tokens; 0 means stop."""
+        limit = self.max_new_tokens
+        if self.segment_tokens and i < len(self.segment_tokens):
+            limit = self.segment_tokens[i]
+        if self.target_tokens:
+            limit = min(limit, self.target_tokens - produced)
+        return max(limit, 0)
+
+    def stage1_settings(self) -> tuple:
+        """Sampling settings that must match for rows to share a stage 1 ``generate()``."""
+        return (self.top_p, self.temperature, self.repetition_penalty)
+
+    def stage2_settings(self) -> tuple:
+        """Settings that must match for tracks to share a ``stage2_batch`` call."""
+        return (self.stage2_batch_size,)
+
+
+def _group_by(items: list, key: Callable) -> List[list]:
+    """Split ``items`` into lists sharing ``key(item)``, keeping first-seen order."""
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return list(groups.values())
+
+
+@dataclass
+class Stage1Output:
+    """Codebook-0 xcodec ids produced by stage 1, shape ``(1, frames)``."""
+    vocals: np.ndarray
+    instrumentals: np.ndarray
+
+    def to_bytes(self) -> bytes:
+        """Serialize both tracks as a compressed ``.npz`` blob."""
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, vocals=self.vocals, instrumentals=self.instrumentals)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Stage1Output":
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(vocals=arrays["vocals"], instrumentals=arrays["instrumentals"])
+
+
+def split_lyrics(lyrics: str) -> List[str]:
+    """Split YuE-formatted lyrics into ``[section]`` blocks (same as infer.py)."""
+    pattern = r"\[(\w+)\](.*?)(?=\[|\Z)"
+    segments = re.findall(pattern, lyrics, re.DOTALL)
+    return [f"[{tag}]\n{body.strip()}\n\n" for tag, body in segments]
+
+
+def resample(waveform: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Polyphase resampling along the last axis."""
+    if source_rate == target_rate:
+        return waveform
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    factor = gcd(source_rate, target_rate)
+    return resample_poly(waveform, target_rate // factor, source_rate // factor, axis=-1)
+
+
+def encode_wav(waveform: np.ndarray, sample_rate: int) -> bytes:
+    """Encode a float waveform in ``[-1, 1]`` as 16-bit PCM WAV bytes."""
+    samples = np.asarray(waveform, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    elif samples.shape[0] < samples.shape[1]:
+        # (channels, samples) -> (samples, channels)
+        samples = samples.T
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(pcm.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def concat_wav(parts: List[bytes]) -> bytes:
+    """Join WAV blobs with identical formats into a single WAV file."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        for n, part in enumerate(parts):
+            with wave.open(io.BytesIO(part), "rb") as wav_file:
+                if n == 0:
+                    out.setparams(wav_file.getparams())
+                out.writeframes(wav_file.readframes(wav_file.getnframes()))
+    return buffer.getvalue()
+
+
+class YuEBackend(ABC):
+    """Model operations needed by ``ResidentYuEEngine``.
+
+    A backend owns the loaded weights. Implementations must be safe to call
+    repeatedly after a single ``load()``.
+    """
+
+    sample_rate: int = OUTPUT_SAMPLE_RATE
+
+    def load(self) -> None:
+        """Load weights into memory. Called once per container."""
+
+    @abstractmethod
+    def stage1(self, genre: str, segments: List[str], params: SamplingParams) -> Stage1Output:
+        """Generate codebook-0 ids for vocals and instrumentals."""
+
+    @abstractmethod
+    def stage2(self, codes: np.ndarray, params: SamplingParams) -> np.ndarray:
+        """Expand codebook-0 ids ``(1, frames)`` to all codebooks ``(8, frames)``."""
+
+    @abstractmethod
+    def decode(self, vocals: np.ndarray, instrumentals: np.ndarray) -> np.ndarray:
+        """Decode full codebook ids of both tracks into a mixed waveform."""
+
+    def stage1_batch(self, genres: List[str], segments_list: List[List[str]],
+                     params_list: List[SamplingParams]) -> List[Stage1Output]:
+        """Batched ``stage1``. The default runs the items one after another."""
+        return [
+            self.stage1(genre, segments, params)
+            for genre, segments, params in zip(genres, segments_list, params_list)
+        ]
+
+    def stage2_batch(self, codes_list: List[np.ndarray], params: SamplingParams) -> List[np.ndarray]:
+        """Batched ``stage2``. The default runs the items one after another."""
+        return [self.stage2(codes, params) for codes in codes_list]
+
+    def stage1_segments(self, genre: str, segments: List[str],
+                        params: SamplingParams) -> Iterator[Stage1Output]:
+        """Yield stage 1 tokens one lyric segment at a time.
+
+        The default yields the whole song at once; backends that decode
+        segment by segment should override this to enable streaming.
+        """
+        yield self.stage1(genre, segments, params)
+
+
+def _run_isolated(batch_fn, single_fn, items: list) -> list:
+    """Run ``batch_fn`` over all items, retrying one by one if the batch fails.
+
+    Items that still fail on their own are returned as the raised exception,
+    so a single bad request never takes the rest of the batch down with it.
+    """
+    try:
+        return batch_fn(items)
+    except Exception as e:
+        if len(items) == 1:
+            return [e]
+        print(f"Batched call failed ({e}), retrying {len(items)} items individually")
+
+    results = []
+    for item in items:
+        try:
+            results.append(single_fn(item))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class ResidentYuEEngine:
+    """Serves generation requests from a backend loaded once."""
+
+    # Stage 1 output can be persisted and rendered again later
+    supports_tokens = True
+
+    def __init__(self, backend: YuEBackend):
+        self.backend = backend
+        self.loaded = False
+
+    def load(self) -> None:
+        if not self.loaded:
+            self.backend.load()
+            self.loaded = True
+
+    def generate_stage1(self, lyrics: str, genre: str, params: SamplingParams) -> Stage1Output:
+        """Run only the 7B stage 1 model."""
+        self.load()
+        segments = split_lyrics(lyrics)
+        if not segments:
+            raise ValueError("Lyrics contain no [section] blocks")
+        return self.backend.stage1(genre, segments, params)
+
+    def render(self, stage1: Stage1Output, params: SamplingParams, sample_rate: int = None) -> bytes:
+        """Run stage 2 and decoding on stage 1 tokens and return WAV bytes."""
+        self.load()
+        vocals = self.backend.stage2(stage1.vocals, params)
+        instrumentals = self.backend.stage2(stage1.instrumentals, params)
+        waveform = self.backend.decode(vocals, instrumentals)
+        sample_rate = sample_rate or self.backend.sample_rate
+        return encode_wav(resample(waveform, self.backend.sample_rate, sample_rate), sample_rate)
+
+    def generate(self, lyrics: str, genre: str, params: SamplingParams) -> bytes:
+        """Run stage 1, stage 2 and decoding in-process and return WAV bytes."""
+        return self.render(self.generate_stage1(lyrics, genre, params), params)
+
+    def generate_stream(self, lyrics: str, genre: str, params: SamplingParams,
+                        on_stage1: Callable[[Stage1Output], None] = None) -> Iterator[bytes]:
+        """Yield WAV bytes for each segment as soon as it has been decoded.
+
+        ``on_stage1`` receives the tokens of the whole song once stage 1 has
+        produced every segment.
+        """
+        self.load()
+        segments = split_lyrics(lyrics)
+        if not segments:
+            raise ValueError("Lyrics contain no [section] blocks")
+
+        parts = []
+        for stage1 in self.backend.stage1_segments(genre, segments, params):
+            parts.append(stage1)
+            yield self.render(stage1, params)
+
+        if on_stage1 is not None:
+            on_stage1(Stage1Output(
+                vocals=np.concatenate([part.vocals for part in parts], axis=1),
+                instrumentals=np.concatenate([part.instrumentals for part in parts], axis=1),
+            ))
+
+    def generate_batch(self, items: List[Tuple[str, str, SamplingParams]],
+                       on_stage1: Callable[[int, Stage1Output], None] = None) -> List[dict]:
+        """Generate several ``(lyrics, genre, params)`` items through shared model passes.
+
+        Returns one dict per item, in order: ``{"audio": bytes}`` on success or
+        ``{"error": str}`` when that item failed. ``on_stage1`` is called with
+        the item index and its tokens as soon as stage 1 finishes.
+        """
+        self.load()
+        results: List[dict] = [{} for _ in items]
+
+        pending = []
+        for idx, (lyrics, genre, params) in enumerate(items):
+            segments = split_lyrics(lyrics)
+            if segments:
+                pending.append((idx, genre, segments, params))
+            else:
+                results[idx] = {"error": "Lyrics contain no [section] blocks"}
+        if not pending:
+            return results
+
+        backend = self.backend
+        stage1 = _run_isolated(
+            lambda batch: backend.stage1_batch(
+                [item[1] for item in batch], [item[2] for item in batch], [item[3] for item in batch]
+            ),
+            lambda item: backend.stage1(item[1], item[2], item[3]),
+            pending,
+        )
+
+        decoded = []
+        for (idx, _, _, _), output in zip(pending, stage1):
+            if isinstance(output, Exception):
+                results[idx] = {"error": f"Stage 1 failed: {output}"}
+            else:
+                decoded.append((idx, output))
+                if on_stage1 is not None:
+                    on_stage1(idx, output)
+
+        # Vocals and instrumentals of every item with the same stage 2 settings go through together
+        stage2 = {}
+        for group in _group_by(decoded, lambda item: items[item[0]][2].stage2_settings()):
+            params = items[group[0][0]][2]
+            tracks = [codes for _, output in group for codes in (output.vocals, output.instrumentals)]
+            outputs = _run_isolated(
+                lambda batch: backend.stage2_batch(batch, params),
+                lambda codes: backend.stage2(codes, params),
+                tracks,
+            )
+            for n, (idx, _) in enumerate(group):
+                stage2[idx] = outputs[2 * n:2 * n + 2]
+
+        for idx, _ in decoded:
+            vocals, instrumentals = stage2[idx]
+            failed = next((out for out in (vocals, instrumentals) if isinstance(out, Exception)), None)
+            if failed is not None:
+                results[idx] = {"error": f"Stage 2 failed: {failed}"}
+                continue
+            try:
+                waveform = backend.decode(vocals, instrumentals)
+                results[idx] = {"audio": encode_wav(waveform, backend.sample_rate)}
+            except Exception as e:
+                results[idx] = {"error": f"Decoding failed: {e}"}
+
+        return results
+
+
+class SubprocessYuEEngine:
+    """Fallback mode: runs the upstream infer.py script for every request."""
+
+    supports_tokens = False
+
+    def __init__(self, s1_path: Path, s2_path: Path):
+        self.s1_path = s1_path
+        self.s2_path = s2_path
+
+    def load(self) -> None:
+        """Nothing to preload; infer.py loads the weights itself."""
+
+    def generate(self, lyrics: str, genre: str, params: SamplingParams) -> bytes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_root = Path(tmp_dir)
+
+            lyrics_file = tmp_root / "lyrics.txt"
+            lyrics_file.write_text(lyrics)
+            genre_file = tmp_root / "genre.txt"
+            genre_file.write_text(genre)
+
+            output_dir = tmp_root / "output"
+            output_dir.mkdir()
+
+            # YuE adds 'xcodec_mini_infer' to path automatically in infer.py
+            bash_cmd = f"python3 {YUE_INFERENCE_DIR / 'infer.py'} " \
+                       f"--stage1_model {self.s1_path} " \
+                       f"--stage2_model {self.s2_path} " \
+                       f"--genre_txt {genre_file} " \
+                       f"--lyrics_txt {lyrics_file} " \
+                       f"--run_n_segments {params.run_n_segments} " \
+                       f"--stage2_batch_size {params.stage2_batch_size} " \
+                       f"--output_dir {output_dir} " \
+                       f"--cuda_idx 0 " \
+                       f"--max_new_tokens {params.max_new_tokens}"
+
+            print(f"Executing YuE subprocess engine: {bash_cmd}")
+
+            process = subprocess.run(
+                ["bash", "-c", bash_cmd],
+                capture_output=True,
+                text=True,
+                cwd=str(YUE_INFERENCE_DIR)  # Run from inference dir where infer.py lives
+            )
+
+            if process.returncode != 0:
+                print(f"YuE Failed: {process.stderr}")
+                raise RuntimeError(f"YuE Inference Error: {process.stderr}")
+
+            output_files = list(output_dir.glob("*.mp3")) or list(output_dir.glob("*.wav"))
+            if not output_files:
+                raise RuntimeError("YuE did not generate any audio files.")
+
+            return output_files[0].read_bytes()
+
+    def generate_batch(self, items: List[Tuple[str, str, SamplingParams]],
+                       on_stage1: Callable[[int, Stage1Output], None] = None) -> List[dict]:
+        """infer.py has no batch mode, so items run one after another."""
+        results = []
+        for lyrics, genre, params in items:
+            try:
+                results.append({"audio": self.generate(lyrics, genre, params)})
+            except Exception as e:
+                results.append({"error": str(e)})
+        return results
+
+
+class TransformersYuEBackend(YuEBackend):
+    """GPU backend that mirrors infer.py with the models kept resident."""
+
+    def __init__(self, s1_path: Path, s2_path: Path, device: str = "cuda:0"):
+        self.s1_path = s1_path
+        self.s2_path = s2_path
+        self.device = device
+
+    def load(self) -> None:
+        import torch
+        from omegaconf import OmegaConf
+        from transformers import AutoModelForCausalLM
+
+        # infer.py relies on these being importable from the inference dir
+        for extra in (
+            YUE_INFERENCE_DIR,
+            YUE_INFERENCE_DIR / "xcodec_mini_infer",
+            YUE_INFERENCE_DIR / "xcodec_mini_infer" / "descriptaudiocodec",
+        ):
+            if str(extra) not in sys.path:
+                sys.path.append(str(extra))
+
+        from mmtokenizer import _MMSentencePieceTokenizer
+        from codecmanipulator import CodecManipulator
+        from models.soundstream_hubert_new import SoundStream
+        from vocoder import build_codec_model
+
+        xcodec_dir = YUE_INFERENCE_DIR / "xcodec_mini_infer"
+        self.torch = torch
+        self.mmtokenizer = _MMSentencePieceTokenizer(
+            str(YUE_INFERENCE_DIR / "mm_tokenizer_v0.2_hf" / "tokenizer.model")
+        )
+        self.codectool = CodecManipulator("xcodec", 0, 1)
+        self.codectool_stage2 = CodecManipulator("xcodec", 0, 8)
+
+        print(f"Loading YuE stage 1 from {self.s1_path}")
+        self.stage1_model = AutoModelForCausalLM.from_pretrained(
+            str(self.s1_path),
+            torch_dtype=torch.bfloat16,
+            attn_implementation="flash_attention_2",
+        ).to(self.device).eval()
+
+        print(f"Loading YuE stage 2 from {self.s2_path}")
+        self.stage2_model = AutoModelForCausalLM.from_pretrained(
+            str(self.s2_path),
+            torch_dtype=torch.float16,
+            attn_implementation="flash_attention_2",
+        ).to(self.device).eval()
+
+        print("Loading xcodec decoder and vocoders")
+        model_config = OmegaConf.load(str(xcodec_dir / "final_ckpt" / "config.yaml"))
+        self.codec_model = SoundStream(**model_config.generator.config).to(self.device)
+        state = torch.load(
+            str(xcodec_dir / "final_ckpt" / "ckpt_00360000.pth"),
+            map_location="cpu",
+            weights_only=False,
+        )
+        self.codec_model.load_state_dict(state["codec_model"])
+        self.codec_model.eval()
+
+        self.vocal_decoder, self.inst_decoder = build_codec_model(
+            str(xcodec_dir / "decoders" / "config.yaml"),
+            str(xcodec_dir / "decoders" / "decoder_131000.pth"),
+            str(xcodec_dir / "decoders" / "decoder_151000.pth"),
+        )
+
+    def _block_list(self, *ranges):
+        from transformers import LogitsProcessor, LogitsProcessorList
+
+        torch = self.torch
+
+        class BlockTokenRangeProcessor(LogitsProcessor):
+            def __init__(self, start_id, end_id):
+                self.blocked_token_ids = list(range(start_id, end_id))
+
+            def __call__(self, input_ids, scores):
+                scores[:, self.blocked_token_ids] = -float("inf")
+                return scores
+
+        return LogitsProcessorList([BlockTokenRangeProcessor(a, b) for a, b in ranges])
+
+    def stage1(self, genre: str, segments: List[str], params: SamplingParams) -> Stage1Output:
+        return self.stage1_batch([genre], [segments], [params])[0]
+
+    def _segment_prompt(self, genre: str, segments: List[str], i: int) -> List[int]:
+        """Prompt ids for lyric segment ``i``; the first one carries the song header."""
+        tok = self.mmtokenizer
+        if i == 0:
+            full_lyrics = "\n".join(segments)
+            head = f"Generate music from the given lyrics segment by segment.\n[Genre] {genre}\n{full_lyrics}"
+            prompt = tok.tokenize(head) + tok.tokenize("[start_of_segment]")
+        else:
+            prompt = tok.tokenize("[end_of_segment]") + tok.tokenize("[start_of_segment]")
+        return prompt + tok.tokenize(segments[i]) + [tok.soa] + self.codectool.sep_ids
+
+    def stage1_segments(self, genre: str, segments: List[str],
+                        params: SamplingParams) -> Iterator[Stage1Output]:
+        history: List[int] = []
+        produced = 0
+        for i in range(params.segment_count(len(segments))):
+            limit = params.segment_limit(i, produced)
+            if limit <= 0:
+                break
+            prompt = self._segment_prompt(genre, segments, i)
+            guidance_scale = 1.5 if i == 0 else 1.2
+            max_context = 16384 - limit - 1
+            tokens = self._generate_stage1([(history + prompt)[-max_context:]], [limit], guidance_scale, params)[0]
+            history = history + prompt + tokens
+            produced += len(tokens)
+            yield self._split_tracks(np.asarray(prompt + tokens))
+
+    def stage1_batch(self, genres: List[str], segments_list: List[List[str]],
+                     params_list: List[SamplingParams]) -> List[Stage1Output]:
+        histories: List[List[int]] = [[] for _ in genres]
+        produced = [0] * len(genres)
+        n_steps = [params.segment_count(len(segments)) for params, segments in zip(params_list, segments_list)]
+
+        for i in range(max(n_steps)):
+            active, prompts, inputs, limits = [], [], [], []
+            for k in range(len(genres)):
+                limit = params_list[k].segment_limit(i, produced[k]) if i < n_steps[k] else 0
+                if limit <= 0:
+                    continue
+                prompt = self._segment_prompt(genres[k], segments_list[k], i)
+                active.append(k)
+                prompts.append(prompt)
+                limits.append(limit)
+                inputs.append((histories[k] + prompt)[-(16384 - limit - 1):])
+            if not active:
+                break
+
+            guidance_scale = 1.5 if i == 0 else 1.2
+            # Rows sampled with different settings cannot share a generate() call
+            rows = zip(active, prompts, inputs, limits)
+            for group in _group_by(list(rows), lambda row: params_list[row[0]].stage1_settings()):
+                new_tokens = self._generate_stage1(
+                    [row[2] for row in group], [row[3] for row in group], guidance_scale,
+                    params_list[group[0][0]],
+                )
+                for (k, prompt, _, _), tokens in zip(group, new_tokens):
+                    histories[k] = histories[k] + prompt + tokens
+                    produced[k] += len(tokens)
+
+        return [self._split_tracks(np.asarray(history)) for history in histories]
+
+    def _generate_stage1(self, inputs: List[List[int]], limits: List[int], guidance_scale: float,
+                         params: SamplingParams) -> List[List[int]]:
+        """Sample one segment for every row, left-padded to a common width.
+
+        Each row stops at its own EOA or at its entry in ``limits``, whichever
+        comes first, so short songs do not pay for the longest row in the batch.
+        """
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        torch = self.torch
+        tok = self.mmtokenizer
+
+        width = max(len(ids) for ids in inputs)
+        input_ids = torch.full((len(inputs), width), tok.eoa, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        for row, ids in enumerate(inputs):
+            input_ids[row, width - len(ids):] = torch.as_tensor(ids)
+            attention_mask[row, width - len(ids):] = 1
+
+        row_limits = torch.as_tensor(limits, device=self.device)
+
+        class RowBudget(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return (input_ids.shape[1] - width) >= row_limits
+
+        with torch.no_grad():
+            output = self.stage1_model.generate(
+                input_ids=input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
+                max_new_tokens=max(limits),
+                min_new_tokens=min(100, min(limits)),
+                do_sample=True,
+                top_p=params.top_p,
+                temperature=params.temperature,
+                repetition_penalty=params.repetition_penalty,
+                eos_token_id=tok.eoa,
+                pad_token_id=tok.eoa,
+                logits_processor=self._block_list((0, 32002), (32016, 32016)),
+                stopping_criteria=StoppingCriteriaList([RowBudget()]),
+                guidance_scale=guidance_scale,
+            )
+
+        # Rows stop independently; everything after a row's first EOA is padding
+        results = []
+        for row, limit in zip(output[:, width:].cpu().tolist(), limits):
+            row = row[:limit]
+            if tok.eoa in row:
+                row = row[:row.index(tok.eoa) + 1]
+            else:
+                row = row + [tok.eoa]
+            results.append(row)
+        return results
+
+    def _split_tracks(self, ids: np.ndarray) -> Stage1Output:
+        """De-interleave the stage 1 token stream into vocal/instrumental ids."""
+        soa_idx = np.where(ids == self.mmtokenizer.soa)[0]
+        eoa_idx = np.where(ids == self.mmtokenizer.eoa)[0]
+        vocals, instrumentals = [], []
+        for begin, end in zip(soa_idx, eoa_idx):
+            codec_ids = ids[begin + 1:end]
+            if len(codec_ids) and codec_ids[0] == 32016:
+                codec_ids = codec_ids[1:]
+            codec_ids = codec_ids[:2 * (codec_ids.shape[0] // 2)].reshape(-1, 2).T
+            vocals.append(self.codectool.ids2npy(codec_ids[0]))
+            instrumentals.append(self.codectool.ids2npy(codec_ids[1]))
+        if not vocals:
+            raise ValueError("Stage 1 produced no audio segment (no soa/eoa pair)")
+        return Stage1Output(
+            vocals=np.concatenate(vocals, axis=1),
+            instrumentals=np.concatenate(instrumentals, axis=1),
+        )
+
+    def _stage2_windows(self, windows: np.ndarray) -> np.ndarray:
+        """Teacher-forced stage 2 over ``(batch, frames)`` offset codebook-0 ids."""
+        torch = self.torch
+        tok = self.mmtokenizer
+
+        prompt_ids = np.concatenate([
+            np.tile([tok.soa, tok.stage_1], (windows.shape[0], 1)),
+            windows,
+            np.tile([tok.stage_2], (windows.shape[0], 1)),
+        ], axis=1)
+
+        codec_ids = torch.as_tensor(windows).to(self.device)
+        prompt_ids = torch.as_tensor(prompt_ids).to(self.device)
+        len_prompt = prompt_ids.shape[-1]
+        block_list = self._block_list((0, 46358), (53526, tok.vocab_size))
+
+        for frame_idx in range(codec_ids.shape[1]):
+            cb0 = codec_ids[:, frame_idx:frame_idx + 1]
+            prompt_ids = torch.cat([prompt_ids, cb0], dim=1)
+            with torch.no_grad():
+                prompt_ids = self.stage2_model.generate(
+                    input_ids=prompt_ids,
+                    min_new_tokens=7,
+                    max_new_tokens=7,
+                    eos_token_id=tok.eoa,
+                    pad_token_id=tok.eoa,
+                    logits_processor=block_list,
+                )
+
+        return prompt_ids.cpu().numpy()[:, len_prompt:]
+
+    def stage2(self, codes: np.ndarray, params: SamplingParams) -> np.ndarray:
+        return self.stage2_batch([codes], params)[0]
+
+    def stage2_batch(self, codes_list: List[np.ndarray], params: SamplingParams) -> List[np.ndarray]:
+        # Pool the full 6 s windows of every item so the GPU sees large batches
+        pieces: List[List[np.ndarray]] = []
+        windows, owners = [], []
+        remainders = []
+        for item, codes in enumerate(codes_list):
+            codec_ids = self.codectool.offset_tok_ids(
+                self.codectool.unflatten(codes.astype(np.int32), n_quantizer=1),
+                global_offset=self.codectool.global_offset,
+                codebook_size=self.codectool.codebook_size,
+                num_codebooks=self.codectool.num_codebooks,
+            ).astype(np.int32)
+            full_frames = codec_ids.shape[1] // STAGE2_WINDOW_FRAMES * STAGE2_WINDOW_FRAMES
+            for start in range(0, full_frames, STAGE2_WINDOW_FRAMES):
+                windows.append(codec_ids[0, start:start + STAGE2_WINDOW_FRAMES])
+                owners.append(item)
+            remainders.append(codec_ids[:, full_frames:])
+            pieces.append([])
+
+        batch = max(params.stage2_batch_size, 1)
+        for start in range(0, len(windows), batch):
+            output = self._stage2_windows(np.stack(windows[start:start + batch]))
+            for row, item in zip(output, owners[start:start + batch]):
+                pieces[item].append(row)
+
+        # Trailing partial windows have unique lengths and run on their own
+        for item, remainder in enumerate(remainders):
+            if remainder.shape[1]:
+                pieces[item].append(self._stage2_windows(remainder)[0])
+
+        return [self._fix_codes(self.codectool_stage2.ids2npy(np.concatenate(rows))) for rows in pieces]
+
+    @staticmethod
+    def _fix_codes(output: np.ndarray) -> np.ndarray:
+        """Replace out-of-range codes with the most frequent code of their row."""
+        for row in output:
+            invalid = (row < 0) | (row > 1023)
+            if invalid.any():
+                values, counts = np.unique(row, return_counts=True)
+                row[invalid] = values[np.argmax(counts)]
+        return output
+
+    def _vocode(self, codes: np.ndarray, decoder):
+        torch = self.torch
+        compressed = torch.as_tensor(codes.astype(np.int16), dtype=torch.long).unsqueeze(1)
+        with torch.no_grad():
+            embed = self.codec_model.get_embed(compressed.to(self.device))
+            return decoder(torch.as_tensor(embed).to(self.device)).detach().cpu()
+
+    def _recon(self, codes: np.ndarray):
+        torch = self.torch
+        codes = torch.as_tensor(codes.astype(np.int16), dtype=torch.long)
+        with torch.no_grad():
+            decoded = self.codec_model.decode(codes.unsqueeze(0).permute(1, 0, 2).to(self.device))
+        return decoded.cpu().squeeze(0)
+
+    def decode(self, vocals: np.ndarray, instrumentals: np.ndarray) -> np.ndarray:
+        import torchaudio
+        from post_process_audio import replace_low_freq_with_energy_matched
+
+        recons_mix = self._recon(vocals) + self._recon(instrumentals)
+        vocoder_mix = self._vocode(vocals, self.vocal_decoder) + self._vocode(instrumentals, self.inst_decoder)
+        # Same clamping as save_audio() in infer.py
+        recons_mix = recons_mix.reshape(-1, recons_mix.shape[-1]).clamp(-0.99, 0.99)
+        vocoder_mix = vocoder_mix.reshape(-1, vocoder_mix.shape[-1]).clamp(-0.99, 0.99)
+
+        # The upstream post-processing step works on files
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            recons_path = os.path.join(tmp_dir, "recons.wav")
+            vocoder_path = os.path.join(tmp_dir, "vocoder.wav")
+            final_path = os.path.join(tmp_dir, "final.wav")
+            torchaudio.save(recons_path, recons_mix, sample_rate=16000)
+            torchaudio.save(vocoder_path, vocoder_mix, sample_rate=OUTPUT_SAMPLE_RATE)
+            replace_low_freq_with_energy_matched(
+                a_file=recons_path,
+                b_file=vocoder_path,
+                c_file=final_path,
+                cutoff_freq=5500.0,
+            )
+            final, _ = torchaudio.load(final_path)
+        return final.numpy()
+
+
+def create_engine(mode: str, s1_path: Path, s2_path: Path):
+    """Build the engine for ``mode`` ("resident" or "subprocess")."""
+    if mode == "subprocess":
+        return SubprocessYuEEngine(s1_path, s2_path)
+    if mode == "resident":
+        return ResidentYuEEngine(TransformersYuEBackend(s1_path, s2_path))
+    raise ValueError(f"Unknown YuE engine mode: {mode}")
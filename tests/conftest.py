@@ -0,0 +1,93 @@
+import email
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT / "src"))
+
+
+class FakeServer:
+    """
+    Threaded HTTP server that records every request and answers from a
+    per-path script of ``(status, headers, body)`` responses, falling back
+    to ``200 {"ok": true}``.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responses = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with server._lock:
+                    server.requests.append({
+                        "method": self.command,
+                        "path": self.path,
+                        "headers": dict(self.headers),
+                        "body": body,
+                        "time": time.monotonic(),
+                    })
+                    script = server.responses.get(self.path) or []
+                    status, headers, payload = script.pop(0) if script else (200, {}, {"ok": True})
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_POST = do_PUT = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def script(self, path, *responses):
+        self.responses.setdefault(path, []).extend(responses)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def multipart_parts(request: dict) -> list:
+    """``(name, filename, payload)`` of every part of a recorded multipart request."""
+    message = email.message_from_bytes(
+        f"Content-Type: {request['headers']['Content-Type']}\r\n\r\n".encode() + request["body"]
+    )
+    return [
+        (part.get_param("name", header="content-disposition"), part.get_filename(), part.get_payload(decode=True))
+        for part in message.get_payload()
+    ]
+
+
+@pytest.fixture
+def server():
+    fake = FakeServer()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory, so manifests go to its output/manifests."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    return tmp_path
@@ -0,0 +1,45 @@
+import json
+import wave
+
+import numpy as np
+
+from audio_post import TARGET_LUFS, postprocess_wav, read_wav_info
+
+RATE = 44100
+
+
+def write_wav(path, samples: np.ndarray):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def test_silent_input_reports_no_peak(tmp_path):
+    src = write_wav(tmp_path / "silent.wav", np.zeros((RATE * 5, 2)))
+
+    report = postprocess_wav(src, tmp_path / "out.wav")
+
+    assert report.peak_db is None
+    assert report.input_lufs is None
+    assert report.gain_db == 0.0
+    # The report goes into the manifest, which must stay valid JSON
+    json.dumps(report.to_dict(), allow_nan=False)
+
+
+def test_song_is_trimmed_and_normalised(tmp_path):
+    t = np.arange(RATE * 10) / RATE
+    tone = 0.05 * np.sin(2 * np.pi * 440 * t)
+    samples = np.concatenate([np.zeros(RATE * 2), tone, np.zeros(RATE * 3)])
+    src = write_wav(tmp_path / "song.wav", np.repeat(samples[:, None], 2, axis=1))
+
+    report = postprocess_wav(src, tmp_path / "out.wav")
+
+    assert abs(report.output_lufs - TARGET_LUFS) < 0.01
+    assert report.peak_db < -1.0
+    assert 1800 <= report.lead_trim_ms <= 2000
+    assert read_wav_info(tmp_path / "out.wav").frames == round(report.duration_ms * RATE / 1000)
+    json.dumps(report.to_dict(), allow_nan=False)
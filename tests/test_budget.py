@@ -0,0 +1,30 @@
+import pytest
+
+from budget import MAX_SEGMENT_SECONDS, MIN_SEGMENT_SECONDS, TOKENS_PER_SECOND, plan_budget, section_tags
+
+
+def test_duration_is_spread_over_weighted_sections():
+    budget = plan_budget(120, ["intro", "verse", "chorus", "outro"])
+
+    assert budget.segment_tokens == [2000, 4000, 4000, 2000]
+    assert budget.target_tokens == 120 * TOKENS_PER_SECOND
+    assert budget.planned_seconds == 120
+
+
+def test_short_song_drops_sections_beyond_the_minimum_segment():
+    budget = plan_budget(30, ["verse", "chorus", "verse", "chorus", "bridge"])
+
+    assert len(budget.sections) == 30 // MIN_SEGMENT_SECONDS
+    assert budget.planned_seconds == 30
+
+
+def test_sections_that_cannot_carry_the_duration_are_rejected():
+    assert plan_budget(2 * MAX_SEGMENT_SECONDS, ["verse", "chorus"]).planned_seconds == 2 * MAX_SEGMENT_SECONDS
+    with pytest.raises(ValueError, match="can only carry 120s of the requested 180s"):
+        plan_budget(180, ["verse", "chorus"])
+    with pytest.raises(ValueError):
+        plan_budget(95, [])
+
+
+def test_section_tags():
+    assert section_tags("[Verse]\nla\n\n[chorus]\nla la\n") == ["verse", "chorus"]
@@ -0,0 +1,167 @@
+import json
+import mimetypes
+from pathlib import Path
+
+import requests
+
+from conftest import multipart_parts
+from delivery import MultipartStream, RateLimiter, pooled_session, send_with_retries
+from manifest import StageManifest
+from send_to_telegram import plan_albums, send_to_telegram
+from send_to_webhook import send_to_webhook
+
+TOKEN = "123:abc"
+CHAT_ID = "42"
+
+
+def make_file(directory: Path, name: str, data: bytes = b"") -> Path:
+    path = directory / name
+    path.write_bytes(data or name.encode() * 100)
+    return path
+
+
+def owned_by_request(*paths: Path) -> StageManifest:
+    """Record ``paths`` as a request's artifacts, as the pipeline does."""
+    manifest = StageManifest("req_test")
+    manifest.record("postprocess", "digest", paths)
+    return manifest
+
+
+def test_multipart_stream_matches_requests_encoding(tmp_path):
+    song = make_file(tmp_path, "song.wav", bytes(range(256)) * 40)
+    video = make_file(tmp_path, "clip.mp4")
+    fields = [("metadata", json.dumps({"project": "musicmaker"})), ("chat_id", "42")]
+    files = [("audio", song, song.name), ("video", video, "renamed.mp4")]
+
+    prepared = requests.Request("POST", "http://localhost/", data=fields, files=[
+        (key, (name, path.read_bytes(), mimetypes.guess_type(name)[0])) for key, path, name in files
+    ]).prepare()
+    boundary = prepared.headers["Content-Type"].split("boundary=")[1]
+    stream = MultipartStream(fields, files, boundary=boundary)
+
+    body = b"".join(stream)
+    assert body == prepared.body
+    assert len(stream) == len(body)
+    assert stream.content_type == prepared.headers["Content-Type"]
+
+    # read() in odd sizes gives the same bytes
+    reader = MultipartStream(fields, files, boundary=boundary)
+    assert b"".join(iter(lambda: reader.read(1000), b"")) == body
+
+
+def test_503_is_retried(server):
+    server.script("/hook", (503, {}, {"ok": False}), (503, {}, {"ok": False}))
+
+    response = send_with_retries(pooled_session(), "POST", f"{server.url}/hook",
+                                 lambda: {"data": b"payload"}, base_delay=0.01)
+
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+    assert all(request["body"] == b"payload" for request in server.requests)
+
+
+def test_retries_give_up_with_last_response(server):
+    server.script("/hook", *[(503, {}, {"ok": False})] * 3)
+
+    response = send_with_retries(pooled_session(), "POST", f"{server.url}/hook",
+                                 lambda: {"data": b""}, retries=2, base_delay=0.01)
+
+    assert response.status_code == 503
+    assert len(server.requests) == 3
+
+
+def test_webhook_resends_full_body_after_503(server, workdir):
+    song = make_file(workdir / "output", "song.wav")
+    server.script("/hook", (503, {"Retry-After": "0"}, {"ok": False}))
+
+    assert send_to_webhook(f"{server.url}/hook", [song], {"project": "musicmaker"})
+
+    first, second = server.requests
+    assert multipart_parts(first) == multipart_parts(second)
+    assert first["headers"]["Idempotency-Key"] == second["headers"]["Idempotency-Key"]
+    assert ("audio", "song.wav", song.read_bytes()) in multipart_parts(second)
+
+
+def test_telegram_429_retry_after_is_honoured(server, workdir):
+    song = make_file(workdir / "output", "song.mp3")
+    path = f"/bot{TOKEN}/sendAudio"
+    server.script(path, (429, {}, {"ok": False, "parameters": {"retry_after": 1}}))
+
+    assert send_to_telegram(TOKEN, CHAT_ID, [song], api_url=server.url, parallel=1,
+                            limiter=RateLimiter(0))
+
+    first, second = server.requests
+    assert first["path"] == second["path"] == path
+    assert second["time"] - first["time"] >= 0.95
+    assert ("audio", "song.mp3", song.read_bytes()) in multipart_parts(second)
+
+
+def test_plan_albums_groups_by_kind_and_size():
+    songs = [(Path(f"s{i}.mp3"), Path(f"s{i}.mp3")) for i in range(12)]
+    videos = [(Path(f"v{i}.mp4"), Path(f"v{i}.mp4")) for i in range(2)]
+    doc = [(Path("notes.txt"), Path("notes.txt"))]
+
+    albums = plan_albums(songs + videos + doc + songs[:1])
+
+    assert [len(album) for album in albums] == [10, 2, 2, 1, 1]
+    assert albums[0] == songs[:10]
+    assert albums[2] == videos
+
+
+def test_telegram_sends_album_as_media_group(server, workdir):
+    songs = [make_file(workdir / "output", f"song{i}.mp3") for i in range(3)]
+
+    assert send_to_telegram(TOKEN, CHAT_ID, songs, api_url=server.url, limiter=RateLimiter(0))
+
+    [request] = server.requests
+    assert request["path"] == f"/bot{TOKEN}/sendMediaGroup"
+    parts = {name: (filename, payload) for name, filename, payload in multipart_parts(request)}
+    assert parts["chat_id"][1] == CHAT_ID.encode()
+    media = json.loads(parts["media"][1])
+    assert [entry["media"] for entry in media] == ["attach://file0", "attach://file1", "attach://file2"]
+    assert {entry["type"] for entry in media} == {"audio"}
+    for i, song in enumerate(songs):
+        assert parts[f"file{i}"] == (song.name, song.read_bytes())
+
+
+def test_telegram_skips_files_the_manifest_records(server, workdir):
+    songs = [make_file(workdir / "output", f"song{i}.mp3") for i in range(2)]
+    owned_by_request(*songs)
+
+    assert send_to_telegram(TOKEN, CHAT_ID, songs, api_url=server.url, limiter=RateLimiter(0))
+    assert len(server.requests) == 1
+    assert send_to_telegram(TOKEN, CHAT_ID, songs, api_url=server.url, limiter=RateLimiter(0))
+    assert len(server.requests) == 1
+
+    # A changed file or another chat is delivered again
+    songs[0].write_bytes(b"remastered")
+    assert send_to_telegram(TOKEN, CHAT_ID, songs, api_url=server.url, limiter=RateLimiter(0))
+    assert send_to_telegram(TOKEN, "43", songs[1:], api_url=server.url, limiter=RateLimiter(0))
+    assert [request["path"].rsplit("/", 1)[1] for request in server.requests] == \
+        ["sendMediaGroup", "sendAudio", "sendAudio"]
+
+
+def test_webhook_skips_files_the_manifest_records(server, workdir):
+    song = make_file(workdir / "output", "song.wav")
+    manifest = owned_by_request(song)
+    url = f"{server.url}/hook"
+
+    assert send_to_webhook(url, [song])
+    assert send_to_webhook(url, [song])
+    assert len(server.requests) == 1
+    assert [key for key in StageManifest(manifest.request_id).data["stages"] if key.startswith("webhook:")]
+
+    assert send_to_webhook(f"{server.url}/other", [song])
+    assert send_to_webhook(url, [song], force={"webhook"})
+    assert len(server.requests) == 3
+
+
+def test_failed_delivery_is_not_recorded(server, workdir):
+    song = make_file(workdir / "output", "song.mp3")
+    owned_by_request(song)
+    path = f"/bot{TOKEN}/sendAudio"
+    server.script(path, (400, {}, {"ok": False, "description": "Bad Request"}))
+
+    assert not send_to_telegram(TOKEN, CHAT_ID, [song], api_url=server.url, limiter=RateLimiter(0))
+    assert send_to_telegram(TOKEN, CHAT_ID, [song], api_url=server.url, limiter=RateLimiter(0))
+    assert len(server.requests) == 2
@@ -0,0 +1,123 @@
+import json
+import multiprocessing
+
+import pytest
+
+from manifest import StageManifest, input_hash, parse_force_stages, pop_force_stages
+
+
+@pytest.fixture(autouse=True)
+def no_env_force(monkeypatch):
+    monkeypatch.delenv("FORCE_STAGES", raising=False)
+
+
+@pytest.fixture
+def song(tmp_path):
+    path = tmp_path / "song.wav"
+    path.write_bytes(b"RIFF song")
+    return path
+
+
+def test_done_after_record(tmp_path, song):
+    manifest = StageManifest("req_a", tmp_path / "manifests")
+    digest = input_hash(song, duration=95)
+
+    assert manifest.done("generate", digest) is None
+    entry = manifest.record("generate", digest, [song], sha256="abc")
+
+    reloaded = StageManifest("req_a", tmp_path / "manifests")
+    assert reloaded.done("generate", digest) == entry
+    assert entry["sha256"] == "abc"
+    assert reloaded.artifacts("generate") == [song]
+
+
+def test_done_needs_same_digest_and_artifacts(tmp_path, song):
+    manifest = StageManifest("req_a", tmp_path)
+    digest = input_hash(song, duration=95)
+    manifest.record("generate", digest, [song])
+
+    assert manifest.done("generate", input_hash(song, duration=120)) is None
+    song.write_bytes(b"RIFF regenerated")
+    assert manifest.done("generate", input_hash(song, duration=95)) is None
+    assert manifest.done("generate", digest) is not None
+    song.unlink()
+    assert manifest.done("generate", digest) is None
+    # The last record is still there, current or not
+    assert manifest.entry("generate")["input_hash"] == digest
+
+
+def test_item_entries_are_kept_apart(tmp_path, song):
+    manifest = StageManifest("req_a", tmp_path)
+    manifest.record("telegram", "d1", item="song.wav")
+    manifest.record("telegram", "d2", item="clip.mp4")
+
+    assert manifest.done("telegram", "d1", item="song.wav")
+    assert manifest.done("telegram", "d1", item="clip.mp4") is None
+    assert manifest.done("telegram", "d1") is None
+    assert set(json.loads(manifest.path.read_text())["stages"]) == {"telegram:song.wav", "telegram:clip.mp4"}
+
+
+def test_record_keeps_entries_of_other_writers(tmp_path):
+    first = StageManifest("req_a", tmp_path)
+    second = StageManifest("req_a", tmp_path)
+    first.record("webhook", "d1", item="url1")
+    second.record("webhook", "d2", item="url2")
+
+    stages = StageManifest("req_a", tmp_path).data["stages"]
+    assert set(stages) == {"webhook:url1", "webhook:url2"}
+
+
+def _record_many(root, worker, count):
+    manifest = StageManifest("req_a", root)
+    for i in range(count):
+        manifest.record("drive", f"d{worker}-{i}", item=f"{worker}-{i}")
+
+
+def test_record_is_safe_across_processes(tmp_path):
+    processes = [multiprocessing.Process(target=_record_many, args=(tmp_path, worker, 20)) for worker in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert len(StageManifest("req_a", tmp_path).data["stages"]) == 60
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_force_skips_done(tmp_path, song):
+    StageManifest("req_a", tmp_path).record("video", "d", [song])
+
+    assert StageManifest("req_a", tmp_path, force={"video"}).done("video", "d") is None
+    assert StageManifest("req_a", tmp_path, force={"all"}).done("video", "d") is None
+    assert StageManifest("req_a", tmp_path, force={"telegram"}).done("video", "d")
+
+
+def test_unknown_stage_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        StageManifest("req_a", tmp_path).record("mastering", "d")
+
+
+def test_owner_finds_request_by_artifact(tmp_path, song):
+    StageManifest("req_a", tmp_path).record("generate", "d", [tmp_path / "other.wav"])
+    StageManifest("req_b", tmp_path, force={"telegram"}).record("postprocess", "d", [song])
+
+    owner = StageManifest.owner(song, tmp_path, force={"webhook"})
+    assert owner.request_id == "req_b"
+    assert owner.force == {"webhook"}
+    assert StageManifest.owner(tmp_path / "unknown.wav", tmp_path) is None
+
+
+def test_parse_force_stages(monkeypatch):
+    assert parse_force_stages() == set()
+    assert parse_force_stages(["video", " telegram "]) == {"video", "telegram"}
+    monkeypatch.setenv("FORCE_STAGES", "drive, webhook,")
+    assert parse_force_stages(["all"]) == {"all", "drive", "webhook"}
+    with pytest.raises(ValueError, match="mastering"):
+        parse_force_stages(["mastering"])
+
+
+def test_pop_force_stages():
+    argv = ["request.json", "--force-stage", "video", "--keep", "--force-stage=telegram", "--force-stage"]
+
+    assert pop_force_stages(argv) == {"video", "telegram"}
+    assert argv == ["request.json", "--keep", "--force-stage"]
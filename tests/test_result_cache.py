@@ -0,0 +1,59 @@
+import result_cache
+from result_cache import ResultCache, cache_key
+
+
+def make_cache(tmp_path, commits, **kwargs):
+    return ResultCache(tmp_path / "cache", commit=lambda: commits.append(1), **kwargs)
+
+
+def test_lookups_do_not_commit(tmp_path):
+    commits = []
+    cache = make_cache(tmp_path, commits)
+    key = cache_key(song="a")
+
+    assert cache.get(key) is None
+    cache.put(key, b"audio")
+    assert len(commits) == 1
+    for _ in range(5):
+        assert cache.get(key) == b"audio"
+        assert cache.get(cache_key(song="b")) is None
+
+    assert len(commits) == 1
+    # Counters in memory are still reported, also by a new instance
+    stats = make_cache(tmp_path, []).stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (5, 6, 1)
+
+
+def test_counters_reach_the_volume_with_the_next_write(tmp_path):
+    commits = []
+    cache = make_cache(tmp_path, commits)
+    cache.get(cache_key(song="a"))
+
+    cache.put(cache_key(song="b"), b"audio")
+
+    assert cache._read_stats()["misses"] == 1
+    assert len(commits) == 1
+
+
+def test_lookups_commit_after_the_flush_interval(tmp_path, monkeypatch):
+    commits = []
+    cache = make_cache(tmp_path, commits)
+    cache.get(cache_key(song="a"))
+    assert not commits
+
+    monkeypatch.setattr(result_cache, "STATS_FLUSH_SECONDS", 0.0)
+    cache.get(cache_key(song="a"))
+
+    assert len(commits) == 1
+    assert cache._read_stats()["misses"] == 2
+
+
+def test_eviction_keeps_the_budget(tmp_path):
+    commits = []
+    cache = make_cache(tmp_path, commits, max_bytes=10)
+    cache.put(cache_key(n=1), b"123456")
+    cache.put(cache_key(n=2), b"123456")
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"]) == (1, 1)
+    assert cache.get(cache_key(n=2)) == b"123456"
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import JobScheduler, request_key
+
+
+class StubWorker:
+    """Records the order requests run in; the one named "blocker" waits for ``release``."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.order = []
+        self.running = 0
+        self.max_running = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, data):
+        with self._lock:
+            self.order.append(data["request_id"])
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            if data["request_id"] == "blocker":
+                assert self.release.wait(5)
+            if data.get("fail"):
+                raise RuntimeError(f"{data['request_id']} failed")
+            time.sleep(self.delay)
+            return f"song for {data['request_id']}"
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def request(request_id, priority="normal", project=None, **extra):
+    data = {"request_id": request_id, "lyrics": f"[verse]\n{request_id}", "priority": priority, **extra}
+    if project:
+        data["metadata"] = {"project": project}
+    return data
+
+
+def run_queued(worker, scheduler, requests):
+    """Submit ``requests`` behind a running blocker job, then let them all run."""
+    scheduler.submit(request("blocker"))
+    futures = [scheduler.submit(data) for data in requests]
+    worker.release.set()
+    scheduler.join()
+    return futures
+
+
+def test_priority_order():
+    worker = StubWorker()
+    scheduler = JobScheduler(worker, max_workers=1)
+
+    run_queued(worker, scheduler, [
+        request("bulk", "bulk"),
+        request("normal", "normal"),
+        request("preview", "preview"),
+        request("high", "high"),
+    ])
+
+    assert worker.order == ["blocker", "preview", "high", "normal", "bulk"]
+
+
+def test_projects_share_a_level_fairly():
+    worker = StubWorker()
+    scheduler = JobScheduler(worker, max_workers=1)
+
+    run_queued(worker, scheduler, [request(f"a{i}", project="a") for i in range(4)] +
+               [request(f"b{i}", project="b") for i in range(2)])
+
+    # "blocker" counted for the default project; a and b then alternate
+    assert worker.order == ["blocker", "a0", "b0", "a1", "b1", "a2", "a3"]
+
+
+def test_identical_requests_share_one_future():
+    worker = StubWorker()
+    scheduler = JobScheduler(worker, max_workers=1)
+
+    first, second, other = run_queued(worker, scheduler, [
+        request("song", "bulk"),
+        request("song", "preview"),
+        request("other", "high"),
+    ])
+
+    assert first is second
+    assert first.result() == "song for song"
+    assert worker.order == ["blocker", "song", "other"]  # promoted to preview
+    assert scheduler.stats["coalesced"] == 1
+    assert scheduler.stats["completed"] == 3
+    assert request_key(request("x", "bulk")) == request_key(request("x", "preview"))
+
+
+def test_finished_requests_run_again():
+    worker = StubWorker()
+    worker.release.set()
+    scheduler = JobScheduler(worker, max_workers=1)
+
+    scheduler.submit(request("song")).result(5)
+    scheduler.submit(request("song")).result(5)
+
+    assert worker.order == ["song", "song"]
+
+
+def test_max_workers_cap():
+    worker = StubWorker(delay=0.05)
+    scheduler = JobScheduler(worker, max_workers=2)
+
+    futures = [scheduler.submit(request(f"song{i}")) for i in range(8)]
+    scheduler.join()
+
+    assert all(future.result() for future in futures)
+    assert worker.max_running == 2
+    assert scheduler.pending() == 0
+
+
+def test_failures_reach_the_future():
+    worker = StubWorker()
+    worker.release.set()
+    scheduler = JobScheduler(worker, max_workers=1)
+
+    future = scheduler.submit(request("bad", fail=True))
+
+    with pytest.raises(RuntimeError, match="bad failed"):
+        future.result(5)
+    scheduler.join()
+    assert scheduler.stats["failed"] == 1
+
+
+def test_max_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        JobScheduler(StubWorker(), max_workers=0)
@@ -0,0 +1,231 @@
+import io
+import wave
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from yue_engine import (
+    ResidentYuEEngine,
+    SamplingParams,
+    Stage1Output,
+    TransformersYuEBackend,
+    YuEBackend,
+    _run_isolated,
+    split_lyrics,
+)
+
+LYRICS = "[verse]\nfirst line\nsecond line\n[chorus]\nsing it\n[outro]\nbye"
+# Codec frames the stub produces per lyric segment (xcodec runs at 50 frames/s)
+SEGMENT_FRAMES = 25
+
+
+class StubBackend(YuEBackend):
+    """CPU stand-in for the models: records calls, returns shaped dummy ids."""
+
+    sample_rate = 8000
+
+    def __init__(self, failing_genres=()):
+        self.loads = 0
+        self.calls = []
+        self.failing_genres = set(failing_genres)
+
+    def load(self):
+        self.loads += 1
+
+    def _tokens(self, genre, segments, params):
+        if genre in self.failing_genres:
+            raise RuntimeError(f"stage 1 broke on {genre}")
+        frames = SEGMENT_FRAMES * params.segment_count(len(segments))
+        return Stage1Output(vocals=np.full((1, frames), 1), instrumentals=np.full((1, frames), 2))
+
+    def stage1(self, genre, segments, params):
+        self.calls.append(("stage1", genre, segments))
+        return self._tokens(genre, segments, params)
+
+    def stage1_batch(self, genres, segments_list, params_list):
+        self.calls.append(("stage1_batch", list(genres)))
+        return [self._tokens(*item) for item in zip(genres, segments_list, params_list)]
+
+    def stage1_segments(self, genre, segments, params):
+        for i in range(params.segment_count(len(segments))):
+            self.calls.append(("stage1_segment", i))
+            yield self._tokens(genre, segments[i:i + 1], params)
+
+    def stage2(self, codes, params):
+        self.calls.append(("stage2", int(codes[0, 0])))
+        return np.repeat(codes, 8, axis=0)
+
+    def stage2_batch(self, codes_list, params):
+        self.calls.append(("stage2_batch", len(codes_list), params.stage2_batch_size))
+        return [np.repeat(codes, 8, axis=0) for codes in codes_list]
+
+    def decode(self, vocals, instrumentals):
+        self.calls.append(("decode", vocals.shape[1]))
+        return np.zeros((2, vocals.shape[1] * self.sample_rate // 50))
+
+
+def wav_frames(audio: bytes) -> int:
+    with wave.open(io.BytesIO(audio), "rb") as f:
+        return f.getnframes()
+
+
+def test_models_load_once():
+    backend = StubBackend()
+    engine = ResidentYuEEngine(backend)
+    params = SamplingParams(run_n_segments=3)
+
+    assert backend.loads == 0
+    engine.load()
+    engine.generate(LYRICS, "rock", params)
+    engine.generate(LYRICS, "jazz", params)
+    list(engine.generate_stream(LYRICS, "rock", params))
+    engine.generate_batch([(LYRICS, "rock", params)])
+
+    assert backend.loads == 1
+
+
+def test_generate_runs_stage1_then_stage2_then_decode():
+    backend = StubBackend()
+    audio = ResidentYuEEngine(backend).generate(LYRICS, "rock", SamplingParams(run_n_segments=3))
+
+    assert [call[0] for call in backend.calls] == ["stage1", "stage2", "stage2", "decode"]
+    # Vocals (id 1) go through stage 2 before instrumentals (id 2)
+    assert [call[1] for call in backend.calls[1:3]] == [1, 2]
+    assert wav_frames(audio) == 3 * SEGMENT_FRAMES * backend.sample_rate // 50
+
+
+def test_split_lyrics_into_sections():
+    assert split_lyrics(LYRICS) == [
+        "[verse]\nfirst line\nsecond line\n\n",
+        "[chorus]\nsing it\n\n",
+        "[outro]\nbye\n\n",
+    ]
+    assert split_lyrics("no sections here") == []
+
+
+def test_engine_passes_sections_and_caps_segment_count():
+    backend = StubBackend()
+    engine = ResidentYuEEngine(backend)
+
+    stage1 = engine.generate_stage1(LYRICS, "rock", SamplingParams(run_n_segments=2))
+
+    assert backend.calls[0] == ("stage1", "rock", split_lyrics(LYRICS))
+    assert stage1.vocals.shape == (1, 2 * SEGMENT_FRAMES)
+    with pytest.raises(ValueError):
+        engine.generate_stage1("no sections here", "rock", SamplingParams())
+
+
+def test_stream_yields_one_wav_per_segment():
+    backend = StubBackend()
+    seen = []
+
+    parts = list(ResidentYuEEngine(backend).generate_stream(
+        LYRICS, "rock", SamplingParams(run_n_segments=3), on_stage1=seen.append,
+    ))
+
+    assert len(parts) == 3
+    assert all(wav_frames(part) == SEGMENT_FRAMES * backend.sample_rate // 50 for part in parts)
+    # Each segment is rendered before stage 1 moves on to the next one
+    assert [call[0] for call in backend.calls[:5]] == ["stage1_segment", "stage2", "stage2", "decode", "stage1_segment"]
+    [whole] = seen
+    assert whole.vocals.shape == (1, 3 * SEGMENT_FRAMES)
+
+
+def test_run_isolated_retries_items_alone_after_batch_failure():
+    def batch(items):
+        if "bad" in items:
+            raise RuntimeError("batch failed")
+        return [item.upper() for item in items]
+
+    def single(item):
+        if item == "bad":
+            raise RuntimeError("bad item")
+        return item.upper()
+
+    assert _run_isolated(batch, single, ["a", "b"]) == ["A", "B"]
+    results = _run_isolated(batch, single, ["a", "bad", "c"])
+    assert results[0] == "A" and results[2] == "C"
+    assert isinstance(results[1], RuntimeError) and str(results[1]) == "bad item"
+
+    # A failed batch of one is not retried
+    calls = []
+    [error] = _run_isolated(batch, lambda item: calls.append(item), ["bad"])
+    assert isinstance(error, RuntimeError) and not calls
+
+
+def test_batch_isolates_failing_items():
+    backend = StubBackend(failing_genres={"broken"})
+    params = SamplingParams(run_n_segments=2)
+
+    results = ResidentYuEEngine(backend).generate_batch([
+        (LYRICS, "rock", params),
+        (LYRICS, "broken", params),
+        ("no sections", "rock", params),
+        (LYRICS, "jazz", params),
+    ])
+
+    assert "audio" in results[0] and "audio" in results[3]
+    assert results[1]["error"].startswith("Stage 1 failed")
+    assert "no [section]" in results[2]["error"]
+    # The failed batch is retried item by item; stage 2 then runs once for both good songs
+    assert [call[0] for call in backend.calls[:4]] == ["stage1_batch", "stage1", "stage1", "stage1"]
+    assert ("stage2_batch", 4, 4) in backend.calls
+
+
+def test_batch_runs_stage2_per_settings_group():
+    backend = StubBackend()
+
+    results = ResidentYuEEngine(backend).generate_batch([
+        (LYRICS, "rock", SamplingParams(run_n_segments=2, stage2_batch_size=4)),
+        (LYRICS, "jazz", SamplingParams(run_n_segments=2, stage2_batch_size=1)),
+        (LYRICS, "pop", SamplingParams(run_n_segments=3, stage2_batch_size=4, top_p=0.5)),
+    ])
+
+    assert all("audio" in result for result in results)
+    assert [call for call in backend.calls if call[0] == "stage2_batch"] == [
+        ("stage2_batch", 4, 4),
+        ("stage2_batch", 2, 1),
+    ]
+    assert wav_frames(results[2]["audio"]) == 3 * SEGMENT_FRAMES * backend.sample_rate // 50
+
+
+def _transformers_backend():
+    backend = TransformersYuEBackend.__new__(TransformersYuEBackend)
+    backend.mmtokenizer = SimpleNamespace(soa=900, eoa=901)
+    backend.codectool = SimpleNamespace(ids2npy=lambda ids: np.asarray(ids)[np.newaxis, :])
+    return backend
+
+
+def test_stage1_batch_samples_each_settings_group_separately():
+    backend = _transformers_backend()
+    backend._segment_prompt = lambda genre, segments, i: [i]
+    calls = []
+
+    def generate(inputs, limits, guidance_scale, params):
+        calls.append((len(inputs), params.top_p, params.temperature))
+        return [[900, 10, 20, 901] for _ in inputs]
+
+    backend._generate_stage1 = generate
+    params = [SamplingParams(run_n_segments=1), SamplingParams(run_n_segments=1, temperature=0.7),
+              SamplingParams(run_n_segments=1)]
+
+    outputs = backend.stage1_batch(["rock", "jazz", "pop"], [["[verse]\na"]] * 3, params)
+
+    assert calls == [(2, 0.93, 1.0), (1, 0.93, 0.7)]
+    assert [output.vocals.tolist() for output in outputs] == [[[10]]] * 3
+
+
+def test_split_tracks_deinterleaves_segments():
+    backend = _transformers_backend()
+    ids = np.array([7, 900, 10, 20, 11, 21, 901, 8, 900, 12, 22, 901])
+
+    output = backend._split_tracks(ids)
+
+    assert output.vocals.tolist() == [[10, 11, 12]]
+    assert output.instrumentals.tolist() == [[20, 21, 22]]
+
+
+def test_split_tracks_without_audio_segment_raises():
+    with pytest.raises(ValueError, match="no audio segment"):
+        _transformers_backend()._split_tracks(np.array([7, 8, 9]))